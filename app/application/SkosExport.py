@@ -1,11 +1,19 @@
+import logging
+import sys
+
 from graph.MultiThreadExport import to_skos_export
-from graph.skos_graph import SkosGraph, RelationSearchIndex
+from graph.instrumentation import RunReport, start_report, stage
+from graph.skos_graph import SkosGraph
 from graph.skos_graph_utils import load_graph_from_file
 
-print("Loading graph...")
-graph: SkosGraph = load_graph_from_file("generated.graph")
+REPORT_PATH = "export_report.json"
+
+logging.basicConfig(level=logging.INFO, format='%(name)18s: %(message)s', stream=sys.stderr)
+report: RunReport = start_report("export", trace_memory="--trace-memory" in sys.argv)
+with stage("loading", unit="nodes") as current:
+    graph: SkosGraph = load_graph_from_file("generated.graph")
+    current.count(len(graph.nodes))
 
-print("Creating rdf skos string")
-relation_search_index: RelationSearchIndex = RelationSearchIndex(graph)
-to_skos_export(graph, relation_search_index, "example")
-print("Done...")
\ No newline at end of file
+with stage("export"):
+    to_skos_export(graph, "example")
+report.write(REPORT_PATH)
@@ -1,23 +1,25 @@
 import json
+import os
 from typing import Optional, List
 
 from flask import Flask, request
 from flask_cors import CORS
 
 from application.order_utils import order_by_status
-from graph.skos_graph import SkosGraph, RelationSearchIndex, NodeSearchIndex, SkosNode, SCHEMA_PREF_LABEL, \
-    SCHEMA_TAXON_STATUS
-from graph.skos_graph_utils import load_graph_from_file, search_node_start_with, \
-    search_rec, get_hierarchy_upwards_from, order_by_name_length
+from graph.skos_graph import RelationSearchIndex, NodeSearchIndex, SkosNode, descriptor_retriever
+from graph.frozen_skos_graph import FrozenSkosGraph
+from graph.skos_graph_utils import load_frozen_graph_from_file, search_node_start_with, order_by_name_length, \
+    search_node_by_name_key
+
+# the graph and its indexes are memory mapped, worker processes started on one host share them
+GRAPH_FILE: str = os.environ.get("SKOS_GRAPH_FILE", "generated.graph")
+PORT: int = int(os.environ.get("SKOS_PORT", "1234"))
 
 print("Loading graph...")
-graph: SkosGraph = load_graph_from_file("generated.graph")
-print("Building relation indexes...")
+graph: FrozenSkosGraph = load_frozen_graph_from_file(GRAPH_FILE, use_mmap=True)
 relation_search_index: RelationSearchIndex = RelationSearchIndex(graph)
-print("Building pref label node indexes...")
 pref_label_node_search_index: NodeSearchIndex = NodeSearchIndex(graph)
-print("Building descriptor node indexes...")
-descriptor_node_search_index: NodeSearchIndex = NodeSearchIndex(graph, lambda x: x.descriptor)
+descriptor_node_search_index: NodeSearchIndex = NodeSearchIndex(graph, descriptor_retriever)
 
 app = Flask(__name__)
 CORS(app)
@@ -26,11 +28,23 @@ CORS(app)
 @app.route("/search", methods=['GET'])
 def get_search():
     search_term = request.args.get('term', type=str)
-    result = search_node_start_with(graph, search_term.lower(), max_result_count=50)
+    if request.args.get('fuzzy', default=0, type=int) == 1:
+        # typo tolerant, ranked by the edit distance to the search term instead of the name length
+        rsp = {
+            "result": graph.get_nodes_similar_to(search_term, max_result_count=25)
+        }
+        return json.dumps(rsp, default=lambda o: o.to_dict())
+    if request.args.get('normalized', default=0, type=int) == 1:
+        # exact match of the normalized names, e.g. "Mentha x piperita L." finds "Mentha ×piperita"
+        rsp = {
+            "result": order_by_name_length(search_node_by_name_key(graph, search_term, max_result_count=25))
+        }
+        return json.dumps(rsp, default=lambda o: o.to_dict())
+    result = search_node_start_with(graph, search_term.lower(), max_result_count=25)
     rsp = {
         "result": order_by_name_length(result)[:25]
     }
-    return json.dumps(rsp, default=lambda o: o.__dict__)
+    return json.dumps(rsp, default=lambda o: o.to_dict())
 
 
 @app.route("/related", methods=['GET'])
@@ -38,37 +52,21 @@ def get_related():
     descriptor = request.args.get('descriptor', type=str)
     depth = request.args.get('depth', type=int)
 
-    node: Optional[SkosNode] = descriptor_node_search_index.get_nodes_for_key(descriptor)[0]
+    node: Optional[SkosNode] = graph.get_node_by_descriptor(descriptor)
     if node is None:
         rsp = {
             "result": [],
             "hierarchy": []
         }
-        return json.dumps(rsp, default=lambda o: o.__dict__)
-    synonym_descriptors: List[str] = []
-    search_rec(relation_search_index, node.descriptor, depth, synonym_descriptors)
-    result = descriptor_node_search_index.get_all_nodes_for_keys(list(dict.fromkeys(synonym_descriptors)))
+        return json.dumps(rsp, default=lambda o: o.to_dict())
+    # one lookup in the precomputed synonym cluster of the node, filtered by hop distance
+    synonym_descriptors: List[str] = relation_search_index.get_related_descriptors(node.descriptor, depth)
+    result = descriptor_node_search_index.get_all_nodes_for_keys(synonym_descriptors)
     rsp = {
         "result": order_by_status(result),
         "hierarchy": []
     }
-    return json.dumps(rsp, default=lambda o: o.__dict__)
-
-
-def filter_duplicates(hierarchy_unfiltered: List[SkosNode]):
-    if len(hierarchy_unfiltered) == 0:
-        return []
-    filtered_hierarchy: List[SkosNode] = []
-    node: SkosNode
-    last_node: SkosNode = hierarchy_unfiltered[0]
-
-    for node in hierarchy_unfiltered:
-        if last_node.get_attribute_by_schema(SCHEMA_PREF_LABEL).literal != node.get_attribute_by_schema(SCHEMA_PREF_LABEL).literal \
-                and node.get_attribute_by_schema(SCHEMA_TAXON_STATUS) != "sub_species":
-            filtered_hierarchy.append(node)
-        last_node = node
-
-    return filtered_hierarchy
+    return json.dumps(rsp, default=lambda o: o.to_dict())
 
 
 @app.route("/hierarchy", methods=['GET'])
@@ -78,11 +76,12 @@ def get_hierarchy():
         rsp = {
             "result": []
         }
-        return json.dumps(rsp, default=lambda o: o.__dict__)
-    hierarchy_unfiltered = get_hierarchy_upwards_from(descriptor, relation_search_index, descriptor_node_search_index)
+        return json.dumps(rsp, default=lambda o: o.to_dict())
+    # one walk along the precomputed, already de-duplicated parent pointers
     rsp = {
-        "result": filter_duplicates(hierarchy_unfiltered)
+        "result": graph.get_hierarchy(descriptor)
     }
-    return json.dumps(rsp, default=lambda o: o.__dict__)
+    return json.dumps(rsp, default=lambda o: o.to_dict())
 
-app.run(port=1234, host="0.0.0.0")
+if __name__ == '__main__':
+    app.run(port=PORT, host="0.0.0.0")
@@ -1,17 +1,57 @@
+import argparse
+import logging
+import sys
+
+from graph.incremental_merge import merge_graph_files_incremental
+from graph.instrumentation import RunReport, start_report, stage
+from graph.merge_store import MergeStore, merge_graph_files, DEFAULT_MEMORY_BUDGET_MIB
 from graph.skos_graph import SkosGraph
 from graph.skos_graph_utils import save_graph_to_file, load_graph_from_file, merge_graphs
 
+REPORT_PATH = "merge_report.json"
+SOURCE_PATHS = ["itis.graph", "tpl.graph", "wfo.graph"]
+TARGET_PATH = "generated.graph"
+
 if __name__ == '__main__':
-    print("Loading itis data...")
-    graph_itis: SkosGraph = load_graph_from_file("itis.graph")
-    print("Loading tpl data...")
-    graph_tpl: SkosGraph = load_graph_from_file("tpl.graph")
-    print("Loading wfo data...")
-    graph_wfo: SkosGraph = load_graph_from_file("wfo.graph")
-    print("Loading merging data...")
-    graph: SkosGraph = merge_graphs(graph_itis, graph_tpl, graph_wfo)
-    print("Saving graph")
-    save_graph_to_file(graph, "generated.graph")
+    argument_parser = argparse.ArgumentParser(description="Merges the graph files of the parsers to " + TARGET_PATH)
+    argument_parser.add_argument("--out-of-core", action="store_true",
+                                 help="stage the sources in a SQLite file instead of memory, the index file is then "
+                                      "built by the web application on first start")
+    argument_parser.add_argument("--memory-mib", type=int, default=DEFAULT_MEMORY_BUDGET_MIB,
+                                 help="memory budget of the out-of-core merge in MiB")
+    argument_parser.add_argument("--incremental", action="store_true",
+                                 help="keep one partition per source next to the target and only rebuild the ones of "
+                                      "changed sources, the index file is then built by the web application")
+    argument_parser.add_argument("--trace-memory", action="store_true",
+                                 help="record the top allocators of every stage with tracemalloc (slow)")
+    arguments = argument_parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(name)18s: %(message)s', stream=sys.stderr)
+    report: RunReport = start_report("merge", trace_memory=arguments.trace_memory)
+    if arguments.incremental:
+        rebuilt = merge_graph_files_incremental(SOURCE_PATHS, TARGET_PATH)
+        report.write(REPORT_PATH)
+        print("Rebuilt partitions: " + (", ".join(rebuilt) if len(rebuilt) > 0 else "none, " + TARGET_PATH
+                                        + " is up to date"))
+        sys.exit(0)
+    if arguments.out_of_core:
+        store: MergeStore = merge_graph_files(SOURCE_PATHS, TARGET_PATH, memory_budget_mib=arguments.memory_mib)
+        report.write(REPORT_PATH)
+        print("Stats:")
+        print("  -> GENERATED")
+        print("     Node Count: " + str(store.node_count))
+        print("     Relation Count: " + str(store.relation_count + store.synonym_count))
+        print("  -> Newly added relations: " + str(store.synonym_count))
+        sys.exit(0)
+
+    with stage("loading", unit="nodes") as current:
+        graph_itis, graph_tpl, graph_wfo = [load_graph_from_file(x) for x in SOURCE_PATHS]
+        current.count(len(graph_itis.nodes) + len(graph_tpl.nodes) + len(graph_wfo.nodes))
+    with stage("merging", unit="nodes") as current:
+        graph: SkosGraph = merge_graphs([graph_itis, graph_tpl, graph_wfo])
+        current.count(len(graph.nodes))
+    with stage("saving", len(graph.nodes), "nodes"):
+        save_graph_to_file(graph, TARGET_PATH, with_indexes=True)
+    report.write(REPORT_PATH)
 
     l_itis_nodes = len(graph_itis.nodes)
     l_itis_relations = len(graph_itis.relations)
@@ -11,7 +11,7 @@ def order_by_status(nodes: List[SkosNode]) -> List[SkosNode]:
     status_mapping: defaultdict = defaultdict(lambda: [])
     node: SkosNode
     for node in nodes:
-        status: Optional[str] = node.get_attribute_by_schema(SCHEMA_TAXON_STATUS).literal
+        status: Optional[str] = node.get_literal_by_schema(SCHEMA_TAXON_STATUS)
         if status is None or status not in simple_order:
             status_mapping[default_mapping_key].append(node)
         else:
@@ -0,0 +1,48 @@
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+from benchmark_memory import build_synthetic_graph
+from graph.graph_file import write_graph_file, read_graph_file, read_pickle_graph_file, open_graph_file
+from graph.skos_graph import SkosGraph
+
+# Compares the load time of the pickled graph format with the binary graph format,
+# either for a pickled graph file given as first argument or a synthetic graph
+#
+#   cd app && python benchmark_graph_load.py [generated.graph]
+
+
+def timed(func):
+    start = time.time()
+    result = func()
+    return result, time.time() - start
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        graph: SkosGraph = read_pickle_graph_file(sys.argv[1])
+    else:
+        graph: SkosGraph = build_synthetic_graph()
+    with tempfile.TemporaryDirectory() as directory:
+        pickle_path = os.path.join(directory, "pickle.graph")
+        binary_path = os.path.join(directory, "binary.graph")
+        with open(pickle_path, "wb") as f:
+            f.write(pickle.dumps(graph))
+        write_graph_file(graph, binary_path)
+        del graph
+
+        _, pickle_time = timed(lambda: read_pickle_graph_file(pickle_path))
+        _, frozen_time = timed(lambda: read_graph_file(binary_path))
+        _, thawed_time = timed(lambda: read_graph_file(binary_path).to_skos_graph())
+        _, index_time = timed(lambda: open_graph_file(binary_path))
+        _, mapped_time = timed(lambda: open_graph_file(binary_path))
+
+        print("Pickle file: " + "{:.1f}".format(os.path.getsize(pickle_path) / 1024 / 1024) + " MiB")
+        print("Binary file: " + "{:.1f}".format(os.path.getsize(binary_path) / 1024 / 1024) + " MiB")
+        print("Load pickle as SkosGraph: " + "{:.2f}".format(pickle_time) + "s")
+        print("Load binary as FrozenSkosGraph: " + "{:.2f}".format(frozen_time) + "s")
+        print("Load binary as SkosGraph: " + "{:.2f}".format(thawed_time) + "s")
+        print("Open binary memory mapped, building the index file: " + "{:.2f}".format(index_time) + "s")
+        print("Open binary memory mapped with index file: " + "{:.3f}".format(mapped_time) + "s")
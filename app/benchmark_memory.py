@@ -0,0 +1,58 @@
+import sys
+import time
+import tracemalloc
+
+from graph.skos_graph import SkosGraph, SkosAttribute, SCHEMA_TAXON_STATUS, SCHEMA_AUTHOR, SCHEMA_HISTORY_NOTE
+from graph.skos_graph_utils import load_graph_from_file
+
+# Measures the memory held by a graph, either loaded from a graph file given as first argument
+# or a synthetic graph shaped like a parser output (families -> genera -> species, one synonym per species)
+#
+#   cd app && python benchmark_memory.py [generated.graph]
+
+_SYNTHETIC_SPECIES = 200000
+_SPECIES_PER_GENUS = 20
+_GENERA_PER_FAMILY = 25
+
+
+def build_synthetic_graph(species_count: int = _SYNTHETIC_SPECIES) -> SkosGraph:
+    graph: SkosGraph = SkosGraph("synthetic")
+    graph.add_kingdom_node("k-0", "Plantae", [SkosAttribute(SCHEMA_TAXON_STATUS, "Accepted"),
+                                               SkosAttribute(SCHEMA_AUTHOR, "")])
+    for s in range(0, species_count):
+        g = s // _SPECIES_PER_GENUS
+        f = g // _GENERA_PER_FAMILY
+        if s % (_SPECIES_PER_GENUS * _GENERA_PER_FAMILY) == 0:
+            graph.add_family_node(str("f-" + str(f)), "Family" + str(f) + "aceae",
+                                  [SkosAttribute(SCHEMA_TAXON_STATUS, "Accepted"), SkosAttribute(SCHEMA_AUTHOR, "")])
+            graph.add_family_to_kingdom(str("f-" + str(f)), str("k-0"))
+        if s % _SPECIES_PER_GENUS == 0:
+            graph.add_genus_node(str("g-" + str(g)), "Genus" + str(g),
+                                 [SkosAttribute(SCHEMA_TAXON_STATUS, "Accepted"), SkosAttribute(SCHEMA_AUTHOR, "")])
+            graph.add_genus_to_family(str("g-" + str(g)), str("f-" + str(f)))
+        graph.add_species_node(str("s-" + str(s)), "Genus" + str(g) + " epithet" + str(s),
+                               [SkosAttribute(SCHEMA_TAXON_STATUS, "Accepted"), SkosAttribute(SCHEMA_AUTHOR, "L.")])
+        graph.add_species_to_genus(str("s-" + str(s)), str("g-" + str(g)))
+        graph.add_species_node(str("y-" + str(s)), "Genus" + str(g) + " synonym" + str(s),
+                               [SkosAttribute(SCHEMA_TAXON_STATUS, "Synonym"), SkosAttribute(SCHEMA_AUTHOR, "Mill.")])
+        graph.add_synonym_relation(str("y-" + str(s)), str("s-" + str(s)))
+    for node in graph.nodes:
+        node.add_attribute(SCHEMA_HISTORY_NOTE, "wfo")
+    return graph
+
+
+if __name__ == '__main__':
+    tracemalloc.start()
+    start = time.time()
+    if len(sys.argv) > 1:
+        graph: SkosGraph = load_graph_from_file(sys.argv[1])
+    else:
+        graph: SkosGraph = build_synthetic_graph()
+    duration = time.time() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("Nodes: " + str(len(graph.nodes)))
+    print("Relations: " + str(len(graph.relations)))
+    print("Build/load time: " + "{:.1f}".format(duration) + "s")
+    print("Memory held by graph: " + "{:.1f}".format(current / 1024 / 1024) + " MiB")
+    print("Peak memory: " + "{:.1f}".format(peak / 1024 / 1024) + " MiB")
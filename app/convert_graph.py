@@ -0,0 +1,17 @@
+import sys
+
+from graph.graph_file import convert_pickle_graph_file, is_graph_file
+
+# Converts graph files pickled by former versions into the binary graph format
+#
+#   cd app && python convert_graph.py application/generated.graph [application/generated.binary.graph]
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python convert_graph.py <pickled graph file> [target file]")
+        sys.exit(1)
+    if is_graph_file(sys.argv[1]):
+        print(sys.argv[1] + " already is a binary graph file")
+        sys.exit(0)
+    convert_pickle_graph_file(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print("Converted " + sys.argv[1])
@@ -0,0 +1,203 @@
+import hashlib
+import logging
+import os
+import struct
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from dwca_parser.dwca_reader import CoreReader, CORE_COLUMNS
+from graph.graph_file import GraphFileWriter, GraphFileReader
+
+DEFAULT_CACHE_DIRECTORY: str = "./taxa/.cache/"
+DEFAULT_MAX_CACHE_BYTES: int = 4 << 30
+SNAPSHOT_SUFFIX: str = ".snapshot"
+# version of the snapshot content, snapshots of another version (or other columns) are rebuilt
+SNAPSHOT_VERSION: int = 1
+# strings of a column are stored joined by this separator, split in one call when loading
+_SEPARATOR: str = "\0"
+
+log = logging.getLogger("Archive-Cache")
+
+
+def get_archive_hash(archive_path: str) -> str:
+    archive_hash = hashlib.blake2b(digest_size=16)
+    with open(archive_path, "rb") as f:
+        chunk: bytes = f.read(1 << 20)
+        while len(chunk) > 0:
+            archive_hash.update(chunk)
+            chunk = f.read(1 << 20)
+    return archive_hash.hexdigest()
+
+
+class ArchiveCache:
+    """
+    Binary columnar snapshots of the core tables read by CoreReader, one file per archive named by the hash of the
+    archive content, so a changed archive is never served from an old snapshot. Categorical columns are stored as
+    codes and categories, string columns as one utf-8 buffer and a missing mask, both in the graph file layout.
+    Loading takes a few bulk reads instead of tokenizing the archive. Least recently used snapshots are deleted
+    once the directory exceeds max_bytes
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIRECTORY, max_bytes: int = DEFAULT_MAX_CACHE_BYTES,
+                 columns: List[str] = CORE_COLUMNS):
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.columns: List[str] = columns
+
+    def read(self, archive_path: str) -> DataFrame:
+        """
+        The core table of the archive, from its snapshot if there is a valid one, otherwise read from the archive
+        and stored as snapshot
+        """
+        snapshot_path: str = self.get_snapshot_path(archive_path)
+        dataframe: Optional[DataFrame] = None
+        try:
+            dataframe = self.__load(snapshot_path)
+        except (ValueError, KeyError, OSError, struct.error) as e:
+            log.warning("Ignoring broken snapshot " + snapshot_path + ": " + str(e))
+        if dataframe is not None:
+            log.info("Loaded snapshot of " + archive_path)
+            return dataframe
+        dataframe = CoreReader(archive_path, self.columns).read()
+        if self.__store(dataframe, snapshot_path):
+            self.__evict(snapshot_path)
+        return dataframe
+
+    def get_snapshot_path(self, archive_path: str) -> str:
+        return os.path.join(self.directory, get_archive_hash(archive_path) + SNAPSHOT_SUFFIX)
+
+    def invalidate(self, archive_path: str):
+        if os.path.exists(self.get_snapshot_path(archive_path)):
+            os.remove(self.get_snapshot_path(archive_path))
+
+    def clear(self):
+        path: str
+        for path in self.__get_snapshot_paths():
+            _remove(path)
+
+    def __load(self, snapshot_path: str) -> Optional[DataFrame]:
+        if not os.path.exists(snapshot_path):
+            return None
+        reader: GraphFileReader = GraphFileReader(snapshot_path)
+        try:
+            header: dict = reader.header
+            if header.get("content") != "snapshot" or header.get("snapshot_version") != SNAPSHOT_VERSION \
+                    or header.get("read_columns") != self.columns:
+                return None
+            rows: int = header["rows"]
+            columns: dict = {}
+            column: dict
+            for column in header["column_types"]:
+                name: str = column["name"]
+                if column["categorical"]:
+                    columns[name] = pd.Categorical.from_codes(
+                        reader.read_array(name + ".codes"), _split(reader.read_bytes(name + ".categories")))
+                else:
+                    values: np.ndarray = np.array(_split(reader.read_bytes(name + ".data")), dtype=object)
+                    if len(values) != rows:
+                        return None
+                    values[reader.read_array(name + ".missing").astype(bool)] = np.nan
+                    columns[name] = pd.Series(values, dtype=column["dtype"])
+        finally:
+            reader.close()
+        # touched, the least recently used snapshots are evicted first
+        _touch(snapshot_path)
+        return DataFrame(columns)
+
+    def __store(self, dataframe: DataFrame, snapshot_path: str) -> bool:
+        os.makedirs(self.directory, exist_ok=True)
+        # written under a name of this process and renamed, so parallel parsers never read a partial snapshot
+        temporary_path: str = snapshot_path + "." + str(os.getpid())
+        writer: GraphFileWriter = GraphFileWriter(temporary_path)
+        column_types: List[dict] = []
+        name: str
+        for name in dataframe.columns:
+            series: pd.Series = dataframe[name]
+            categorical: bool = isinstance(series.dtype, pd.CategoricalDtype)
+            if categorical:
+                categories: List[str] = [str(x) for x in series.cat.categories.tolist()]
+                writer.write_array(name + ".codes", series.cat.codes.to_numpy())
+                if not _write_joined(writer, name + ".categories", categories):
+                    return _abort(writer, temporary_path)
+            else:
+                missing: np.ndarray = series.isna().to_numpy()
+                values: List[str] = ["" if x else str(y) for x, y in zip(missing.tolist(), series.tolist())]
+                writer.write_array(name + ".missing", missing.astype(np.uint8))
+                if not _write_joined(writer, name + ".data", values):
+                    return _abort(writer, temporary_path)
+            column_types.append({"name": name, "categorical": categorical, "dtype": str(series.dtype)})
+        writer.close({"content": "snapshot", "snapshot_version": SNAPSHOT_VERSION, "rows": len(dataframe),
+                      "read_columns": self.columns, "column_types": column_types})
+        os.replace(temporary_path, snapshot_path)
+        return True
+
+    def __evict(self, keep_path: str):
+        paths: List[str] = sorted(self.__get_snapshot_paths(), key=_get_mtime, reverse=True)
+        total: int = 0
+        path: str
+        for path in paths:
+            size: int = _get_size(path)
+            if total + size > self.max_bytes and path != keep_path:
+                log.info("Evict snapshot " + path)
+                _remove(path)
+            else:
+                total += size
+
+    def __get_snapshot_paths(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return [os.path.join(self.directory, x) for x in os.listdir(self.directory) if x.endswith(SNAPSHOT_SUFFIX)]
+
+
+def _write_joined(writer: GraphFileWriter, name: str, values: List[str]) -> bool:
+    """
+    Writes the values joined by the separator, False if a value contains it and the column can not be stored
+    """
+    text: str = _SEPARATOR.join(values)
+    if text.count(_SEPARATOR) != max(len(values) - 1, 0):
+        return False
+    # one more separator, so an empty column and a column of one empty string differ
+    writer.write_bytes(name, (text + _SEPARATOR).encode("utf-8"))
+    return True
+
+
+def _split(data: bytes) -> List[str]:
+    return data.decode("utf-8").split(_SEPARATOR)[:-1]
+
+
+def _abort(writer: GraphFileWriter, temporary_path: str) -> bool:
+    writer.file.close()
+    _remove(temporary_path)
+    return False
+
+
+def _touch(path: str):
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def _get_mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0
+
+
+def _get_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def _remove(path: str):
+    # another parser process may have evicted it already
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,154 @@
+import csv
+import zipfile
+from typing import List, Dict, Iterator, Optional
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from dwca_parser.dwca_fields import *
+
+META_FILE_NAME: str = "meta.xml"
+# the columns used by the parsers, all other columns of the core file are skipped by the tokenizer
+CORE_COLUMNS: List[str] = [FIELD_ID, FIELD_PARENT_NAME_USAGE_ID, FIELD_ACCEPTED_NAME_USAGE_ID, FIELD_SCIENTIFIC_NAME,
+                           FIELD_SCIENTIFIC_NAME_AUTHORSHIP, FIELD_TAXON_RANK, FIELD_TAXONOMIC_STATUS, FIELD_KINGDOM,
+                           FIELD_FAMILY, FIELD_GENUS, FIELD_SPECIFIC_EPHITHET]
+# few distinct values repeated over millions of rows, every value is stored once per column
+CATEGORICAL_COLUMNS: List[str] = [FIELD_TAXON_RANK, FIELD_TAXONOMIC_STATUS, FIELD_KINGDOM, FIELD_FAMILY, FIELD_GENUS]
+DEFAULT_BATCH_ROWS: int = 100000
+
+
+class CoreDescriptor:
+    """
+    The core data file of a Darwin Core Archive as described by its meta.xml: location, format and the column
+    index (or the default value) of every field by its short term name, the id column is named "id"
+    """
+
+    def __init__(self, location: str, delimiter: str, quote_char: str, ignore_header_lines: int, encoding: str,
+                 indexes: Dict[str, int], defaults: Dict[str, str]):
+        self.location: str = location
+        self.delimiter: str = delimiter
+        self.quote_char: str = quote_char
+        self.ignore_header_lines: int = ignore_header_lines
+        self.encoding: str = encoding
+        self.indexes: Dict[str, int] = indexes
+        self.defaults: Dict[str, str] = defaults
+
+    @staticmethod
+    def from_meta(meta: bytes) -> 'CoreDescriptor':
+        core: Optional[ElementTree.Element] = _find_child(ElementTree.fromstring(meta), "core")
+        if core is None:
+            raise ValueError("meta.xml without core")
+        indexes: Dict[str, int] = {}
+        defaults: Dict[str, str] = {}
+        element: ElementTree.Element
+        for element in core:
+            tag: str = _local_name(element.tag)
+            if tag == "id":
+                indexes[FIELD_ID] = int(element.get("index"))
+            elif tag == "field":
+                name: str = _local_name(element.get("term"))
+                if element.get("index") is not None:
+                    indexes.setdefault(name, int(element.get("index")))
+                elif element.get("default") is not None:
+                    defaults[name] = element.get("default")
+        return CoreDescriptor(_find_child(_find_child(core, "files"), "location").text.strip(),
+                              _unescape(core.get("fieldsTerminatedBy", ",")),
+                              _unescape(core.get("fieldsEnclosedBy", '"')),
+                              int(core.get("ignoreHeaderLines", "0")),
+                              core.get("encoding", "utf-8"), indexes, defaults)
+
+
+class CoreReader:
+    """
+    Streams the core data file of a Darwin Core Archive out of the zip in batches of batch_rows rows. Only the
+    given columns are read, the ones of CATEGORICAL_COLUMNS as categoricals and all others as strings, so every
+    batch has the same dtypes. iter_batches holds one batch at a time, read the table of the given columns (which
+    the parsers need as a whole) and one batch
+    """
+
+    def __init__(self, archive_path: str, columns: List[str] = CORE_COLUMNS, batch_rows: int = DEFAULT_BATCH_ROWS):
+        self.archive_path: str = archive_path
+        self.columns: List[str] = columns
+        self.batch_rows: int = batch_rows
+        with zipfile.ZipFile(archive_path) as archive:
+            self.descriptor: CoreDescriptor = CoreDescriptor.from_meta(archive.read(META_FILE_NAME))
+
+    def iter_batches(self) -> Iterator[DataFrame]:
+        descriptor: CoreDescriptor = self.descriptor
+        name_of: Dict[int, str] = {index: name for name, index in descriptor.indexes.items() if name in self.columns}
+        names: List[str] = [x for x in self.columns if x in descriptor.indexes or x in descriptor.defaults]
+        with zipfile.ZipFile(self.archive_path) as archive, archive.open(descriptor.location) as file:
+            with pd.read_csv(file, sep=descriptor.delimiter, header=None, skiprows=descriptor.ignore_header_lines,
+                             encoding=descriptor.encoding, usecols=sorted(name_of.keys()),
+                             dtype={index: "category" if name in CATEGORICAL_COLUMNS else str
+                                    for index, name in name_of.items()},
+                             quotechar=descriptor.quote_char or '"',
+                             quoting=csv.QUOTE_MINIMAL if descriptor.quote_char else csv.QUOTE_NONE,
+                             chunksize=self.batch_rows) as batches:
+                batch: DataFrame
+                for batch in batches:
+                    batch = batch.rename(columns=name_of)
+                    name: str
+                    for name in names:
+                        if name not in batch.columns:
+                            batch[name] = pd.Series(descriptor.defaults[name], index=batch.index,
+                                                    dtype="category" if name in CATEGORICAL_COLUMNS else str)
+                    yield batch[names]
+
+    def read(self) -> DataFrame:
+        """
+        All batches as one DataFrame. The parsers resolve parents across the whole source, so they get the whole
+        table of the given columns, but every batch is appended to the columns as it arrives and dropped, so beside
+        the table only one batch is held. The categories of the batches are unified instead of falling back to
+        strings, in the order of their first occurrence
+        """
+        names: Optional[List[str]] = None
+        # per column the arrays of the batches, string columns as object arrays sharing the strings of the batch
+        pieces: Dict[str, List[np.ndarray]] = {}
+        categories: Dict[str, Dict[str, int]] = {}
+        batch: DataFrame
+        for batch in self.iter_batches():
+            if names is None:
+                names = list(batch.columns)
+            name: str
+            for name in names:
+                column: pd.Series = batch[name]
+                if isinstance(column.dtype, pd.CategoricalDtype):
+                    code_of: Dict[str, int] = categories.setdefault(name, {})
+                    # missing values have the code -1, the last entry of the map
+                    code_map: np.ndarray = np.array([code_of.setdefault(x, len(code_of))
+                                                     for x in column.cat.categories.tolist()] + [-1], dtype=np.int32)
+                    pieces.setdefault(name, []).append(code_map[column.cat.codes.to_numpy()])
+                else:
+                    pieces.setdefault(name, []).append(column.to_numpy(dtype=object))
+        if names is None:
+            return DataFrame()
+        columns: Dict[str, object] = {}
+        for name in names:
+            values: np.ndarray = np.concatenate(pieces.pop(name))
+            columns[name] = pd.Categorical.from_codes(values, list(categories[name])) if name in categories \
+                else values
+        return DataFrame(columns)
+
+
+def read_core(archive_path: str) -> DataFrame:
+    return CoreReader(archive_path).read()
+
+
+def _find_child(element: ElementTree.Element, name: str) -> Optional[ElementTree.Element]:
+    child: ElementTree.Element
+    for child in element:
+        if _local_name(child.tag) == name:
+            return child
+    return None
+
+
+def _local_name(name: str) -> str:
+    # namespaced tags look like {namespace}core, terms like http://rs.tdwg.org/dwc/terms/taxonRank
+    return name.rsplit("}", 1)[-1].rsplit("/", 1)[-1].rsplit("#", 1)[-1]
+
+
+def _unescape(value: str) -> str:
+    return value.encode("utf-8").decode("unicode_escape")
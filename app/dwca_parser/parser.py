@@ -1,15 +1,20 @@
 import asyncio
 import logging
 import sys
-from concurrent.futures import ThreadPoolExecutor
-from typing import List
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import List, Dict, Tuple, Union, Optional
 
-from dwca.read import DwCAReader
 from pandas import DataFrame
 
+from dwca_parser.archive_cache import ArchiveCache
+from dwca_parser.dwca_reader import read_core
+from dwca_parser.parser_base import ParserBase
 from dwca_parser.parser_itis import ParserITIS
 from dwca_parser.parser_tpl import ParserTPL
 from dwca_parser.parser_wfo import ParserWFO
+from graph.frozen_skos_graph import FrozenSkosGraph
+from graph.instrumentation import RunReport, Stage, start_report, stage
 from graph.skos_graph import SkosGraph
 from graph.skos_graph_utils import save_graph_to_file
 
@@ -18,6 +23,54 @@ NAME_TPL = "tpl.graph"
 NAME_WFO = "wfo.graph"
 NAME_ITIS = "itis.graph"
 
+# the largest source first, so it does not wait for a free worker
+PARSERS = {
+    NAME_WFO: ParserWFO,
+    NAME_TPL: ParserTPL,
+    NAME_ITIS: ParserITIS
+}
+# one worker process per source
+DEFAULT_WORKERS = len(PARSERS)
+
+
+def _init_logging(log_format: str):
+    logging.basicConfig(
+        level=logging.INFO,
+        format=log_format,
+        stream=sys.stderr,
+    )
+
+
+def _read_archive(archive_path: str, cache: Optional[ArchiveCache], stage_name: str = "read") -> DataFrame:
+    current: Stage
+    with stage(stage_name, unit="rows") as current:
+        dataframe: DataFrame = read_core(archive_path) if cache is None else cache.read(archive_path)
+        current.count(len(dataframe))
+    return dataframe
+
+
+def _save_graph(graph: Union[SkosGraph, FrozenSkosGraph], stage_name: str = "save"):
+    with stage(stage_name, len(graph.nodes), "nodes"):
+        save_graph_to_file(graph, graph.name)
+
+
+def _parse_source(name: str, archive_path: str, partition_workers: int = 0, cache: Optional[ArchiveCache] = None,
+                  trace_memory: bool = False) -> Tuple[str, float, int, int, List[dict]]:
+    """
+    Parses one source inside a worker process. The archive is read by the worker (from its snapshot in the cache,
+    if any) and the graph is written to its binary graph file right here, so only the name, the wall time, the
+    graph size and the stages of the run report of the worker are sent back to the parent.
+    With partition_workers > 0 the families of the source are parsed by a pool of that many processes in turn
+    """
+    report: RunReport = start_report(name, trace_memory)
+    start: float = time.perf_counter()
+    with stage(name):
+        dataframe: DataFrame = _read_archive(archive_path, cache)
+        graph: Union[SkosGraph, FrozenSkosGraph] = PARSERS[name](dataframe, name).process(partition_workers)
+        _save_graph(graph)
+    return name, time.perf_counter() - start, len(graph.nodes), len(graph.relations), report.stages
+
+
 class Parser(object):
     PATH = "./taxa/"
     FILE_NAMES = {
@@ -27,40 +80,90 @@ class Parser(object):
     }
     dataframes: dict[str, DataFrame] = {}
     graphes: dict[str, SkosGraph] = {}
+    wall_times: Dict[str, float]
+    cache: Optional[ArchiveCache]
+    report: RunReport
 
-    def __init__(self, target_kingdoms=None, **additional_file_paths) -> None:
+    def __init__(self, target_kingdoms=None, workers: int = DEFAULT_WORKERS, partition_workers: int = 0,
+                 cache: Optional[ArchiveCache] = None, report_path: Optional[str] = None, trace_memory: bool = False,
+                 **additional_file_paths) -> None:
+        """
+        With workers > 0 every source is parsed in a process of a pool of that many processes,
+        with workers == 0 all sources are loaded upfront and parsed by threads of this process.
+        partition_workers > 0 additionally splits each source by family across a pool of that many processes
+        (see ParserBase.process). With a cache the archives are read from their snapshots once these exist.
+        The stages of every source are collected in report and written as json to report_path, if given
+        """
         for key, value in additional_file_paths.items():
             self.FILE_NAMES[key] = value
-        self.__load_dwca()
-        self.__create_skos_graphs(target_kingdoms)
+        self.wall_times = {}
+        self.cache = cache
+        self.report = start_report("parse", trace_memory)
+        start: float = time.perf_counter()
+        if workers > 0:
+            self.__create_skos_graphs_in_processes(workers, partition_workers, trace_memory)
+        else:
+            self.__load_dwca()
+            self.__create_skos_graphs(target_kingdoms, partition_workers)
+        self.__log_wall_times(time.perf_counter() - start)
+        if report_path is not None:
+            self.report.write(report_path)
 
     def __load_dwca(self) -> None:
         for key, filename in self.FILE_NAMES.items():
-            dwca_file: DwCAReader = DwCAReader(self.PATH + filename)
-            self.dataframes[key] = dwca_file.pd_read(dwca_file.descriptor.core.file_location)
-
-    def __create_skos_graphs(self, target_kingdoms):
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(threadName)10s %(name)18s: %(message)s',
-            stream=sys.stderr,
-        )
+            self.dataframes[key] = _read_archive(self.PATH + filename, self.cache, key + "/read")
+
+    def __create_skos_graphs(self, target_kingdoms, partition_workers: int):
+        _init_logging('%(threadName)10s %(name)18s: %(message)s')
         executor = ThreadPoolExecutor(max_workers=3)
         event_loop = asyncio.get_event_loop()
         try:
-            res: List[SkosGraph] = event_loop.run_until_complete(self.__run_async_parses(executor))
+            res: List[SkosGraph] = event_loop.run_until_complete(self.__run_async_parses(executor, partition_workers))
             for graph in res:
-                save_graph_to_file(graph, graph.name)
+                _save_graph(graph, graph.name + "/save")
         finally:
             event_loop.close()
 
-    async def __run_async_parses(self, executor):
+    async def __run_async_parses(self, executor, partition_workers: int):
         loop = asyncio.get_event_loop()
         tasks = [
-            loop.run_in_executor(executor, ParserTPL(self.dataframes[NAME_TPL], NAME_TPL).process),
-            loop.run_in_executor(executor, ParserITIS(self.dataframes[NAME_ITIS], NAME_ITIS).process),
-            loop.run_in_executor(executor, ParserWFO(self.dataframes[NAME_WFO], NAME_WFO).process)
+            loop.run_in_executor(executor, self.__timed_process, ParserTPL(self.dataframes[NAME_TPL], NAME_TPL),
+                                 partition_workers),
+            loop.run_in_executor(executor, self.__timed_process, ParserITIS(self.dataframes[NAME_ITIS], NAME_ITIS),
+                                 partition_workers),
+            loop.run_in_executor(executor, self.__timed_process, ParserWFO(self.dataframes[NAME_WFO], NAME_WFO),
+                                 partition_workers)
         ]
         completed, pending = await asyncio.wait(tasks)
         results = [t.result() for t in completed]
         return results
+
+    def __timed_process(self, parser: ParserBase, partition_workers: int) -> Union[SkosGraph, FrozenSkosGraph]:
+        start: float = time.perf_counter()
+        graph: Union[SkosGraph, FrozenSkosGraph]
+        with stage(parser.graph.name):
+            graph = parser.process(partition_workers)
+        self.wall_times[graph.name] = time.perf_counter() - start
+        return graph
+
+    def __create_skos_graphs_in_processes(self, workers: int, partition_workers: int, trace_memory: bool):
+        log_format: str = '%(processName)10s %(name)18s: %(message)s'
+        _init_logging(log_format)
+        stages: Dict[str, List[dict]] = {}
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_logging, initargs=(log_format,)) as executor:
+            futures = [executor.submit(_parse_source, name, self.PATH + self.FILE_NAMES[name], partition_workers,
+                                       self.cache, trace_memory)
+                       for name in PARSERS.keys()]
+            for future in as_completed(futures):
+                name, wall_time, node_count, relation_count, stages[name] = future.result()
+                self.wall_times[name] = wall_time
+                logging.info("Parsed %s: %d nodes, %d relations", name, node_count, relation_count)
+        # in the order of PARSERS instead of the order of completion, so reports of two runs can be diffed
+        for name in PARSERS.keys():
+            self.report.add_stages(stages[name])
+
+    def __log_wall_times(self, total: float):
+        name: str
+        for name, wall_time in sorted(self.wall_times.items(), key=lambda x: -x[1]):
+            logging.info("%s: %.1fs", name, wall_time)
+        logging.info("All sources: %.1fs", total)
@@ -1,92 +1,232 @@
+import threading
 from abc import abstractmethod
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import List, Dict, Tuple, Union, Optional
 
+import numpy as np
 from pandas import DataFrame
 
 from dwca_parser.dwca_fields import *
-from graph.skos_graph import SkosGraph, SkosAttribute, SCHEMA_TAXON_STATUS, SCHEMA_AUTHOR
+from graph.frozen_skos_graph import FrozenSkosGraph
+from graph.instrumentation import stage, Stage
+from graph.skos_graph import SkosGraph, SCHEMA_BROADER, SCHEMA_SYNONYM, CONCEPT_FAMILY, CONCEPT_SUB_FAMILY, \
+    CONCEPT_GENUS, CONCEPT_SPECIES, CONCEPT_SUB_SPECIES
 
 _DEFAULT_KINGDOM = "PLANTAE"
+# FIELD_SUB_GENUS equals FIELD_GENUS, so its synonyms have always been genus nodes
+_CONCEPT_OF_SEARCH_LEVEL = {
+    FIELD_FAMILY: CONCEPT_FAMILY,
+    FIELD_SUB_FAMILY: CONCEPT_SUB_FAMILY,
+    FIELD_GENUS: CONCEPT_GENUS,
+    FIELD_SPECIES: CONCEPT_SPECIES,
+    FIELD_SUB_SPECIES: CONCEPT_SUB_SPECIES
+}
+# the rows are split into this many partitions of whole families whatever the number of workers, so the partitions
+# and with them the concatenated graph do not depend on the worker count
+PARTITION_COUNT: int = 16
+
+
+def _parse_partition(parser_class: type, name: str, rows: DataFrame, state, families: list) -> FrozenSkosGraph:
+    """
+    Parses one partition of families inside a worker process, its sub-graph is sent back in columnar form
+    """
+    parser: ParserBase = parser_class(rows, name)
+    parser._parse_partition(state, families)
+    return FrozenSkosGraph.from_skos_graph(parser.graph)
+
+
+class GeneratedIdAllocator:
+    """
+    Allocates the numbers of generated ids in O(1), consecutively in the order of the calls, so a parse numbers its
+    taxa reproducibly. Allocation is locked for threads sharing an allocator. For other processes, reserve hands out
+    an allocator over the next block of numbers: blocks never overlap and their numbers do not depend on the order
+    in which the processes run
+    """
+
+    def __init__(self, start: int = 0, end: Optional[int] = None):
+        self.__next: int = start
+        self.__end: Optional[int] = end
+        self.__lock: threading.Lock = threading.Lock()
+
+    def allocate(self, count: int = 1) -> range:
+        with self.__lock:
+            start: int = self.__next
+            if self.__end is not None and start + count > self.__end:
+                raise ValueError("Generated id block " + str(start) + "-" + str(self.__end) + " exhausted")
+            self.__next = start + count
+        return range(start, start + count)
+
+    def reserve(self, count: int) -> 'GeneratedIdAllocator':
+        numbers: range = self.allocate(count)
+        return GeneratedIdAllocator(numbers.start, numbers.stop)
+
+    def __getstate__(self) -> dict:
+        # the lock guards the threads of one process only
+        with self.__lock:
+            return {"next": self.__next, "end": self.__end}
+
+    def __setstate__(self, state: dict):
+        self.__init__(state["next"], state["end"])
 
 
 class ParserBase(object):
     dataframe: DataFrame
     target_kingdoms: List[str]
     graph: SkosGraph
+    generated_ids: GeneratedIdAllocator
     GENERATED_ID_PREFIX: str
 
     def __init__(self, dataframe: DataFrame, name: str, target_kingdoms=None) -> None:
         self.dataframe = dataframe
         self.graph = SkosGraph(name)
+        # all generated ids of a parse are allocated by _parse_upper_ranks, so partitions never allocate
+        self.generated_ids = GeneratedIdAllocator()
         if target_kingdoms is None:
             self.target_kingdoms = [_DEFAULT_KINGDOM]
 
-    def process(self) -> SkosGraph:
-        return self._parse()
+    def process(self, workers: int = 0) -> Union[SkosGraph, FrozenSkosGraph]:
+        """
+        With workers > 0 the ranks above the partitioned rows are parsed by this process, the rest in PARTITION_COUNT
+        partitions of whole families by a pool of that many processes. The sub-graphs are concatenated in partition
+        order to one FrozenSkosGraph. The parse and its steps are recorded as stages of the run report
+        """
+        current: Stage
+        with stage("parse", len(self.dataframe), "rows") as current:
+            graph: Union[SkosGraph, FrozenSkosGraph] = self._parse() if workers <= 0 \
+                else self.__parse_partitions(workers)
+            current.add_count("nodes", len(graph.nodes))
+            current.add_count("relations", len(graph.relations))
+        return graph
 
     @abstractmethod
     def _parse(self) -> SkosGraph:
         raise NotImplementedError
 
-    def _add_family_to_graph(self, curr_row, kingdom_id, taxon_status="", author=""):
-        if taxon_status == "":
-            self.graph.add_family_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME])
-        else:
-            self.graph.add_family_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME],
-                                       [SkosAttribute(SCHEMA_TAXON_STATUS, taxon_status),
-                                        SkosAttribute(SCHEMA_AUTHOR, author)])
-        self.graph.add_family_to_kingdom(str(curr_row[FIELD_ID]), str(kingdom_id))
-
-    def _add_sub_family_to_graph(self, curr_row, parent_id, taxon_status="", author=""):
-        if taxon_status == "":
-            self.graph.add_sub_family_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME])
-        else:
-            self.graph.add_sub_family_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME],
-                                           [SkosAttribute(SCHEMA_TAXON_STATUS, taxon_status),
-                                            SkosAttribute(SCHEMA_AUTHOR, author)])
-        self.graph.add_family_to_kingdom(str(curr_row[FIELD_ID]), str(parent_id))
-
-    def _add_genus_to_graph(self, curr_row, parent_id, parent_search_level, taxon_status="", author=""):
-        if taxon_status == "":
-            self.graph.add_genus_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME])
-        else:
-            self.graph.add_genus_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME],
-                                      [SkosAttribute(SCHEMA_TAXON_STATUS, taxon_status),
-                                       SkosAttribute(SCHEMA_AUTHOR, author)])
-        if parent_search_level == FIELD_FAMILY:
-            self.graph.add_genus_to_family(str(curr_row[FIELD_ID]), str(parent_id))
-        else:
-            self.graph.add_genus_to_sub_family(str(curr_row[FIELD_ID]), str(parent_id))
+    @abstractmethod
+    def _parse_upper_ranks(self):
+        """
+        Adds the nodes above the partitioned rows to the graph and returns the state all partitions need, e.g. the
+        ids of the genera. It is sent to the worker processes, so it has to be picklable
+        """
+        raise NotImplementedError
 
-    def _add_sub_genus_to_graph(self, curr_row, parent_id, taxon_status="", author=""):
-        if taxon_status == "":
-            self.graph.add_sub_genus_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME])
-        else:
-            self.graph.add_sub_genus_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME],
-                                          [SkosAttribute(SCHEMA_TAXON_STATUS, taxon_status),
-                                           SkosAttribute(SCHEMA_AUTHOR, author)])
-        self.graph.add_sub_genus_to_genus(str(curr_row[FIELD_ID]), str(parent_id))
-
-    def _add_species_to_graph(self, curr_row, parent_id, parent_search_level=FIELD_GENUS, taxon_status="", author=""):
-        if taxon_status == "":
-            self.graph.add_species_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME])
-        else:
-            self.graph.add_species_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME],
-                                        [SkosAttribute(SCHEMA_TAXON_STATUS, taxon_status),
-                                         SkosAttribute(SCHEMA_AUTHOR, author)])
-        if parent_search_level == FIELD_GENUS:
-            self.graph.add_species_to_genus(str(curr_row[FIELD_ID]), str(parent_id))
-        else:
-            self.graph.add_genus_to_sub_family(str(curr_row[FIELD_ID]), str(parent_id))
+    @abstractmethod
+    def _parse_partition(self, state, families: list):
+        """
+        Adds the nodes and relations of self.dataframe, the rows of the families with the given keys
+        """
+        raise NotImplementedError
 
-    def _add_sub_species_to_graph(self, curr_row, parent_id, taxon_status="", author=""):
-        if taxon_status == "":
-            self.graph.add_sub_species_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME])
-        else:
-            self.graph.add_sub_species_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME],
-                                            [SkosAttribute(SCHEMA_TAXON_STATUS, taxon_status),
-                                             SkosAttribute(SCHEMA_AUTHOR, author)])
-        self.graph.add_sub_species_to_species(str(curr_row[FIELD_ID]), str(parent_id))
+    def _get_family_positions(self, state) -> List[Tuple[object, np.ndarray]]:
+        """
+        Key and row positions of each family in the order of the families, by default the rows grouped by their
+        family column with the rows without a family as one more group
+        """
+        return list(self.dataframe.groupby(FIELD_FAMILY, sort=False, dropna=False, observed=True).indices.items())
+
+    def __parse_partitions(self, workers: int) -> FrozenSkosGraph:
+        current: Stage
+        with stage("upper ranks", unit="nodes") as current:
+            state = self._parse_upper_ranks()
+            current.count(len(self.graph.nodes))
+        partitions: List[Tuple[DataFrame, list]] = self.__split_families(self._get_family_positions(state))
+        sub_graphs: List[FrozenSkosGraph] = []
+        with stage("partitions", sum(len(x[0]) for x in partitions), "rows") as current, \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            sub_graph: FrozenSkosGraph
+            for sub_graph in executor.map(_parse_partition, repeat(type(self)), repeat(self.graph.name),
+                                          [x[0] for x in partitions], repeat(state), [x[1] for x in partitions]):
+                sub_graphs.append(sub_graph)
+                current.progress(sum(len(x[0]) for x in partitions[:len(sub_graphs)]), current.items)
+        with stage("concatenate", unit="nodes") as current:
+            graph: FrozenSkosGraph = FrozenSkosGraph.concatenate(
+                self.graph.name, [FrozenSkosGraph.from_skos_graph(self.graph)] + sub_graphs)
+            current.count(len(graph.nodes))
+        return graph
+
+    def __split_families(self, families: List[Tuple[object, np.ndarray]]) -> List[Tuple[DataFrame, list]]:
+        """
+        Splits the families into PARTITION_COUNT runs of about the same number of rows, each partition keeps the
+        rows in the order of the dataframe
+        """
+        sizes: np.ndarray = np.array([len(x[1]) for x in families], dtype=np.int64)
+        partition_of: np.ndarray = ((np.cumsum(sizes) - sizes) * PARTITION_COUNT) // max(int(sizes.sum()), 1)
+        partitions: List[Tuple[DataFrame, list]] = []
+        partition: int
+        for partition in range(0, PARTITION_COUNT):
+            selected: List[int] = np.nonzero(partition_of == partition)[0].tolist()
+            if len(selected) == 0:
+                continue
+            positions: np.ndarray = np.unique(np.concatenate([families[x][1] for x in selected]))
+            partitions.append((self.dataframe.iloc[positions], [families[x][0] for x in selected]))
+        return partitions
+
+    def _add_rows_to_graph(self, rows: DataFrame, parent_ids, concept) -> int:
+        """
+        Adds the rows as nodes of the concept (one for all rows or one per row) below the parent ids (one per row) in
+        one bulk call. A node gets the taxon status and author of its row, rows without a taxon status get neither
+        attribute
+        """
+        descriptors: List[str] = rows[FIELD_ID].astype(str).tolist()
+        taxon_statuses: list = rows[FIELD_TAXONOMIC_STATUS].tolist()
+        authors: list = [None if status == "" else author for status, author in
+                         zip(taxon_statuses, self._get_author_strs(rows[FIELD_SCIENTIFIC_NAME_AUTHORSHIP]))]
+        taxon_statuses = [None if x == "" else x for x in taxon_statuses]
+        self.graph.add_nodes_bulk(descriptors, rows[FIELD_SCIENTIFIC_NAME], concept, taxon_statuses, authors)
+        return self.graph.add_edges_bulk(descriptors, [str(x) for x in parent_ids], SCHEMA_BROADER)
+
+    def _add_synonyms_to_graph(self, synonyms: DataFrame, accepted_ids, concept: str) -> int:
+        """
+        Adds the synonym rows as nodes of the concept with their relations to the accepted ids in one bulk call
+        """
+        descriptors: List[str] = synonyms[FIELD_ID].astype(str).tolist()
+        self.graph.add_nodes_bulk(descriptors, synonyms[FIELD_SCIENTIFIC_NAME], concept,
+                                  synonyms[FIELD_TAXONOMIC_STATUS],
+                                  self._get_author_strs(synonyms[FIELD_SCIENTIFIC_NAME_AUTHORSHIP]))
+        return self.graph.add_edges_bulk(descriptors, accepted_ids, SCHEMA_SYNONYM)
+
+    def _get_sub_species_parents_by_name(self, sub_species: DataFrame, accepted: DataFrame) -> Dict[str, str]:
+        """
+        Ids of the accepted rows named genus + " " + specificEpithet of the sub species rows, resolved with one name
+        to id map instead of filtering the whole dataframe per row. Only the names of the sub species are kept, so
+        the map is small enough to be sent to the partitions
+        """
+        ids_by_name: Dict[str, dict] = self._get_first_rows_by_name(accepted, [FIELD_ID])
+        return {name: str(ids_by_name[name][FIELD_ID]) for name in set(self.__get_parent_names(sub_species))
+                if name in ids_by_name}
+
+    def _get_sub_species_parent_ids(self, sub_species: DataFrame, parents_by_name: Dict[str, str]) -> List[str]:
+        """
+        The parent id of each sub species row ("" if there is none)
+        """
+        parent_ids: List[str] = []
+        for parent_name in self.__get_parent_names(sub_species):
+            parent_id: str = parents_by_name.get(parent_name)
+            if parent_id is None:
+                self.log.warning("Parent not found: " + str(parent_name))
+                parent_ids.append("")
+            else:
+                parent_ids.append(parent_id)
+        return parent_ids
+
+    @staticmethod
+    def __get_parent_names(sub_species: DataFrame) -> list:
+        # as objects, categorical columns do not support +
+        return (sub_species[FIELD_GENUS].astype(object) + " "
+                + sub_species[FIELD_SPECIFIC_EPHITHET].astype(object)).tolist()
+
+    @staticmethod
+    def _get_first_rows_by_name(rows: DataFrame, columns: List[str]) -> Dict[str, dict]:
+        """
+        The given columns of the first row per scientificName, for lookups by name in O(1)
+        """
+        first: DataFrame = rows.dropna(subset=[FIELD_SCIENTIFIC_NAME]).drop_duplicates(subset=FIELD_SCIENTIFIC_NAME)
+        return dict(zip(first[FIELD_SCIENTIFIC_NAME].tolist(), first[columns].to_dict("records")))
+
+    @staticmethod
+    def _get_concept_of_search_level(search_level: str) -> str:
+        return _CONCEPT_OF_SEARCH_LEVEL[search_level]
 
     @staticmethod
     def _get_next_search_levels(curr_search_level: str) -> List[str]:
@@ -111,3 +251,6 @@ class ParserBase(object):
         if not str(author_field) == "nan":
             author = author_field
         return author
+
+    def _get_author_strs(self, author_column) -> List[str]:
+        return [self._get_author_str(x) for x in author_column.tolist()]
@@ -1,5 +1,7 @@
 import logging
+from typing import List, Dict, Optional, Tuple
 
+import numpy as np
 from pandas import DataFrame
 
 from dwca_parser.dwca_fields import *
@@ -9,13 +11,58 @@ from graph.skos_graph import SkosGraph, SkosAttribute, SCHEMA_TAXON_STATUS, SCHE
 
 class ParserITIS(ParserBase):
     log: logging
+    __child_positions: Optional[Dict[object, List[int]]]
+    __ranks: List[str]
+    __ids: list
+    __found_positions: List[int]
+    __found_parent_ids: list
+    __found_levels: List[str]
 
     def __init__(self, dataframe: DataFrame, name: str, target_kingdoms=None):
         super().__init__(dataframe, name, target_kingdoms)
         self.log = logging.getLogger("Parser-ITIS")
+        self.__child_positions = None
+        self.__found_positions = []
+        self.__found_parent_ids = []
+        self.__found_levels = []
 
     def _parse(self) -> SkosGraph:
         self.log.info("Start parsing")
+        self.__find_families(True)
+        self.__add_found_nodes()
+        self.__add_synonyms()
+        self.log.info("Parsing finished")
+        return self.graph
+
+    def _parse_upper_ranks(self):
+        self.__find_families(False)
+        self.__add_found_nodes()
+        self.__add_synonyms()
+
+    def _get_family_positions(self, state) -> List[Tuple[object, np.ndarray]]:
+        """
+        A family is the subtree below a family found by _parse_upper_ranks together with the synonyms of its rows
+        """
+        synonym_positions: dict = self.__get_synonym_positions()
+        families: List[Tuple[object, np.ndarray]] = []
+        family_position: int
+        for family_position in (x for x, level in zip(self.__found_positions, self.__found_levels)
+                                if level == FIELD_FAMILY):
+            positions: List[int] = self.__get_subtree_positions(family_position)
+            synonyms: List[np.ndarray] = [synonym_positions[x] for x in (str(self.__ids[x]) for x in positions)
+                                          if x in synonym_positions]
+            families.append((self.__ids[family_position], np.concatenate([np.array(positions)] + synonyms)))
+        return families
+
+    def _parse_partition(self, state, families: list):
+        self.__index_rows()
+        for family_id in families:
+            for search_level in self._get_next_search_levels(FIELD_FAMILY):
+                self.__find_sub_nodes(family_id, family_id, search_level, FIELD_FAMILY)
+        self.__add_found_nodes()
+        self.__add_synonyms()
+
+    def __find_families(self, descend: bool):
         kingdoms: DataFrame = self.dataframe.loc[
             self.dataframe[FIELD_TAXON_RANK].map(str.upper).isin([FIELD_KINGDOM.upper()])
         ]
@@ -24,78 +71,86 @@ class ParserITIS(ParserBase):
                 self.graph.add_kingdom_node(str(row[FIELD_ID]), row[FIELD_SCIENTIFIC_NAME],
                                             [SkosAttribute(SCHEMA_TAXON_STATUS, row[FIELD_TAXONOMIC_STATUS]),
                                              SkosAttribute(SCHEMA_AUTHOR, "")])
-                self.__find_sub_nodes(row[FIELD_ID], row[FIELD_ID], FIELD_FAMILY, FIELD_FAMILY)
-        self.log.info("Parsing finished")
-        return self.graph
+                if self.__child_positions is None:
+                    self.__index_rows()
+                self.__find_sub_nodes(row[FIELD_ID], row[FIELD_ID], FIELD_FAMILY, FIELD_FAMILY, descend)
 
     def __find_sub_nodes(self,
                          parent_id,
                          top_parent_id,
                          curr_search_level,
-                         parent_search_level):
-        self.log.info("Parse level: " + curr_search_level)
-        childs: DataFrame = self.dataframe[self.dataframe[FIELD_PARENT_NAME_USAGE_ID] == parent_id]
-        for index, row in childs.iterrows():
-            if row[FIELD_TAXON_RANK].lower() == curr_search_level:
-                self.__add_node_to_skos_graph(row, top_parent_id, curr_search_level, parent_search_level)
-                self.__find_synonyms(row[FIELD_ID], curr_search_level)
-                for search_level in self._get_next_search_levels(curr_search_level):
-                    self.__find_sub_nodes(row[FIELD_ID], row[FIELD_ID], search_level,
-                                          curr_search_level)
+                         parent_search_level,
+                         descend: bool = True):
+        # explicit stack instead of recursion, the tasks are popped in the order of the former recursive walk:
+        # a search expands to one task per child row, a matching row is collected and pushes its sub searches
+        # (unless descend is False)
+        stack: List[tuple] = [(parent_id, top_parent_id, curr_search_level, parent_search_level, -1)]
+        while len(stack) > 0:
+            parent_id, top_parent_id, curr_search_level, parent_search_level, position = stack.pop()
+            if position < 0:
+                self.log.debug("Parse level: " + curr_search_level)
+                stack.extend((parent_id, top_parent_id, curr_search_level, parent_search_level, x)
+                             for x in reversed(self.__child_positions.get(parent_id, [])))
+                continue
+            row_id = self.__ids[position]
+            if self.__ranks[position] == curr_search_level:
+                self.__found_positions.append(position)
+                self.__found_parent_ids.append(top_parent_id)
+                self.__found_levels.append(curr_search_level)
+                if descend:
+                    stack.extend((row_id, row_id, x, curr_search_level, -1)
+                                 for x in reversed(self._get_next_search_levels(curr_search_level)))
             else:
-                self.__find_sub_nodes(row[FIELD_ID], top_parent_id, curr_search_level,
-                                      parent_search_level)
-
-    def __add_node_to_skos_graph(self,
-                                 curr_row,
-                                 top_parent_id,
-                                 curr_search_level,
-                                 parent_search_level):
-        author = super()._get_author_str(curr_row[FIELD_SCIENTIFIC_NAME_AUTHORSHIP])
-        if curr_search_level == FIELD_FAMILY:
-            self._add_family_to_graph(curr_row, top_parent_id, curr_row[FIELD_TAXONOMIC_STATUS], author)
-        elif curr_search_level == FIELD_SUB_FAMILY:
-            self._add_sub_family_to_graph(curr_row, top_parent_id, curr_row[FIELD_TAXONOMIC_STATUS], author)
-        elif curr_search_level == FIELD_GENUS:
-            self._add_genus_to_graph(curr_row, top_parent_id, parent_search_level, curr_row[FIELD_TAXONOMIC_STATUS], author)
-        elif curr_search_level == FIELD_SUB_GENUS:
-            self._add_sub_genus_to_graph(curr_row, top_parent_id, curr_row[FIELD_TAXONOMIC_STATUS], author)
-        elif curr_search_level == FIELD_SPECIES:
-            self._add_species_to_graph(curr_row, top_parent_id, parent_search_level, curr_row[FIELD_TAXONOMIC_STATUS], author)
-        elif curr_search_level == FIELD_SUB_SPECIES:
-            self._add_sub_species_to_graph(curr_row, top_parent_id, curr_row[FIELD_TAXONOMIC_STATUS], author)
-
-    def __find_synonyms(self, accepted_name_usage_id, curr_search_level):
-        synonyms: DataFrame = self.dataframe[self.dataframe[FIELD_ACCEPTED_NAME_USAGE_ID] == str(accepted_name_usage_id)]
-        for index, row in synonyms.iterrows():
-            self.__add_synonym_to_graph(row, accepted_name_usage_id, curr_search_level)
-
-    def __add_synonym_to_graph(self, curr_row, parent_id, curr_search_level):
-        author = super()._get_author_str(curr_row[FIELD_SCIENTIFIC_NAME_AUTHORSHIP])
-        if curr_search_level == FIELD_FAMILY:
-            self.graph.add_family_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME],
-                                       [SkosAttribute(SCHEMA_TAXON_STATUS, curr_row[FIELD_TAXONOMIC_STATUS]),
-                                        SkosAttribute(SCHEMA_AUTHOR, author)])
-        elif curr_search_level == FIELD_SUB_FAMILY:
-            self.graph.add_sub_family_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME],
-                                           [SkosAttribute(SCHEMA_TAXON_STATUS, curr_row[FIELD_TAXONOMIC_STATUS]),
-                                            SkosAttribute(SCHEMA_AUTHOR, author)])
-        elif curr_search_level == FIELD_GENUS:
-            self.graph.add_genus_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME],
-                                      [SkosAttribute(SCHEMA_TAXON_STATUS, curr_row[FIELD_TAXONOMIC_STATUS]),
-                                       SkosAttribute(SCHEMA_AUTHOR, author)])
-        elif curr_search_level == FIELD_SUB_GENUS:
-            self.graph.add_sub_genus_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME],
-                                          [SkosAttribute(SCHEMA_TAXON_STATUS, curr_row[FIELD_TAXONOMIC_STATUS]),
-                                           SkosAttribute(SCHEMA_AUTHOR, author)])
-        elif curr_search_level == FIELD_SPECIES:
-            self.graph.add_species_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME],
-                                        [SkosAttribute(SCHEMA_TAXON_STATUS, curr_row[FIELD_TAXONOMIC_STATUS]),
-                                         SkosAttribute(SCHEMA_AUTHOR, author)])
-        elif curr_search_level == FIELD_SUB_SPECIES:
-            self.graph.add_sub_species_node(str(curr_row[FIELD_ID]), curr_row[FIELD_SCIENTIFIC_NAME],
-                                            [SkosAttribute(SCHEMA_TAXON_STATUS, curr_row[FIELD_TAXONOMIC_STATUS]),
-                                             SkosAttribute(SCHEMA_AUTHOR, author)])
-        self.graph.add_synonym_relation(str(curr_row[FIELD_ID]), str(parent_id))
+                stack.append((row_id, top_parent_id, curr_search_level, parent_search_level, -1))
+
+    def __index_rows(self):
+        """
+        Positions of the child rows per parentNameUsageID, built once instead of filtering the whole dataframe
+        for every visited taxon
+        """
+        self.__child_positions = {
+            key: positions.tolist()
+            for key, positions in self.dataframe.groupby(FIELD_PARENT_NAME_USAGE_ID, sort=False).indices.items()
+        }
+        self.__ranks = self.dataframe[FIELD_TAXON_RANK].str.lower().tolist()
+        self.__ids = self.dataframe[FIELD_ID].tolist()
+
+    def __get_subtree_positions(self, position: int) -> List[int]:
+        positions: List[int] = [position]
+        stack: list = [self.__ids[position]]
+        while len(stack) > 0:
+            child: int
+            for child in self.__child_positions.get(stack.pop(), []):
+                positions.append(child)
+                stack.append(self.__ids[child])
+        return positions
+
+    def __get_synonym_positions(self) -> dict:
+        return self.dataframe.groupby(FIELD_ACCEPTED_NAME_USAGE_ID, sort=False).indices
 
+    def __add_found_nodes(self):
+        # the found rows are added in one bulk call in the order of the walk, below their top parent
+        concepts: Dict[str, str] = {x: self._get_concept_of_search_level(x) for x in set(self.__found_levels)}
+        self._add_rows_to_graph(self.dataframe.iloc[self.__found_positions], self.__found_parent_ids,
+                                [concepts[x] for x in self.__found_levels])
 
+    def __add_synonyms(self):
+        """
+        Joins the accepted nodes found by the walk with the rows naming them as acceptedNameUsageID (a hash join
+        on the id as string, as the former per node filter) and adds the synonyms of each level in one bulk call
+        """
+        self.log.info("Parse synonyms")
+        synonym_positions: dict = self.__get_synonym_positions()
+        joined: Dict[str, Tuple[List[int], List[str]]] = {}
+        found_position: int
+        search_level: str
+        for found_position, search_level in zip(self.__found_positions, self.__found_levels):
+            accepted_id: str = str(self.__ids[found_position])
+            positions = synonym_positions.get(accepted_id)
+            if positions is not None:
+                level_positions, accepted_ids = joined.setdefault(search_level, ([], []))
+                level_positions += positions.tolist()
+                accepted_ids += [accepted_id] * len(positions)
+        for search_level, (level_positions, accepted_ids) in joined.items():
+            self._add_synonyms_to_graph(self.dataframe.iloc[level_positions], accepted_ids,
+                                        self._get_concept_of_search_level(search_level))
@@ -1,10 +1,12 @@
 import logging
+from typing import List, Dict, Tuple
 
 from pandas import DataFrame
 
 from dwca_parser.dwca_fields import *
 from dwca_parser.parser_base import ParserBase
-from graph.skos_graph import SkosGraph, SkosAttribute, SCHEMA_TAXON_STATUS, SCHEMA_AUTHOR
+from graph.skos_graph import SkosGraph, SkosAttribute, SCHEMA_TAXON_STATUS, SCHEMA_AUTHOR, CONCEPT_FAMILY, \
+    CONCEPT_GENUS, CONCEPT_SPECIES, CONCEPT_SUB_SPECIES
 
 
 class ParserTPL(ParserBase):
@@ -17,21 +19,33 @@ class ParserTPL(ParserBase):
 
     def _parse(self) -> SkosGraph:
         self.log.info("Start parsing")
+        self._parse_partition(self._parse_upper_ranks(), [])
+        self.log.info("Parsing finished")
+        return self.graph
+
+    def _parse_upper_ranks(self) -> Tuple[dict, Dict[str, str]]:
+        """
+        Kingdoms, families and genera are numbered over the whole dataframe, so the generated ids are the same
+        whether the species are parsed in one or in many partitions
+        """
         desc_dict = {}
         self.__load_kingdoms_from_column(desc_dict)
         self.__load_families_from_column(desc_dict)
         self.__load_genus_from_column(desc_dict)
+        accepted_df: DataFrame = self.dataframe[self.dataframe[FIELD_TAXONOMIC_STATUS] == STATUS_ACCEPTED]
+        return desc_dict, super()._get_sub_species_parents_by_name(self.__get_sub_species_df(), accepted_df)
+
+    def _parse_partition(self, state: Tuple[dict, Dict[str, str]], families: list):
+        desc_dict, sub_species_parents = state
         self.__add_species_with_synonyms(desc_dict)
-        self.__add_sub_species()
-        self.log.info("Parsing finished")
-        return self.graph
+        self.__add_sub_species(sub_species_parents)
 
     def __load_kingdoms_from_column(self, desc_dict: dict):
         self.log.info("Parse Kingdoms")
         all_kingdoms: list = self.dataframe[FIELD_KINGDOM].unique().tolist()
         for kingdom in all_kingdoms:
             if kingdom.upper() in self.target_kingdoms:
-                desc = 0 if not desc_dict else max(desc_dict.values()) + 1
+                desc = self.generated_ids.allocate()[0]
                 gen_desc = super()._get_generated_id(desc)
                 self.graph.add_kingdom_node(gen_desc, kingdom, [SkosAttribute(SCHEMA_TAXON_STATUS, "Accepted"),
                                                                 SkosAttribute(SCHEMA_AUTHOR, "")])
@@ -43,15 +57,14 @@ class ParserTPL(ParserBase):
             self.dataframe[FIELD_KINGDOM].map(str.upper).isin(self.target_kingdoms)
         ]
         relevant_df = relevant_df.drop_duplicates(subset=FIELD_FAMILY)
-        for index, row in relevant_df.iterrows():
-            desc = 0 if not desc_dict else max(desc_dict.values()) + 1
-            parent_desc = desc_dict[row[FIELD_KINGDOM]]
-            gen_desc = super()._get_generated_id(desc)
-            gen_parent_desc = super()._get_generated_id(parent_desc)
-            self.graph.add_family_node(gen_desc, str(row[FIELD_FAMILY]), [SkosAttribute(SCHEMA_TAXON_STATUS, "Unknown"),
-                                                                          SkosAttribute(SCHEMA_AUTHOR, "")])
-            self.graph.add_family_to_kingdom(gen_desc, gen_parent_desc)
-            desc_dict[row[FIELD_FAMILY]] = desc
+        families: list = relevant_df[FIELD_FAMILY].tolist()
+        descs: List[int] = list(self.generated_ids.allocate(len(families)))
+        gen_parent_descs: List[str] = [self._get_generated_id(desc_dict[x])
+                                       for x in relevant_df[FIELD_KINGDOM].tolist()]
+        gen_descs: List[str] = [self._get_generated_id(x) for x in descs]
+        self.graph.add_nodes_bulk(gen_descs, [str(x) for x in families], CONCEPT_FAMILY, "Unknown", "")
+        self.graph.add_edges_bulk(gen_descs, gen_parent_descs)
+        desc_dict.update(zip(families, descs))
 
     def __load_genus_from_column(self, desc_dict: dict):
         self.log.info("Parse Genus")
@@ -59,67 +72,48 @@ class ParserTPL(ParserBase):
             self.dataframe[FIELD_KINGDOM].map(str.upper).isin(self.target_kingdoms)
         ]
         relevant_df = relevant_df.drop_duplicates(subset=FIELD_GENUS)
-        for index, row in relevant_df.iterrows():
-            desc = 0 if not desc_dict else max(desc_dict.values()) + 1
-            parent_desc = desc_dict[row[FIELD_FAMILY]]
-            gen_desc = super()._get_generated_id(desc)
-            gen_parent_desc = super()._get_generated_id(parent_desc)
-            self.graph.add_genus_node(gen_desc, row[FIELD_GENUS], [SkosAttribute(SCHEMA_TAXON_STATUS, "Unknown"),
-                                                                   SkosAttribute(SCHEMA_AUTHOR, "")])
-            self.graph.add_family_to_kingdom(gen_desc, gen_parent_desc)
-            desc_dict[row[FIELD_GENUS]] = desc
+        genera: list = relevant_df[FIELD_GENUS].tolist()
+        descs: List[int] = list(self.generated_ids.allocate(len(genera)))
+        gen_parent_descs: List[str] = [self._get_generated_id(desc_dict[x]) for x in relevant_df[FIELD_FAMILY].tolist()]
+        gen_descs: List[str] = [self._get_generated_id(x) for x in descs]
+        self.graph.add_nodes_bulk(gen_descs, genera, CONCEPT_GENUS, "Unknown", "")
+        self.graph.add_edges_bulk(gen_descs, gen_parent_descs)
+        desc_dict.update(zip(genera, descs))
 
     def __add_species_with_synonyms(self, desc_dict: dict):
         self.log.info("Parse Species")
         species_df: DataFrame = self.dataframe[
             (self.dataframe[FIELD_TAXON_RANK] == FIELD_SPECIES) & self.dataframe[FIELD_ACCEPTED_NAME_USAGE_ID].isna()
             ]
-        for index, row in species_df.iterrows():
-            parent_desc = desc_dict[row[FIELD_GENUS]]
-            gen_parent_desc = super()._get_generated_id(parent_desc)
-            author = super()._get_author_str(row[FIELD_SCIENTIFIC_NAME_AUTHORSHIP])
-            super()._add_species_to_graph(row, gen_parent_desc, FIELD_GENUS, row[FIELD_TAXONOMIC_STATUS], author)
+        gen_parent_descs: List[str] = [self._get_generated_id(desc_dict[x]) for x in species_df[FIELD_GENUS].tolist()]
+        super()._add_rows_to_graph(species_df, gen_parent_descs, CONCEPT_SPECIES)
 
         species_synonym_df: DataFrame = self.dataframe[(self.dataframe[FIELD_TAXON_RANK] == FIELD_SPECIES) &
                                                        (self.dataframe[FIELD_ACCEPTED_NAME_USAGE_ID] == self.dataframe[
                                                            FIELD_ACCEPTED_NAME_USAGE_ID])]
-        for index, row in species_synonym_df.iterrows():
-            author = super()._get_author_str(row[FIELD_SCIENTIFIC_NAME_AUTHORSHIP])
-            self.graph.add_species_node(str(row[FIELD_ID]), row[FIELD_SCIENTIFIC_NAME],
-                                        [SkosAttribute(SCHEMA_TAXON_STATUS, row[FIELD_TAXONOMIC_STATUS]),
-                                         SkosAttribute(SCHEMA_AUTHOR, author)])
-            self.graph.add_synonym_relation(str(row[FIELD_ID]), str(row[FIELD_ACCEPTED_NAME_USAGE_ID]))
-
-    def __add_sub_species(self):
+        super()._add_synonyms_to_graph(species_synonym_df,
+                                       species_synonym_df[FIELD_ACCEPTED_NAME_USAGE_ID].astype(str), CONCEPT_SPECIES)
+
+    def __add_sub_species(self, sub_species_parents: Dict[str, str]):
         self.log.info("Parse Sub-Species")
-        sub_species_df: DataFrame = self.dataframe[
-            self.__get_non_species_cond() &
-            self.dataframe[FIELD_ACCEPTED_NAME_USAGE_ID].isna()
-        ]
-        for index, row in sub_species_df.iterrows():
-            parent_name = row[FIELD_GENUS] + " " + row[FIELD_SPECIFIC_EPHITHET]
-            parent_desc = ""
-            parent_row = self.dataframe[
-                (self.dataframe[FIELD_SCIENTIFIC_NAME] == parent_name) &
-                (self.dataframe[FIELD_TAXONOMIC_STATUS] == STATUS_ACCEPTED)
-            ]
-            if parent_row.empty:
-                self.log.warn("Parent not found: " + parent_name)
-            else:
-                parent_desc = parent_row.iloc[0][FIELD_ID]
-            author = super()._get_author_str(row[FIELD_SCIENTIFIC_NAME_AUTHORSHIP])
-            super()._add_sub_species_to_graph(row, str(parent_desc), row[FIELD_TAXONOMIC_STATUS], author)
+        sub_species_df: DataFrame = self.__get_sub_species_df()
+        super()._add_rows_to_graph(sub_species_df,
+                                   super()._get_sub_species_parent_ids(sub_species_df, sub_species_parents),
+                                   CONCEPT_SUB_SPECIES)
 
         sub_species_synonyms_df: DataFrame = self.dataframe[
             self.__get_non_species_cond() &
             (self.dataframe[FIELD_ACCEPTED_NAME_USAGE_ID] == self.dataframe[FIELD_ACCEPTED_NAME_USAGE_ID])
         ]
-        for index, row in sub_species_synonyms_df.iterrows():
-            author = super()._get_author_str(row[FIELD_SCIENTIFIC_NAME_AUTHORSHIP])
-            self.graph.add_sub_species_node(str(row[FIELD_ID]), row[FIELD_SCIENTIFIC_NAME],
-                                            [SkosAttribute(SCHEMA_TAXON_STATUS, row[FIELD_TAXONOMIC_STATUS]),
-                                             SkosAttribute(SCHEMA_AUTHOR, author)])
-            self.graph.add_synonym_relation(str(row[FIELD_ID]), str(row[FIELD_ACCEPTED_NAME_USAGE_ID]))
+        super()._add_synonyms_to_graph(sub_species_synonyms_df,
+                                       sub_species_synonyms_df[FIELD_ACCEPTED_NAME_USAGE_ID].astype(str),
+                                       CONCEPT_SUB_SPECIES)
+
+    def __get_sub_species_df(self) -> DataFrame:
+        return self.dataframe[
+            self.__get_non_species_cond() &
+            self.dataframe[FIELD_ACCEPTED_NAME_USAGE_ID].isna()
+        ]
 
     def __get_non_species_cond(self):
         return (self.dataframe[FIELD_TAXON_RANK] == FIELD_SUB_SPECIES) | \
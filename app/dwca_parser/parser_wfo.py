@@ -1,11 +1,38 @@
 import logging
-from typing import Optional, Tuple
+from typing import Optional, Tuple, List, Dict
 
-from pandas import DataFrame, Series
+from pandas import DataFrame
 
 from dwca_parser.dwca_fields import *
 from dwca_parser.parser_base import ParserBase
-from graph.skos_graph import SkosGraph, SkosAttribute, SCHEMA_TAXON_STATUS, SCHEMA_AUTHOR
+from graph.skos_graph import SkosGraph, SkosAttribute, SCHEMA_TAXON_STATUS, SCHEMA_AUTHOR, CONCEPT_FAMILY, \
+    CONCEPT_GENUS, CONCEPT_SPECIES, CONCEPT_SUB_SPECIES
+
+_NAME_ROW_COLUMNS: List[str] = [FIELD_ID, FIELD_TAXONOMIC_STATUS, FIELD_SCIENTIFIC_NAME_AUTHORSHIP]
+
+
+class _RankNodes:
+    """
+    Columns of the nodes of one rank collected row by row, added to the graph with one bulk call
+    """
+
+    def __init__(self):
+        self.descriptors: List[str] = []
+        self.labels: List[str] = []
+        self.taxon_statuses: list = []
+        self.authors: List[str] = []
+        self.parents: List[str] = []
+
+    def append(self, descriptor: str, label: str, taxon_status, author: str, parent: str):
+        self.descriptors.append(descriptor)
+        self.labels.append(label)
+        self.taxon_statuses.append(taxon_status)
+        self.authors.append(author)
+        self.parents.append(parent)
+
+    def add_to_graph(self, graph: SkosGraph, concept: str):
+        graph.add_nodes_bulk(self.descriptors, self.labels, concept, self.taxon_statuses, self.authors)
+        graph.add_edges_bulk(self.descriptors, self.parents)
 
 
 class ParserWFO(ParserBase):
@@ -18,22 +45,38 @@ class ParserWFO(ParserBase):
 
     def _parse(self) -> SkosGraph:
         self.log.info("Start parsing")
+        self._parse_partition(self._parse_upper_ranks(), [])
+        self.log.info("Parsing finished")
+        return self.graph
+
+    def _parse_upper_ranks(self) -> Tuple[dict, dict, Dict[str, str]]:
+        """
+        Kingdoms, families and genera are numbered over the whole dataframe, so the generated ids are the same
+        whether the species are parsed in one or in many partitions
+        """
         desc_dict_numbers = {}
         desc_dict_id = {}
         self.__load_kingdoms_from_column(desc_dict_numbers)
         self.__load_families_from_column(desc_dict_numbers, desc_dict_id)
         self.__load_genus_from_column(desc_dict_numbers, desc_dict_id)
+        sub_species_df: DataFrame = self.dataframe[
+            self.__get_non_species_cond() &
+            self.dataframe[FIELD_ACCEPTED_NAME_USAGE_ID].isna()
+            ]
+        return desc_dict_numbers, desc_dict_id, super()._get_sub_species_parents_by_name(sub_species_df,
+                                                                                         self.__get_accepted_df())
+
+    def _parse_partition(self, state: Tuple[dict, dict, Dict[str, str]], families: list):
+        desc_dict_numbers, desc_dict_id, sub_species_parents = state
         self.__load_species_with_synonyms(desc_dict_numbers, desc_dict_id)
-        self.__load_sub_species()
-        self.log.info("Parsing finished")
-        return self.graph
+        self.__load_sub_species(sub_species_parents)
 
     def __load_kingdoms_from_column(self, desc_dict: dict):
         self.log.info("Parse Kingdoms")
         all_kingdoms: list = self.dataframe[FIELD_KINGDOM].unique().tolist()
         for kingdom in all_kingdoms:
             if kingdom.upper() in self.target_kingdoms:
-                desc = 0 if not desc_dict else max(desc_dict.values()) + 1
+                desc = self.generated_ids.allocate()[0]
                 gen_desc = super()._get_generated_id(desc)
                 self.graph.add_kingdom_node(gen_desc, kingdom, [SkosAttribute(SCHEMA_TAXON_STATUS, "Accepted"),
                                                                 SkosAttribute(SCHEMA_AUTHOR, "")])
@@ -45,33 +88,31 @@ class ParserWFO(ParserBase):
             self.dataframe[FIELD_KINGDOM].map(str.upper).isin(self.target_kingdoms)
         ]
         relevant_df = relevant_df.drop_duplicates(subset=FIELD_FAMILY)
-        family_rows: DataFrame = self.dataframe.loc[
+        family_rows: Dict[str, dict] = super()._get_first_rows_by_name(self.dataframe.loc[
             self.dataframe[FIELD_TAXON_RANK].map(str.upper) == FIELD_FAMILY.upper()
-        ]
-        for index, row in relevant_df.iterrows():
-            desc, has_id = self.__get_id_of(row[FIELD_FAMILY], family_rows)
+        ], _NAME_ROW_COLUMNS)
+        nodes: _RankNodes = _RankNodes()
+        # plain column lists, iterrows would build a Series per family
+        for family, kingdom in zip(relevant_df[FIELD_FAMILY].tolist(), relevant_df[FIELD_KINGDOM].tolist()):
+            desc, has_id = self.__get_id_of(family, family_rows)
             gen_desc = ""
             if not has_id:
-                desc = 0 if not desc_dict_number else max(desc_dict_number.values()) + 1
+                desc = self.generated_ids.allocate()[0]
                 gen_desc = super()._get_generated_id(desc)
             else:
                 gen_desc = desc[FIELD_ID]
-            parent_desc = desc_dict_number[row[FIELD_KINGDOM]]
+            parent_desc = desc_dict_number[kingdom]
             gen_parent_desc = super()._get_generated_id(parent_desc)
             if not has_id:
-                self.graph.add_family_node(gen_desc, str(row[FIELD_FAMILY]),
-                                           [SkosAttribute(SCHEMA_TAXON_STATUS, "Unknown"),
-                                            SkosAttribute(SCHEMA_AUTHOR, "")])
+                nodes.append(gen_desc, str(family), "Unknown", "", gen_parent_desc)
             else:
                 author = super()._get_author_str(desc[FIELD_SCIENTIFIC_NAME_AUTHORSHIP])
-                self.graph.add_family_node(gen_desc, str(row[FIELD_FAMILY]),
-                                           [SkosAttribute(SCHEMA_TAXON_STATUS, desc[FIELD_TAXONOMIC_STATUS]),
-                                            SkosAttribute(SCHEMA_AUTHOR, author)])
-            self.graph.add_family_to_kingdom(gen_desc, gen_parent_desc)
+                nodes.append(gen_desc, str(family), desc[FIELD_TAXONOMIC_STATUS], author, gen_parent_desc)
             if has_id:
-                desc_dict_id[row[FIELD_FAMILY]] = desc[FIELD_ID]
+                desc_dict_id[family] = desc[FIELD_ID]
             else:
-                desc_dict_number[row[FIELD_FAMILY]] = desc
+                desc_dict_number[family] = desc
+        nodes.add_to_graph(self.graph, CONCEPT_FAMILY)
 
     def __load_genus_from_column(self, desc_dict_number: dict, desc_dict_id: dict):
         self.log.info("Parse Genus")
@@ -79,39 +120,36 @@ class ParserWFO(ParserBase):
             self.dataframe[FIELD_KINGDOM].map(str.upper).isin(self.target_kingdoms)
         ]
         relevant_df = relevant_df.drop_duplicates(subset=FIELD_GENUS)
-        genus_rows: DataFrame = self.dataframe.loc[
+        genus_rows: Dict[str, dict] = super()._get_first_rows_by_name(self.dataframe.loc[
             self.dataframe[FIELD_TAXON_RANK].map(str.upper) == FIELD_GENUS.upper()
-        ]
-        for index, row in relevant_df.iterrows():
-            desc, has_id = self.__get_id_of(row[FIELD_GENUS], genus_rows)
+        ], _NAME_ROW_COLUMNS)
+        nodes: _RankNodes = _RankNodes()
+        for genus, family in zip(relevant_df[FIELD_GENUS].tolist(), relevant_df[FIELD_FAMILY].tolist()):
+            desc, has_id = self.__get_id_of(genus, genus_rows)
             gen_desc = ""
             if not has_id:
-                desc = 0 if not desc_dict_number else max(desc_dict_number.values()) + 1
+                desc = self.generated_ids.allocate()[0]
                 gen_desc = super()._get_generated_id(desc)
             else:
                 gen_desc = desc[FIELD_ID]
             parent_desc = ""
             gen_parent_desc = ""
-            if row[FIELD_FAMILY] in desc_dict_number:
-                parent_desc = desc_dict_number[row[FIELD_FAMILY]]
+            if family in desc_dict_number:
+                parent_desc = desc_dict_number[family]
                 gen_parent_desc = super()._get_generated_id(parent_desc)
-            if row[FIELD_FAMILY] in desc_dict_id:
-                parent_desc = desc_dict_id[row[FIELD_FAMILY]]
+            if family in desc_dict_id:
+                parent_desc = desc_dict_id[family]
                 gen_parent_desc = parent_desc
             if not has_id:
-                self.graph.add_genus_node(gen_desc, str(row[FIELD_GENUS]),
-                                          [SkosAttribute(SCHEMA_TAXON_STATUS, "Unknown"),
-                                           SkosAttribute(SCHEMA_AUTHOR, "")])
+                nodes.append(gen_desc, str(genus), "Unknown", "", gen_parent_desc)
             else:
                 author = super()._get_author_str(desc[FIELD_SCIENTIFIC_NAME_AUTHORSHIP])
-                self.graph.add_genus_node(gen_desc, str(row[FIELD_GENUS]),
-                                          [SkosAttribute(SCHEMA_TAXON_STATUS, desc[FIELD_TAXONOMIC_STATUS]),
-                                           SkosAttribute(SCHEMA_AUTHOR, author)])
-            self.graph.add_genus_to_family(gen_desc, gen_parent_desc)
+                nodes.append(gen_desc, str(genus), desc[FIELD_TAXONOMIC_STATUS], author, gen_parent_desc)
             if has_id:
-                desc_dict_id[row[FIELD_GENUS]] = desc[FIELD_ID]
+                desc_dict_id[genus] = desc[FIELD_ID]
             else:
-                desc_dict_number[row[FIELD_GENUS]] = desc
+                desc_dict_number[genus] = desc
+        nodes.add_to_graph(self.graph, CONCEPT_GENUS)
 
     def __load_species_with_synonyms(self, desc_dict_number: dict, desc_dict_id: dict):
         self.log.info("Parse Species")
@@ -119,58 +157,44 @@ class ParserWFO(ParserBase):
             (self.dataframe[FIELD_TAXON_RANK].map(str.upper) == FIELD_SPECIES.upper())
             & self.dataframe[FIELD_ACCEPTED_NAME_USAGE_ID].isna()
         ]
-        for index, row in species_df.iterrows():
-            parent_desc = ""
+        gen_parent_descs: List[str] = []
+        for genus in species_df[FIELD_GENUS].tolist():
             gen_parent_desc = ""
-            if row[FIELD_GENUS] in desc_dict_number:
-                parent_desc = desc_dict_number[row[FIELD_GENUS]]
-                gen_parent_desc = super()._get_generated_id(parent_desc)
-            if row[FIELD_GENUS] in desc_dict_id:
-                gen_parent_desc = desc_dict_id[row[FIELD_GENUS]]
-            author = super()._get_author_str(row[FIELD_SCIENTIFIC_NAME_AUTHORSHIP])
-            super()._add_species_to_graph(row, gen_parent_desc, FIELD_GENUS, row[FIELD_TAXONOMIC_STATUS], author)
+            if genus in desc_dict_number:
+                gen_parent_desc = super()._get_generated_id(desc_dict_number[genus])
+            if genus in desc_dict_id:
+                gen_parent_desc = desc_dict_id[genus]
+            gen_parent_descs.append(gen_parent_desc)
+        super()._add_rows_to_graph(species_df, gen_parent_descs, CONCEPT_SPECIES)
         species_synonym_df: DataFrame = self.dataframe[
             (self.dataframe[FIELD_TAXON_RANK].map(str.upper) == FIELD_SPECIES.upper()) &
             (self.dataframe[FIELD_ACCEPTED_NAME_USAGE_ID] == self.dataframe[FIELD_ACCEPTED_NAME_USAGE_ID])
         ]
-        for index, row in species_synonym_df.iterrows():
-            author = super()._get_author_str(row[FIELD_SCIENTIFIC_NAME_AUTHORSHIP])
-            self.graph.add_species_node(str(row[FIELD_ID]), row[FIELD_SCIENTIFIC_NAME],
-                                        [SkosAttribute(SCHEMA_TAXON_STATUS, row[FIELD_TAXONOMIC_STATUS]),
-                                         SkosAttribute(SCHEMA_AUTHOR, author)])
-            self.graph.add_synonym_relation(str(row[FIELD_ID]), str(row[FIELD_ACCEPTED_NAME_USAGE_ID]))
-
-    def __load_sub_species(self):
+        super()._add_synonyms_to_graph(species_synonym_df,
+                                       species_synonym_df[FIELD_ACCEPTED_NAME_USAGE_ID].astype(str), CONCEPT_SPECIES)
+
+    def __load_sub_species(self, sub_species_parents: Dict[str, str]):
         self.log.info("Parse Sub-Species")
         sub_species_df: DataFrame = self.dataframe[
             self.__get_non_species_cond() &
             self.dataframe[FIELD_ACCEPTED_NAME_USAGE_ID].isna()
             ]
-        for index, row in sub_species_df.iterrows():
-            parent_name = row[FIELD_GENUS] + " " + row[FIELD_SPECIFIC_EPHITHET]
-            parent_nodes = self.graph.get_all_nodes_by_name(parent_name)
-            parent_desc = ""
-            parent_row = self.dataframe[
-                (self.dataframe[FIELD_SCIENTIFIC_NAME] == parent_name) &
-                (self.dataframe[FIELD_TAXONOMIC_STATUS].map(str).map(str.upper) == STATUS_ACCEPTED.upper())
-            ]
-            if parent_row.empty:
-                self.log.warn("Parent not found: " + parent_name)
-            else:
-                parent_desc = parent_row.iloc[0][FIELD_ID]
-            author = super()._get_author_str(row[FIELD_SCIENTIFIC_NAME_AUTHORSHIP])
-            super()._add_sub_species_to_graph(row, str(parent_desc), row[FIELD_TAXONOMIC_STATUS], author)
+        super()._add_rows_to_graph(sub_species_df,
+                                   super()._get_sub_species_parent_ids(sub_species_df, sub_species_parents),
+                                   CONCEPT_SUB_SPECIES)
 
         sub_species_synonyms_df: DataFrame = self.dataframe[
             self.__get_non_species_cond() &
             (self.dataframe[FIELD_ACCEPTED_NAME_USAGE_ID] == self.dataframe[FIELD_ACCEPTED_NAME_USAGE_ID])
             ]
-        for index, row in sub_species_synonyms_df.iterrows():
-            author = super()._get_author_str(row[FIELD_SCIENTIFIC_NAME_AUTHORSHIP])
-            self.graph.add_sub_species_node(row[FIELD_ID], row[FIELD_SCIENTIFIC_NAME],
-                                            [SkosAttribute(SCHEMA_TAXON_STATUS, row[FIELD_TAXONOMIC_STATUS]),
-                                             SkosAttribute(SCHEMA_AUTHOR, author)])
-            self.graph.add_synonym_relation(row[FIELD_ID], row[FIELD_ACCEPTED_NAME_USAGE_ID])
+        super()._add_synonyms_to_graph(sub_species_synonyms_df,
+                                       sub_species_synonyms_df[FIELD_ACCEPTED_NAME_USAGE_ID].astype(str),
+                                       CONCEPT_SUB_SPECIES)
+
+    def __get_accepted_df(self) -> DataFrame:
+        return self.dataframe[
+            self.dataframe[FIELD_TAXONOMIC_STATUS].map(str).map(str.upper) == STATUS_ACCEPTED.upper()
+        ]
 
     def __get_non_species_cond(self):
         return (self.dataframe[FIELD_TAXON_RANK].map(str.upper) == FIELD_SUB_SPECIES.upper()) | \
@@ -178,7 +202,7 @@ class ParserWFO(ParserBase):
                (self.dataframe[FIELD_TAXON_RANK].map(str.upper) == FIELD_VARIETY_TPL.upper())
 
     @staticmethod
-    def __get_id_of(scientific_name: str, search_df: DataFrame) -> Tuple[Optional[Series], bool]:
-        reduced_df: DataFrame = search_df.loc[search_df[FIELD_SCIENTIFIC_NAME] == scientific_name]
-        return (None, False) if reduced_df.empty else (reduced_df.iloc[0], True)
+    def __get_id_of(scientific_name: str, rows_by_name: Dict[str, dict]) -> Tuple[Optional[dict], bool]:
+        row: Optional[dict] = rows_by_name.get(scientific_name)
+        return row, row is not None
 
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 import concurrent.futures
-import sys
 
-from graph.skos_graph import SkosGraph, SkosNode, SkosAttribute, SCHEMA_IN_SCHEME, SkosRelation, RelationSearchIndex
+from graph.instrumentation import stage, Stage
+from graph.skos_graph import SkosGraph, SkosNode, SkosAttribute, SCHEMA_IN_SCHEME, SkosRelation
 
+SLICE_SIZE: int = 100000
 
-def to_rdf_skos_str(domain_name: str, nodes: [SkosNode], edge_lookup: RelationSearchIndex) -> str:
+
+def to_rdf_skos_str(domain_name: str, nodes: [SkosNode], graph: SkosGraph) -> str:
     out = ""
 
     node: SkosNode
@@ -23,7 +25,7 @@ def to_rdf_skos_str(domain_name: str, nodes: [SkosNode], edge_lookup: RelationSe
                 lines_out.append('  ' + attribute.schema + ' ' + domain_name + ':' + lit)
 
         relation: SkosRelation
-        for relation in edge_lookup.forward_relation_dict[node.descriptor]:
+        for relation in graph.get_outgoing_relations_with_descriptor(node.descriptor):
             lines_out.append('  ' + relation.label + ' ' + domain_name + ':' + relation.end_descriptor + '')
 
         for i in range(0, len(lines_out)):
@@ -35,7 +37,7 @@ def to_rdf_skos_str(domain_name: str, nodes: [SkosNode], edge_lookup: RelationSe
     return out
 
 
-def to_skos_export(graph: SkosGraph, edge_lookup: RelationSearchIndex, domain_name: str):
+def to_skos_export(graph: SkosGraph, domain_name: str):
     out = ""
     out += "@prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .\n"
     out += "@prefix skos: <http://www.w3.org/2004/02/skos/core#> .\n"
@@ -45,34 +47,30 @@ def to_skos_export(graph: SkosGraph, edge_lookup: RelationSearchIndex, domain_na
     out += domain_name + ':species rdf:type skos:ConceptScheme; skos:prefLabel "species" .\n'
     out += domain_name + ':genus rdf:type skos:ConceptScheme; skos:prefLabel "genus" .\n'
 
-    sys.stdout.write("START SLICING...")
-
-
-    nodes_slices: [[SkosNode]] = []
-    node: SkosNode
-    i: int = 0
-    cur_slice: [SkosNode] = []
-    for node in graph.nodes:
-        cur_slice.append(node)
-        i += 1
-        if i >= 100000:
+    current: Stage
+    with stage("slicing", len(graph.nodes), "nodes"):
+        nodes_slices: [[SkosNode]] = []
+        node: SkosNode
+        cur_slice: [SkosNode] = []
+        for node in graph.nodes:
+            cur_slice.append(node)
+            if len(cur_slice) >= SLICE_SIZE:
+                nodes_slices.append(cur_slice)
+                cur_slice = []
+        if len(cur_slice) > 0:
             nodes_slices.append(cur_slice)
-            cur_slice = []
-            i = 0
-    print("done")
-    sys.stdout.write("BUILD CONCURRENT THREADS...")
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(to_rdf_skos_str, domain_name, nodes, edge_lookup) for nodes in nodes_slices]
-        print("done")
-        sys.stdout.write("START CONCURRENT THREADS...")
-        results = [f.result() for f in futures]
-    print("done")
 
-    sys.stdout.write("START WRITING TO FILE...")
-    with open("out.ttl", "w+", encoding="utf-8") as f:
-        f.write(out)
-        for r in results:
-            f.write(r)
-        f.close()
-    print("done")
-    print("EXPORT FINISHED!")
+    with stage("serializing", len(graph.nodes), "nodes") as current, \
+            concurrent.futures.ThreadPoolExecutor() as executor:
+        futures = [executor.submit(to_rdf_skos_str, domain_name, nodes, graph) for nodes in nodes_slices]
+        results = []
+        for i, future in enumerate(futures):
+            results.append(future.result())
+            current.progress(min((i + 1) * SLICE_SIZE, len(graph.nodes)), len(graph.nodes))
+
+    with stage("writing", len(graph.nodes), "nodes") as current:
+        with open("out.ttl", "w+", encoding="utf-8") as f:
+            f.write(out)
+            for r in results:
+                f.write(r)
+            current.add_count("bytes", f.tell())
@@ -0,0 +1,149 @@
+from typing import Optional, List, Dict, Iterable, Sequence
+
+import numpy as np
+
+class StringColumn:
+    """
+    A column of strings stored as one utf-8 buffer and an offsets array, string i is data[offsets[i]:offsets[i + 1]]
+    The buffer can be any object which slices into bytes, e.g. bytes or a mmap of a whole file with the column
+    starting at base
+    """
+
+    def __init__(self, offsets: np.ndarray, data, base: int = 0):
+        self.offsets: np.ndarray = offsets
+        self.data = data
+        self.base: int = base
+
+    @staticmethod
+    def from_strings(values: Iterable[str]) -> 'StringColumn':
+        encoded: List[bytes] = [x.encode("utf-8") for x in values]
+        offsets: np.ndarray = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter((len(x) for x in encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        return StringColumn(offsets, b"".join(encoded))
+
+    @staticmethod
+    def concatenate(columns: Sequence['StringColumn']) -> 'StringColumn':
+        """
+        The strings of all columns in their order, by joining the buffers and shifting the offsets
+        """
+        offsets: List[np.ndarray] = [np.zeros(1, dtype=np.int64)]
+        shift: int = 0
+        column: StringColumn
+        for column in columns:
+            offsets.append(column.offsets[1:] + shift)
+            shift += int(column.offsets[-1])
+        return StringColumn(np.concatenate(offsets), b"".join(bytes(x.get_buffer()) for x in columns))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get_bytes(self, i: int) -> bytes:
+        return self.data[self.base + int(self.offsets[i]):self.base + int(self.offsets[i + 1])]
+
+    def get(self, i: int) -> str:
+        return self.get_bytes(i).decode("utf-8")
+
+    def to_list(self) -> List[str]:
+        offsets: List[int] = (self.offsets + self.base).tolist()
+        data = self.data
+        return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(0, len(offsets) - 1)]
+
+    def get_buffer(self) -> memoryview:
+        return memoryview(self.data)[self.base:self.base + int(self.offsets[-1])]
+
+    def bisect_left(self, value: str, order: Optional[np.ndarray] = None, lo: int = 0, hi: Optional[int] = None) \
+            -> int:
+        """
+        Position of value in the column (or the range lo to hi of it) sorted either as stored or by the permutation order
+        """
+        key: bytes = value.encode("utf-8")
+        if hi is None:
+            hi = len(self) if order is None else len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.get_bytes(mid if order is None else int(order[mid])) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, value: str, order: Optional[np.ndarray] = None) -> int:
+        """
+        Index of value in a sorted column (or a column sorted by order), -1 if missing
+        """
+        pos: int = self.bisect_left(value, order)
+        size: int = len(self) if order is None else len(order)
+        if pos >= size:
+            return -1
+        i: int = pos if order is None else int(order[pos])
+        return i if self.get_bytes(i) == value.encode("utf-8") else -1
+
+
+class DictionaryColumn:
+    """
+    A dictionary encoded column, codes index into a sorted StringColumn of the distinct values, -1 marks a missing value
+    """
+
+    def __init__(self, codes: np.ndarray, dictionary: StringColumn):
+        self.codes: np.ndarray = codes
+        self.dictionary: StringColumn = dictionary
+
+    @staticmethod
+    def from_values(values: Sequence[Optional[str]]) -> 'DictionaryColumn':
+        distinct: List[str] = sorted(set(x for x in values if x is not None))
+        code_of: Dict[str, int] = {value: code for code, value in enumerate(distinct)}
+        codes: np.ndarray = np.fromiter((-1 if x is None else code_of[x] for x in values),
+                                        dtype=np.int32, count=len(values))
+        return DictionaryColumn(codes, StringColumn.from_strings(distinct))
+
+    @staticmethod
+    def concatenate(columns: Sequence['DictionaryColumn']) -> 'DictionaryColumn':
+        """
+        The values of all columns in their order, the codes of each column are remapped to the merged dictionary
+        """
+        dictionaries: List[List[str]] = [x.dictionary.to_list() for x in columns]
+        distinct: List[str] = sorted(set(x for values in dictionaries for x in values))
+        code_of: Dict[str, int] = {value: code for code, value in enumerate(distinct)}
+        codes: List[np.ndarray] = [np.zeros(0, dtype=np.int32)]
+        column: DictionaryColumn
+        values: List[str]
+        for column, values in zip(columns, dictionaries):
+            # the extra last entry maps the missing code -1 to itself
+            code_map: np.ndarray = np.array([code_of[x] for x in values] + [-1], dtype=np.int32)
+            codes.append(code_map[column.codes])
+        return DictionaryColumn(np.concatenate(codes), StringColumn.from_strings(distinct))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def get(self, i: int) -> Optional[str]:
+        code: int = int(self.codes[i])
+        return None if code < 0 else self.dictionary.get(code)
+
+    def code_of(self, value: str) -> int:
+        return self.dictionary.find(value)
+
+    def to_list(self) -> List[Optional[str]]:
+        values: List[Optional[str]] = self.dictionary.to_list()
+        return [None if x < 0 else values[x] for x in self.codes.tolist()]
+
+
+class CsrAdjacency:
+    """
+    Compressed sparse row adjacency, the targets of row i are targets[offsets[i]:offsets[i + 1]]
+    """
+
+    def __init__(self, offsets: np.ndarray, targets: np.ndarray):
+        self.offsets: np.ndarray = offsets
+        self.targets: np.ndarray = targets
+
+    @staticmethod
+    def from_pairs(rows: np.ndarray, targets: np.ndarray, row_count: int) -> 'CsrAdjacency':
+        # stable, so the targets of a row keep the order in which the pairs were added
+        order: np.ndarray = np.argsort(rows, kind="stable")
+        offsets: np.ndarray = np.zeros(row_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=row_count), out=offsets[1:])
+        return CsrAdjacency(offsets, targets[order].astype(np.int32))
+
+    def get(self, i: int) -> np.ndarray:
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
@@ -0,0 +1,564 @@
+import gc
+from typing import Optional, List, Dict, Iterator
+
+import numpy as np
+
+from graph.columns import StringColumn, DictionaryColumn, CsrAdjacency
+from graph.skos_graph import SkosGraph, SkosNode, SkosRelation, SkosAttribute, NODE_SCHEMA_FIELDS, \
+    RELATION_LABELS, SCHEMA_PREF_LABEL, SCHEMA_BROADER, SCHEMA_SYNONYM, SCHEMA_AUTHOR, DERIVED_LABELS, \
+    SYMMETRIC_LABELS, get_relation_label_code
+from graph.hierarchy_index import HierarchyIndex
+from graph.name_keys import get_name_key, build_name_key_column
+from graph.prefix_index import PrefixIndex
+from graph.synonym_clusters import SynonymClusters
+from graph.trigram_index import TrigramIndex
+
+# schemas stored as dictionary encoded columns, in the order of the fixed fields of SkosNode
+FROZEN_SCHEMAS: List[str] = list(NODE_SCHEMA_FIELDS.keys())
+
+
+def _group(items: list, keys: np.ndarray, positions: np.ndarray, key_values: List[str]) -> Dict[str, list]:
+    """
+    The items at positions grouped by the value of their key code, each group in the order of positions
+    """
+    if len(keys) == 0:
+        return {}
+    # stable, so every group keeps the order of the items
+    order: np.ndarray = np.argsort(keys, kind="stable")
+    sorted_keys: np.ndarray = keys[order]
+    ordered: list = [items[x] for x in positions[order].tolist()]
+    bounds: List[int] = (np.nonzero(np.diff(sorted_keys))[0] + 1).tolist()
+    starts: List[int] = [0] + bounds
+    ends: List[int] = bounds + [len(ordered)]
+    return {key_values[x]: ordered[lo:hi] for x, lo, hi in zip(sorted_keys[starts].tolist(), starts, ends)}
+
+
+class FrozenGraphIndexes:
+    """
+    Lookup structures derived from the columns of a FrozenSkosGraph:
+    descriptor ids sorted by descriptor, node ids per prefLabel dictionary code and per name key dictionary code,
+    the CSR adjacency per relation label in both directions, the synonym clusters, the hierarchy parent pointers and
+    the prefix and trigram index of the labels.
+    They are either built from the columns or read from an index file
+    """
+
+    def __init__(self, descriptor_order: np.ndarray, label_nodes: CsrAdjacency, forward: Dict[str, CsrAdjacency],
+                 backward: Dict[str, CsrAdjacency], synonym_clusters: SynonymClusters, hierarchy: HierarchyIndex,
+                 prefix_index: PrefixIndex, trigram_index: TrigramIndex, name_key_nodes: CsrAdjacency):
+        self.descriptor_order: np.ndarray = descriptor_order
+        self.label_nodes: CsrAdjacency = label_nodes
+        self.name_key_nodes: CsrAdjacency = name_key_nodes
+        self.forward: Dict[str, CsrAdjacency] = forward
+        self.backward: Dict[str, CsrAdjacency] = backward
+        self.synonym_clusters: SynonymClusters = synonym_clusters
+        self.hierarchy: HierarchyIndex = hierarchy
+        self.prefix_index: PrefixIndex = prefix_index
+        self.trigram_index: TrigramIndex = trigram_index
+
+    @staticmethod
+    def build(descriptors: StringColumn, labels: DictionaryColumn, edge_start: np.ndarray, edge_end: np.ndarray,
+              edge_label: np.ndarray, relation_labels: List[str], name_keys: DictionaryColumn) -> 'FrozenGraphIndexes':
+        descriptor_count: int = len(descriptors)
+        # stable, so the first node of a duplicated descriptor is found first
+        descriptor_order: np.ndarray = np.array(
+            sorted(range(0, descriptor_count), key=descriptors.get_bytes), dtype=np.int32)
+
+        has_label: np.ndarray = labels.codes >= 0
+        label_nodes: CsrAdjacency = CsrAdjacency.from_pairs(
+            labels.codes[has_label], np.nonzero(has_label)[0], len(labels.dictionary))
+        has_key: np.ndarray = name_keys.codes >= 0
+        name_key_nodes: CsrAdjacency = CsrAdjacency.from_pairs(
+            name_keys.codes[has_key], np.nonzero(has_key)[0], len(name_keys.dictionary))
+
+        forward: Dict[str, CsrAdjacency] = {}
+        backward: Dict[str, CsrAdjacency] = {}
+        synonym_clusters: SynonymClusters = SynonymClusters.build(
+            np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), descriptor_count)
+        code: int
+        for code in np.unique(edge_label).tolist():
+            selected: np.ndarray = edge_label == code
+            start: np.ndarray = edge_start[selected]
+            end: np.ndarray = edge_end[selected]
+            label: str = relation_labels[code]
+            forward[label] = CsrAdjacency.from_pairs(start, end, descriptor_count)
+            backward[label] = CsrAdjacency.from_pairs(end, start, descriptor_count)
+            if label == SCHEMA_SYNONYM:
+                synonym_clusters = SynonymClusters.build(start, end, descriptor_count)
+
+        empty: CsrAdjacency = CsrAdjacency.from_pairs(np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32),
+                                                      descriptor_count)
+        hierarchy: HierarchyIndex = HierarchyIndex.build(len(labels), labels.codes,
+                                                         forward.get(SCHEMA_BROADER, empty),
+                                                         forward.get(SCHEMA_SYNONYM, empty))
+        prefix_index: PrefixIndex = PrefixIndex.build(labels)
+        return FrozenGraphIndexes(descriptor_order, label_nodes, forward, backward, synonym_clusters, hierarchy,
+                                  prefix_index, TrigramIndex.build(prefix_index.keys), name_key_nodes)
+
+
+class _NodeView:
+    def __init__(self, graph: 'FrozenSkosGraph'):
+        self.graph = graph
+
+    def __len__(self) -> int:
+        return self.graph.node_count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.graph.get_node(x) for x in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("node index out of range")
+        return self.graph.get_node(i)
+
+    def __iter__(self) -> Iterator[SkosNode]:
+        for i in range(0, len(self)):
+            yield self.graph.get_node(i)
+
+
+class _RelationView:
+    def __init__(self, graph: 'FrozenSkosGraph'):
+        self.graph = graph
+
+    def __len__(self) -> int:
+        return len(self.graph.edge_start)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.graph.get_relation(x) for x in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("relation index out of range")
+        return self.graph.get_relation(i)
+
+    def __iter__(self) -> Iterator[SkosRelation]:
+        for i in range(0, len(self)):
+            yield self.graph.get_relation(i)
+
+
+class FrozenSkosGraph:
+    """
+    A read only, columnar SkosGraph for serving
+    Nodes are integer ids, ids >= node_count are descriptors only referenced by relations.
+    The attributes and the name keys are dictionary encoded columns, the relations are stored as id arrays (in the order
+    they were added)
+    and as CSR adjacency per relation label in both directions (see FrozenGraphIndexes).
+    Query methods share their names and contracts with SkosGraph, nodes and relations are only materialized
+    as SkosNode and SkosRelation objects for returned results
+    """
+
+    def __init__(self, name: str, node_count: int, descriptors: StringColumn, columns: Dict[str, DictionaryColumn],
+                 edge_start: np.ndarray, edge_end: np.ndarray, edge_label: np.ndarray,
+                 extra_node: Optional[np.ndarray] = None, extra_schema: Optional[DictionaryColumn] = None,
+                 extra_literal: Optional[StringColumn] = None, relation_labels: Optional[List[str]] = None,
+                 indexes: Optional[FrozenGraphIndexes] = None, name_keys: Optional[DictionaryColumn] = None):
+        self.name: str = name
+        self.node_count: int = node_count
+        self.descriptors: StringColumn = descriptors
+        self.columns: Dict[str, DictionaryColumn] = columns
+        # relation labels of edge_label, codes are remapped to the process wide RELATION_LABELS codes
+        self.relation_labels: List[str] = list(RELATION_LABELS) if relation_labels is None else relation_labels
+        derived: np.ndarray = np.array([i for i, x in enumerate(self.relation_labels) if x in DERIVED_LABELS],
+                                       dtype=edge_label.dtype)
+        if len(derived) > 0 and len(edge_label) > 0 and np.isin(edge_label, derived).any():
+            # graph files written before relations were stored once carry the mirrored narrower relations as well
+            stored: np.ndarray = ~np.isin(edge_label, derived)
+            edge_start, edge_end, edge_label = edge_start[stored], edge_end[stored], edge_label[stored]
+        self.edge_start: np.ndarray = edge_start
+        self.edge_end: np.ndarray = edge_end
+        self.edge_label: np.ndarray = edge_label
+        self.extra_node: np.ndarray = np.zeros(0, dtype=np.int32) if extra_node is None else extra_node
+        self.extra_schema: Optional[DictionaryColumn] = extra_schema
+        self.extra_literal: Optional[StringColumn] = extra_literal
+        self.nodes: _NodeView = _NodeView(self)
+        self.relations: _RelationView = _RelationView(self)
+        # derived from the labels and authors on first use, if the graph file was written without them
+        self.__name_keys: Optional[DictionaryColumn] = name_keys
+        # built on first use, so writing a graph file does not pay for indexes it does not store
+        self.__indexes: Optional[FrozenGraphIndexes] = indexes
+
+    @property
+    def name_keys(self) -> DictionaryColumn:
+        if self.__name_keys is None:
+            self.__name_keys = build_name_key_column(self.columns[SCHEMA_PREF_LABEL], self.columns[SCHEMA_AUTHOR])
+        return self.__name_keys
+
+    @property
+    def indexes(self) -> FrozenGraphIndexes:
+        if self.__indexes is None:
+            self.__indexes = FrozenGraphIndexes.build(self.descriptors, self.columns[SCHEMA_PREF_LABEL],
+                                                      self.edge_start, self.edge_end, self.edge_label,
+                                                      self.relation_labels, self.name_keys)
+        return self.__indexes
+
+    @property
+    def descriptor_order(self) -> np.ndarray:
+        return self.indexes.descriptor_order
+
+    @property
+    def label_nodes(self) -> CsrAdjacency:
+        return self.indexes.label_nodes
+
+    @property
+    def name_key_nodes(self) -> CsrAdjacency:
+        return self.indexes.name_key_nodes
+
+    @property
+    def forward(self) -> Dict[str, CsrAdjacency]:
+        return self.indexes.forward
+
+    @property
+    def backward(self) -> Dict[str, CsrAdjacency]:
+        return self.indexes.backward
+
+    @property
+    def synonym_clusters(self) -> SynonymClusters:
+        return self.indexes.synonym_clusters
+
+    @property
+    def hierarchy(self) -> HierarchyIndex:
+        return self.indexes.hierarchy
+
+    @property
+    def prefix_index(self) -> PrefixIndex:
+        return self.indexes.prefix_index
+
+    @property
+    def trigram_index(self) -> TrigramIndex:
+        return self.indexes.trigram_index
+
+    @staticmethod
+    def from_skos_graph(graph: SkosGraph) -> 'FrozenSkosGraph':
+        nodes: List[SkosNode] = graph.nodes
+        descriptors: List[str] = [x.descriptor for x in nodes]
+        id_of: Dict[str, int] = {}
+        for i in range(len(descriptors) - 1, -1, -1):
+            id_of[descriptors[i]] = i
+
+        def get_id(descriptor: str) -> int:
+            i: Optional[int] = id_of.get(descriptor)
+            if i is None:
+                i = len(descriptors)
+                descriptors.append(descriptor)
+                id_of[descriptor] = i
+            return i
+
+        relations: List[SkosRelation] = graph.relations
+        edge_start: np.ndarray = np.fromiter((get_id(x.start_descriptor) for x in relations), dtype=np.int32,
+                                             count=len(relations))
+        edge_end: np.ndarray = np.fromiter((get_id(x.end_descriptor) for x in relations), dtype=np.int32,
+                                           count=len(relations))
+        edge_label: np.ndarray = np.fromiter((x.label_code for x in relations), dtype=np.uint8, count=len(relations))
+
+        columns: Dict[str, DictionaryColumn] = {}
+        schema: str
+        for schema in FROZEN_SCHEMAS:
+            field: str = NODE_SCHEMA_FIELDS[schema]
+            columns[schema] = DictionaryColumn.from_values([getattr(x, field) for x in nodes])
+
+        extra: List[tuple] = [(i, attribute.schema, attribute.literal) for i, node in enumerate(nodes)
+                              if node.extra_attributes is not None for attribute in node.extra_attributes]
+        return FrozenSkosGraph(graph.name, len(nodes), StringColumn.from_strings(descriptors), columns,
+                               edge_start, edge_end, edge_label,
+                               np.array([x[0] for x in extra], dtype=np.int32),
+                               DictionaryColumn.from_values([x[1] for x in extra]),
+                               StringColumn.from_strings([x[2] for x in extra]),
+                               name_keys=DictionaryColumn.from_values([x.get_name_key() for x in nodes]))
+
+    @staticmethod
+    def concatenate(name: str, graphs: List['FrozenSkosGraph']) -> 'FrozenSkosGraph':
+        """
+        One graph of the nodes and relations of all graphs in their order, e.g. of sub-graphs parsed in parallel.
+        Descriptors are shared across the graphs: as in from_skos_graph a relation references the first node of its
+        descriptor and descriptors without a node follow all nodes. Only the descriptors are looked up one by one,
+        the columns and relations are remapped as arrays
+        """
+        local_descriptors: List[List[str]] = [x.descriptors.to_list() for x in graphs]
+        descriptors: List[str] = [x for graph, values in zip(graphs, local_descriptors)
+                                  for x in values[:graph.node_count]]
+        node_count: int = len(descriptors)
+        id_of: Dict[str, int] = {}
+        for i in range(node_count - 1, -1, -1):
+            id_of[descriptors[i]] = i
+
+        def get_id(descriptor: str) -> int:
+            i: Optional[int] = id_of.get(descriptor)
+            if i is None:
+                i = len(descriptors)
+                descriptors.append(descriptor)
+                id_of[descriptor] = i
+            return i
+
+        relation_labels: List[str] = list(RELATION_LABELS)
+        edge_start: List[np.ndarray] = [np.zeros(0, dtype=np.int32)]
+        edge_end: List[np.ndarray] = [np.zeros(0, dtype=np.int32)]
+        edge_label: List[np.ndarray] = [np.zeros(0, dtype=np.uint8)]
+        extra_node: List[np.ndarray] = [np.zeros(0, dtype=np.int32)]
+        node_offset: int = 0
+        graph: FrozenSkosGraph
+        values: List[str]
+        for graph, values in zip(graphs, local_descriptors):
+            id_map: np.ndarray = np.fromiter((get_id(x) for x in values), dtype=np.int32, count=len(values))
+            label_map: List[int] = []
+            label: str
+            for label in graph.relation_labels:
+                if label not in relation_labels:
+                    relation_labels.append(label)
+                label_map.append(relation_labels.index(label))
+            edge_start.append(id_map[graph.edge_start])
+            edge_end.append(id_map[graph.edge_end])
+            edge_label.append(np.array(label_map, dtype=np.uint8)[graph.edge_label])
+            extra_node.append(graph.extra_node + node_offset)
+            node_offset += graph.node_count
+
+        with_extra: List[FrozenSkosGraph] = [x for x in graphs if x.extra_schema is not None]
+        return FrozenSkosGraph(name, node_count, StringColumn.from_strings(descriptors),
+                               {x: DictionaryColumn.concatenate([graph.columns[x] for graph in graphs])
+                                for x in FROZEN_SCHEMAS},
+                               np.concatenate(edge_start), np.concatenate(edge_end), np.concatenate(edge_label),
+                               np.concatenate(extra_node).astype(np.int32),
+                               DictionaryColumn.concatenate([x.extra_schema for x in with_extra]),
+                               StringColumn.concatenate([x.extra_literal for x in with_extra]),
+                               relation_labels, name_keys=DictionaryColumn.concatenate([x.name_keys for x in graphs]))
+
+    def to_skos_graph(self) -> SkosGraph:
+        """
+        The graph as SkosGraph. Nodes and relations are created straight from the columns, every distinct descriptor
+        and literal is decoded once and shared by all nodes and relations using it, and the hash indexes of the
+        SkosGraph are grouped from the id arrays instead of being filled one node and relation at a time
+        """
+        # the nodes, attributes, relations and index lists hold no reference cycles, so the cyclic garbage collector
+        # is paused instead of rescanning the millions of new objects over and over
+        enabled: bool = gc.isenabled()
+        gc.disable()
+        try:
+            return self.__to_skos_graph()
+        finally:
+            if enabled:
+                gc.enable()
+
+    def __to_skos_graph(self) -> SkosGraph:
+        descriptors: List[str] = self.descriptors.to_list()
+        columns: List[List[Optional[str]]] = [self.columns[x].to_list() for x in FROZEN_SCHEMAS]
+        name_keys: List[Optional[str]] = self.name_keys.to_list()
+        extra_attributes: Dict[int, tuple] = self.__get_all_extra_attributes()
+        new_node = SkosNode.__new__
+        nodes: List[SkosNode] = []
+        i: int
+        for i, (pref_label, taxon_status, author, in_scheme, history_note) in enumerate(zip(*columns)):
+            node: SkosNode = new_node(SkosNode)
+            node.descriptor = descriptors[i]
+            node.pref_label = pref_label
+            node.taxon_status = taxon_status
+            node.author = author
+            node.in_scheme = in_scheme
+            node.history_note = history_note
+            node.extra_attributes = extra_attributes.get(i)
+            node.name_key = name_keys[i]
+            nodes.append(node)
+
+        kept: np.ndarray = self.__get_first_symmetric_edges()
+        edge_start: np.ndarray = self.edge_start[kept]
+        edge_end: np.ndarray = self.edge_end[kept]
+        edge_label: np.ndarray = self.edge_label[kept]
+        codes: List[int] = [get_relation_label_code(x) for x in self.relation_labels]
+        new_relation = SkosRelation.__new__
+        relations: List[SkosRelation] = []
+        start: int
+        end: int
+        code: int
+        for start, code, end in zip(edge_start.tolist(), edge_label.tolist(), edge_end.tolist()):
+            relation: SkosRelation = new_relation(SkosRelation)
+            relation.start_descriptor = descriptors[start]
+            relation.label_code = codes[code]
+            relation.end_descriptor = descriptors[end]
+            relations.append(relation)
+
+        labels: DictionaryColumn = self.columns[SCHEMA_PREF_LABEL]
+        has_label: np.ndarray = labels.codes >= 0
+        label_values: List[str] = labels.dictionary.to_list()
+        return SkosGraph.from_indexed(
+            self.name, nodes, relations,
+            _group(nodes, labels.codes[has_label], np.nonzero(has_label)[0], label_values),
+            _group(relations, edge_start, np.arange(len(relations)), descriptors),
+            _group(relations, edge_end, np.arange(len(relations)), descriptors))
+
+    def __get_all_extra_attributes(self) -> Dict[int, tuple]:
+        if len(self.extra_node) == 0:
+            return {}
+        schemas: List[str] = self.extra_schema.to_list()
+        literals: List[str] = self.extra_literal.to_list()
+        extra_attributes: Dict[int, tuple] = {}
+        node: int
+        for node, schema, literal in zip(self.extra_node.tolist(), schemas, literals):
+            extra_attributes[node] = extra_attributes.get(node, ()) + (SkosAttribute(schema, literal),)
+        return extra_attributes
+
+    def __get_first_symmetric_edges(self) -> np.ndarray:
+        """
+        Mask of the edges SkosGraph.add_relation keeps: the first of the relations of a symmetric label between the
+        same two descriptors, in either direction (graph files of former versions may hold both)
+        """
+        kept: np.ndarray = np.ones(len(self.edge_label), dtype=bool)
+        symmetric: List[int] = [i for i, x in enumerate(self.relation_labels) if x in SYMMETRIC_LABELS]
+        code: int
+        for code in symmetric:
+            edges: np.ndarray = np.nonzero(self.edge_label == code)[0]
+            start: np.ndarray = self.edge_start[edges].astype(np.int64)
+            end: np.ndarray = self.edge_end[edges].astype(np.int64)
+            pairs: np.ndarray = np.minimum(start, end) * len(self.descriptors) + np.maximum(start, end)
+            kept[edges] = False
+            kept[edges[np.unique(pairs, return_index=True)[1]]] = True
+        return kept
+
+    # node access
+
+    def get_node_id(self, descriptor: str) -> int:
+        return self.descriptors.find(descriptor, self.descriptor_order)
+
+    def get_node(self, i: int) -> SkosNode:
+        values: List[Optional[str]] = [self.columns[x].get(i) for x in FROZEN_SCHEMAS]
+        return SkosNode.from_fields(self.descriptors.get(i), *values, extra_attributes=self.__get_extra_attributes(i),
+                                    name_key=self.name_keys.get(i))
+
+    def __get_extra_attributes(self, i: int) -> Optional[tuple]:
+        if len(self.extra_node) == 0:
+            return None
+        lo: int = int(np.searchsorted(self.extra_node, i, side="left"))
+        hi: int = int(np.searchsorted(self.extra_node, i, side="right"))
+        if lo == hi:
+            return None
+        return tuple(SkosAttribute(self.extra_schema.get(x), self.extra_literal.get(x)) for x in range(lo, hi))
+
+    def get_pref_label(self, i: int) -> Optional[str]:
+        return self.columns[SCHEMA_PREF_LABEL].get(i)
+
+    def get_node_by_descriptor(self, descriptor: str) -> Optional[SkosNode]:
+        i: int = self.get_node_id(descriptor)
+        return None if i < 0 or i >= self.node_count else self.get_node(i)
+
+    def get_node_ids_by_name(self, name: str) -> np.ndarray:
+        code: int = self.columns[SCHEMA_PREF_LABEL].code_of(name)
+        return self.label_nodes.targets[0:0] if code < 0 else self.label_nodes.get(code)
+
+    def get_node_by_name(self, name: str) -> Optional[SkosNode]:
+        ids: np.ndarray = self.get_node_ids_by_name(name)
+        return None if len(ids) == 0 else self.get_node(int(ids[0]))
+
+    def get_all_nodes_by_name(self, name: str) -> List[SkosNode]:
+        return [self.get_node(int(x)) for x in self.get_node_ids_by_name(name)]
+
+    def get_node_ids_by_name_key(self, name: str) -> np.ndarray:
+        """
+        Ids of the nodes whose name key is the one of name, e.g. "Mentha ×piperita L." finds "mentha x piperita"
+        """
+        key: Optional[str] = get_name_key(name)
+        code: int = -1 if key is None else self.name_keys.code_of(key)
+        return self.name_key_nodes.targets[0:0] if code < 0 else self.name_key_nodes.get(code)
+
+    def get_all_nodes_by_name_key(self, name: str) -> List[SkosNode]:
+        return [self.get_node(int(x)) for x in self.get_node_ids_by_name_key(name)]
+
+    def get_nodes_with_prefix(self, prefix: str, max_result_count: int) -> List[SkosNode]:
+        """
+        Nodes with the shortest prefLabels starting with prefix (ignoring case), ordered by label length
+        """
+        return [self.get_node(x) for x in self.prefix_index.get_node_ids_with_prefix(prefix.lower(), max_result_count)]
+
+    def get_nodes_similar_to(self, name: str, max_result_count: int) -> List[SkosNode]:
+        """
+        Nodes with the prefLabels closest to name (ignoring case), ordered by edit distance and trigram similarity
+        """
+        ids: List[int] = []
+        key: int
+        for key in self.trigram_index.get_similar_key_ids(name.lower(), self.prefix_index.keys, max_result_count):
+            ids += self.prefix_index.key_nodes.get(key).tolist()
+            if len(ids) >= max_result_count:
+                break
+        return [self.get_node(x) for x in ids[:max_result_count]]
+
+    # relation access
+
+    def get_relation(self, i: int) -> SkosRelation:
+        return SkosRelation.from_fields(self.descriptors.get(int(self.edge_start[i])),
+                                        get_relation_label_code(self.relation_labels[int(self.edge_label[i])]),
+                                        self.descriptors.get(int(self.edge_end[i])))
+
+    def __get_adjacent_ids(self, outgoing: bool, descriptor: str, label: str) -> np.ndarray:
+        stored: Optional[str] = DERIVED_LABELS.get(label)
+        if stored is not None:
+            # a derived relation is the stored one of the inverse label in the other direction
+            outgoing = not outgoing
+            label = stored
+        adjacency: Optional[CsrAdjacency] = (self.forward if outgoing else self.backward).get(label)
+        i: int = self.get_node_id(descriptor)
+        if adjacency is None or i < 0:
+            return np.zeros(0, dtype=np.int32)
+        return adjacency.get(i)
+
+    def get_end_descriptors(self, start_descriptor: str, label: str) -> List[str]:
+        return [self.descriptors.get(x) for x in self.__get_adjacent_ids(True, start_descriptor, label)]
+
+    def get_start_descriptors(self, end_descriptor: str, label: str) -> List[str]:
+        return [self.descriptors.get(x) for x in self.__get_adjacent_ids(False, end_descriptor, label)]
+
+    def get_adjacent_descriptors(self, descriptor: str, label: str) -> List[str]:
+        ids: List[int] = self.__get_adjacent_ids(True, descriptor, label).tolist() \
+                         + self.__get_adjacent_ids(False, descriptor, label).tolist()
+        return [self.descriptors.get(x) for x in dict.fromkeys(ids)]
+
+    def __get_relations(self, descriptor: str, outgoing: bool) -> List[SkosRelation]:
+        i: int = self.get_node_id(descriptor)
+        if i < 0:
+            return []
+        relations: List[SkosRelation] = []
+        # the stored labels followed by the labels derived from them, as SkosGraph returns them
+        labels: List[str] = list(self.forward.keys()) + [x for x, y in DERIVED_LABELS.items() if y in self.forward]
+        label: str
+        for label in labels:
+            other: str
+            for other in [self.descriptors.get(x) for x in self.__get_adjacent_ids(outgoing, descriptor, label)]:
+                relations.append(SkosRelation(descriptor, label, other) if outgoing
+                                 else SkosRelation(other, label, descriptor))
+        return relations
+
+    def get_outgoing_relations_with_descriptor(self, start_descriptor: str) -> [SkosRelation]:
+        return self.__get_relations(start_descriptor, True)
+
+    def get_incoming_relations_with_descriptor(self, end_descriptor: str) -> [SkosRelation]:
+        return self.__get_relations(end_descriptor, False)
+
+    def get_related_descriptors(self, descriptor: str, depth: int) -> List[str]:
+        """
+        Descriptors connected to descriptor by 1 to depth synonym relations (see SynonymClusters.get_related_ids)
+        """
+        adjacency: Optional[CsrAdjacency] = self.forward.get(SCHEMA_SYNONYM)
+        if adjacency is None:
+            return []
+        ids: List[int] = self.synonym_clusters.get_related_ids(self.get_node_id(descriptor), depth, adjacency,
+                                                               self.backward[SCHEMA_SYNONYM])
+        return [self.descriptors.get(x) for x in ids]
+
+    def get_hierarchy(self, descriptor: str) -> List[SkosNode]:
+        """
+        Ancestors of descriptor from the nearest to the root, the nodes get_hierarchy_upwards_from walks without
+        the node itself and without nodes sharing the prefLabel of their predecessor
+        """
+        i: int = self.get_node_id(descriptor)
+        if i < 0 or i >= self.node_count:
+            return []
+        return [self.get_node(x) for x in self.hierarchy.get_hierarchy_ids(i)]
+
+    def is_ancestor_of(self, ancestor_descriptor: str, descriptor: str) -> bool:
+        """
+        True if ancestor_descriptor is on the (unfiltered) hierarchy path of descriptor
+        """
+        return self.hierarchy.is_ancestor(self.get_node_id(ancestor_descriptor), self.get_node_id(descriptor))
+
+    def is_parent_of(self, child_descriptor: str, parent_descriptor: str) -> bool:
+        parent: int = self.get_node_id(parent_descriptor)
+        child: int = self.get_node_id(child_descriptor)
+        if parent < 0 or child < 0:
+            return False
+        return any(parent in x.get(child) for x in self.forward.values())
@@ -0,0 +1,343 @@
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import struct
+from typing import Optional, Dict, BinaryIO, Union, List, Iterable
+
+import numpy as np
+
+from graph.columns import StringColumn, DictionaryColumn, CsrAdjacency
+from graph.frozen_skos_graph import FrozenSkosGraph, FrozenGraphIndexes, FROZEN_SCHEMAS
+from graph.hierarchy_index import HierarchyIndex
+from graph.prefix_index import PrefixIndex
+from graph.skos_graph import SkosGraph
+from graph.synonym_clusters import SynonymClusters
+from graph.trigram_index import TrigramIndex
+
+# Binary graph file layout (all numbers little endian):
+#   preamble  magic (8 bytes), format version (uint32), reserved (uint32), header offset (uint64), header length (uint64)
+#   sections  raw arrays, each starting at a multiple of SECTION_ALIGNMENT
+#   header    utf-8 JSON with the graph name, node count, relation labels, the table of sections
+#             (name -> offset, dtype, length) and a content hash over the header fields and all sections
+# The header is written last, so sections can be streamed into the file without knowing their sizes upfront.
+# The same layout stores the indexes of a graph in an index file next to it (content "indexes" in the header),
+# which records the content hash of the graph it was built from.
+
+MAGIC: bytes = b"SKOSGRPH"
+FORMAT_VERSION: int = 1
+# version of the index file content, index files of another version are rebuilt
+INDEX_VERSION: int = 7
+SECTION_ALIGNMENT: int = 64
+_PREAMBLE = struct.Struct("<8sIIQQ")
+
+
+class GraphFileWriter:
+    """
+    Writes named, typed array sections and a JSON header into a binary graph file
+    """
+
+    def __init__(self, file_path: str):
+        self.file: BinaryIO = open(file_path, "wb")
+        self.file.write(b"\0" * _PREAMBLE.size)
+        self.sections: Dict[str, dict] = {}
+        self.hash = hashlib.blake2b(digest_size=16)
+
+    def __align(self):
+        padding: int = -self.file.tell() % SECTION_ALIGNMENT
+        self.file.write(b"\0" * padding)
+
+    def write_array(self, name: str, array: np.ndarray):
+        self.write_chunks(name, array.dtype, [array])
+
+    def write_chunks(self, name: str, dtype: np.dtype, chunks: Iterable[np.ndarray]):
+        """
+        Writes one section from consecutive chunks of the array, so sections larger than memory can be streamed into
+        the file. The file and its content hash are the same as of write_array with the concatenated chunks
+        """
+        dtype = np.dtype(dtype).newbyteorder("<")
+        self.__align()
+        offset: int = self.file.tell()
+        length: int = 0
+        self.hash.update((name + ":" + dtype.str + ":").encode("utf-8"))
+        chunk: np.ndarray
+        for chunk in chunks:
+            chunk = np.ascontiguousarray(chunk, dtype=dtype)
+            self.file.write(chunk.data)
+            self.hash.update(chunk.data)
+            length += len(chunk)
+        self.sections[name] = {"offset": offset, "dtype": dtype.str, "length": length}
+
+    def write_bytes(self, name: str, data: Union[bytes, memoryview]):
+        self.write_array(name, np.frombuffer(data, dtype=np.uint8))
+
+    def write_string_column(self, name: str, column: StringColumn):
+        self.write_array(name + ".offsets", column.offsets)
+        self.write_bytes(name + ".data", column.get_buffer())
+
+    def write_dictionary_column(self, name: str, column: DictionaryColumn):
+        self.write_array(name + ".codes", column.codes)
+        self.write_string_column(name + ".dictionary", column.dictionary)
+
+    def write_csr_adjacency(self, name: str, adjacency: CsrAdjacency):
+        self.write_array(name + ".offsets", adjacency.offsets)
+        self.write_array(name + ".targets", adjacency.targets)
+
+    def close(self, header: dict) -> str:
+        """
+        Writes the header and returns the content hash of the file
+        """
+        header = dict(header)
+        self.hash.update(json.dumps(header, sort_keys=True).encode("utf-8"))
+        header["content_hash"] = self.hash.hexdigest()
+        header["sections"] = self.sections
+        encoded: bytes = json.dumps(header).encode("utf-8")
+        self.__align()
+        header_offset: int = self.file.tell()
+        self.file.write(encoded)
+        self.file.seek(0)
+        self.file.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, header_offset, len(encoded)))
+        self.file.close()
+        return header["content_hash"]
+
+
+class GraphFileReader:
+    """
+    Reads the header and the array sections of a binary graph file with one bulk read per section.
+    Memory mapped, sections are read only views into the file instead, so processes mapping the same file
+    share one copy of it in the page cache
+    """
+
+    def __init__(self, file_path: str, use_mmap: bool = False):
+        self.file: BinaryIO = open(file_path, "rb")
+        magic, version, _, header_offset, header_length = _PREAMBLE.unpack(self.file.read(_PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(file_path + " is not a binary graph file")
+        if version > FORMAT_VERSION:
+            raise ValueError(file_path + " has graph file version " + str(version) + ", supported up to "
+                             + str(FORMAT_VERSION))
+        self.version: int = version
+        self.file.seek(header_offset)
+        self.header: dict = json.loads(self.file.read(header_length).decode("utf-8"))
+        self.sections: Dict[str, dict] = self.header["sections"]
+        # the map stays open as long as arrays or columns reference it
+        self.buffer: Optional[mmap.mmap] = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if use_mmap else None
+
+    def get_content_hash(self) -> str:
+        content_hash: Optional[str] = self.header.get("content_hash")
+        if content_hash is None:
+            # files written before content hashes were stored, the whole file is hashed instead
+            file_hash = hashlib.blake2b(digest_size=16)
+            self.file.seek(0)
+            chunk: bytes = self.file.read(1 << 20)
+            while len(chunk) > 0:
+                file_hash.update(chunk)
+                chunk = self.file.read(1 << 20)
+            content_hash = file_hash.hexdigest()
+            self.header["content_hash"] = content_hash
+        return content_hash
+
+    def has_section(self, name: str) -> bool:
+        return name in self.sections
+
+    def read_array(self, name: str) -> np.ndarray:
+        section: dict = self.sections[name]
+        if self.buffer is not None:
+            return np.frombuffer(self.buffer, dtype=np.dtype(section["dtype"]), count=section["length"],
+                                 offset=section["offset"])
+        self.file.seek(section["offset"])
+        return np.fromfile(self.file, dtype=np.dtype(section["dtype"]), count=section["length"])
+
+    def read_bytes(self, name: str) -> bytes:
+        section: dict = self.sections[name]
+        self.file.seek(section["offset"])
+        return self.file.read(section["length"])
+
+    def read_string_column(self, name: str) -> StringColumn:
+        if self.buffer is not None:
+            return StringColumn(self.read_array(name + ".offsets"), self.buffer, self.sections[name + ".data"]["offset"])
+        return StringColumn(self.read_array(name + ".offsets"), self.read_bytes(name + ".data"))
+
+    def read_dictionary_column(self, name: str) -> DictionaryColumn:
+        return DictionaryColumn(self.read_array(name + ".codes"), self.read_string_column(name + ".dictionary"))
+
+    def read_csr_adjacency(self, name: str) -> CsrAdjacency:
+        return CsrAdjacency(self.read_array(name + ".offsets"), self.read_array(name + ".targets"))
+
+    def close(self):
+        self.file.close()
+
+
+def is_graph_file(file_path: str) -> bool:
+    with open(file_path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_graph_file(graph: Union[SkosGraph, FrozenSkosGraph], file_path: str, with_indexes: bool = False,
+                     header: Optional[dict] = None) -> str:
+    """
+    Writes the graph and, if requested, its index file and returns the content hash of the graph file. The entries of
+    header are added to the header of the file (e.g. the sources of a partition, see incremental_merge)
+    """
+    frozen: FrozenSkosGraph = graph if isinstance(graph, FrozenSkosGraph) else FrozenSkosGraph.from_skos_graph(graph)
+    writer: GraphFileWriter = GraphFileWriter(file_path)
+    writer.write_string_column("descriptors", frozen.descriptors)
+    schema: str
+    for schema in FROZEN_SCHEMAS:
+        writer.write_dictionary_column("columns." + schema, frozen.columns[schema])
+    writer.write_dictionary_column("name_keys", frozen.name_keys)
+    writer.write_array("edges.start", frozen.edge_start)
+    writer.write_array("edges.end", frozen.edge_end)
+    writer.write_array("edges.label", frozen.edge_label)
+    writer.write_array("extra.node", frozen.extra_node)
+    writer.write_dictionary_column("extra.schema", frozen.extra_schema)
+    writer.write_string_column("extra.literal", frozen.extra_literal)
+    content_hash: str = writer.close(dict(header or {}, **{
+        "content": "graph",
+        "name": frozen.name,
+        "node_count": frozen.node_count,
+        "relation_labels": frozen.relation_labels
+    }))
+    if with_indexes:
+        write_index_file(frozen, get_index_file_path(file_path), content_hash)
+    return content_hash
+
+
+def read_graph_file(file_path: str, use_mmap: bool = False) -> FrozenSkosGraph:
+    reader: GraphFileReader = GraphFileReader(file_path, use_mmap)
+    try:
+        return __read_graph(reader)
+    finally:
+        reader.close()
+
+
+def __read_graph(reader: GraphFileReader, indexes: Optional[FrozenGraphIndexes] = None) -> FrozenSkosGraph:
+    columns: Dict[str, DictionaryColumn] = {x: reader.read_dictionary_column("columns." + x) for x in FROZEN_SCHEMAS}
+    return FrozenSkosGraph(reader.header["name"], reader.header["node_count"],
+                           reader.read_string_column("descriptors"), columns,
+                           reader.read_array("edges.start"), reader.read_array("edges.end"),
+                           reader.read_array("edges.label"), reader.read_array("extra.node"),
+                           reader.read_dictionary_column("extra.schema"),
+                           reader.read_string_column("extra.literal"),
+                           reader.header["relation_labels"], indexes,
+                           reader.read_dictionary_column("name_keys") if reader.has_section("name_keys.codes") else None)
+
+
+def get_index_file_path(graph_file_path: str) -> str:
+    return graph_file_path + ".idx"
+
+
+def write_index_file(graph: FrozenSkosGraph, file_path: str, graph_hash: str):
+    # written to a temporary file first, so workers starting at the same time never map a partial index file
+    temp_path: str = file_path + "." + str(os.getpid()) + ".tmp"
+    writer: GraphFileWriter = GraphFileWriter(temp_path)
+    indexes: FrozenGraphIndexes = graph.indexes
+    writer.write_array("descriptor_order", indexes.descriptor_order)
+    writer.write_csr_adjacency("label_nodes", indexes.label_nodes)
+    writer.write_csr_adjacency("name_key_nodes", indexes.name_key_nodes)
+    label: str
+    for label in indexes.forward.keys():
+        writer.write_csr_adjacency("forward." + label, indexes.forward[label])
+        writer.write_csr_adjacency("backward." + label, indexes.backward[label])
+    clusters: SynonymClusters = indexes.synonym_clusters
+    writer.write_array("synonyms.cluster_of", clusters.cluster_of)
+    writer.write_csr_adjacency("synonyms.members", clusters.members)
+    writer.write_array("synonyms.distance_offsets", clusters.distance_offsets)
+    writer.write_array("synonyms.distances", clusters.distances)
+    hierarchy: HierarchyIndex = indexes.hierarchy
+    writer.write_array("hierarchy.parent", hierarchy.parent)
+    writer.write_array("hierarchy.up", hierarchy.up)
+    writer.write_array("hierarchy.ancestor_count", hierarchy.ancestor_count)
+    writer.write_array("hierarchy.enter", hierarchy.enter)
+    writer.write_array("hierarchy.leave", hierarchy.leave)
+    writer.write_string_column("prefix.keys", indexes.prefix_index.keys)
+    writer.write_array("prefix.length_offsets", indexes.prefix_index.length_offsets)
+    writer.write_csr_adjacency("prefix.key_nodes", indexes.prefix_index.key_nodes)
+    writer.write_array("trigrams.codes", indexes.trigram_index.codes)
+    writer.write_csr_adjacency("trigrams.postings", indexes.trigram_index.postings)
+    writer.write_array("trigrams.key_trigram_counts", indexes.trigram_index.key_trigram_counts)
+    writer.close({
+        "content": "indexes",
+        "index_version": INDEX_VERSION,
+        "relation_labels": list(indexes.forward.keys()),
+        "graph_hash": graph_hash
+    })
+    os.replace(temp_path, file_path)
+
+
+def read_index_file(file_path: str, use_mmap: bool = False) -> FrozenGraphIndexes:
+    reader: GraphFileReader = GraphFileReader(file_path, use_mmap)
+    try:
+        if reader.header.get("content") != "indexes":
+            raise ValueError(file_path + " is not an index file")
+        labels: List[str] = reader.header["relation_labels"]
+        clusters: SynonymClusters = SynonymClusters(reader.read_array("synonyms.cluster_of"),
+                                                    reader.read_csr_adjacency("synonyms.members"),
+                                                    reader.read_array("synonyms.distance_offsets"),
+                                                    reader.read_array("synonyms.distances"))
+        hierarchy: HierarchyIndex = HierarchyIndex(reader.read_array("hierarchy.parent"),
+                                                   reader.read_array("hierarchy.up"),
+                                                   reader.read_array("hierarchy.ancestor_count"),
+                                                   reader.read_array("hierarchy.enter"),
+                                                   reader.read_array("hierarchy.leave"))
+        prefix_index: PrefixIndex = PrefixIndex(reader.read_string_column("prefix.keys"),
+                                                reader.read_array("prefix.length_offsets"),
+                                                reader.read_csr_adjacency("prefix.key_nodes"))
+        trigram_index: TrigramIndex = TrigramIndex(reader.read_array("trigrams.codes"),
+                                                   reader.read_csr_adjacency("trigrams.postings"),
+                                                   reader.read_array("trigrams.key_trigram_counts"))
+        return FrozenGraphIndexes(reader.read_array("descriptor_order"), reader.read_csr_adjacency("label_nodes"),
+                                  {x: reader.read_csr_adjacency("forward." + x) for x in labels},
+                                  {x: reader.read_csr_adjacency("backward." + x) for x in labels}, clusters, hierarchy,
+                                  prefix_index, trigram_index, reader.read_csr_adjacency("name_key_nodes"))
+    finally:
+        reader.close()
+
+
+def __is_index_file_of(index_file_path: str, graph_reader: GraphFileReader) -> bool:
+    if not os.path.exists(index_file_path):
+        return False
+    try:
+        reader: GraphFileReader = GraphFileReader(index_file_path)
+    except (OSError, ValueError, struct.error):
+        return False
+    reader.close()
+    return reader.header.get("content") == "indexes" and reader.header.get("index_version") == INDEX_VERSION \
+        and reader.header.get("graph_hash") == graph_reader.get_content_hash()
+
+
+def open_graph_file(file_path: str) -> FrozenSkosGraph:
+    """
+    Opens a binary graph file and its index file memory mapped, so all server processes on a host share one copy.
+    The index file is only rebuilt (and written next to the graph file) if it is missing or was built from
+    a graph with another content hash
+    """
+    index_file_path: str = get_index_file_path(file_path)
+    reader: GraphFileReader = GraphFileReader(file_path, use_mmap=True)
+    try:
+        if not __is_index_file_of(index_file_path, reader):
+            graph: FrozenSkosGraph = __read_graph(reader)
+            print("Building index file " + index_file_path)
+            try:
+                write_index_file(graph, index_file_path, reader.get_content_hash())
+            except OSError:
+                print("Could not write index file " + index_file_path + ", using private indexes")
+                return graph
+        return __read_graph(reader, read_index_file(index_file_path, use_mmap=True))
+    finally:
+        reader.close()
+
+
+def read_pickle_graph_file(file_path: str) -> SkosGraph:
+    with open(file_path, "rb") as f:
+        return pickle.loads(f.read())
+
+
+def convert_pickle_graph_file(source_path: str, target_path: Optional[str] = None):
+    """
+    Converts a graph pickled by former versions into the binary graph format, in place if no target is given
+    """
+    graph: SkosGraph = read_pickle_graph_file(source_path)
+    write_graph_file(graph, source_path if target_path is None else target_path)
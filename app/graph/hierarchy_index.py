@@ -0,0 +1,115 @@
+from typing import List
+
+import numpy as np
+
+from graph.columns import CsrAdjacency
+
+# as the former relation walk, hierarchies with more ancestors are treated as cyclic and left empty
+MAX_HIERARCHY_DEPTH: int = 26
+
+
+def _first_targets(adjacency: CsrAdjacency) -> np.ndarray:
+    first: np.ndarray = np.full(len(adjacency.offsets) - 1, -1, dtype=np.int32)
+    has_target: np.ndarray = adjacency.offsets[1:] > adjacency.offsets[:-1]
+    first[has_target] = adjacency.targets[adjacency.offsets[:-1][has_target]]
+    return first
+
+
+class HierarchyIndex:
+    """
+    Parent pointers of the hierarchy walk (the first broader node, otherwise the first synonym) per descriptor id.
+    ancestor_count is the number of ancestors (-1 for cyclic or too deep hierarchies), up points to the next ancestor
+    with another prefLabel than its predecessor on the path, so a hierarchy without duplicates is one walk along up.
+    enter and leave are the positions of a depth first traversal of the parent pointer forest: a is an ancestor of b
+    if enter[a] < enter[b] and leave[b] <= leave[a]
+    """
+
+    def __init__(self, parent: np.ndarray, up: np.ndarray, ancestor_count: np.ndarray, enter: np.ndarray,
+                 leave: np.ndarray):
+        self.parent: np.ndarray = parent
+        self.up: np.ndarray = up
+        self.ancestor_count: np.ndarray = ancestor_count
+        self.enter: np.ndarray = enter
+        self.leave: np.ndarray = leave
+
+    @staticmethod
+    def build(node_count: int, label_codes: np.ndarray, broader: CsrAdjacency, synonyms: CsrAdjacency) \
+            -> 'HierarchyIndex':
+        """
+        broader maps a descriptor id to the ends of its outgoing broader relations, synonyms to the ends of its
+        outgoing synonym relations, both in the order the relations were added
+        """
+        descriptor_count: int = len(broader.offsets) - 1
+        parent: np.ndarray = _first_targets(broader)
+        synonym: np.ndarray = _first_targets(synonyms)
+        parent = np.where(parent >= 0, parent, synonym)
+        # descriptors only referenced by relations have no node, so the walk ends with them
+        parent[node_count:] = -1
+
+        ancestor_count: np.ndarray = np.zeros(descriptor_count, dtype=np.int32)
+        current: np.ndarray = parent.copy()
+        for _ in range(0, MAX_HIERARCHY_DEPTH + 1):
+            walking: np.ndarray = current >= 0
+            ancestor_count[walking] += 1
+            current[walking] = parent[current[walking]]
+        ancestor_count[ancestor_count > MAX_HIERARCHY_DEPTH] = -1
+
+        # an ancestor stays in a hierarchy if its prefLabel differs from the one of its predecessor,
+        # two missing labels count as equal
+        labels: np.ndarray = np.full(descriptor_count, -1, dtype=np.int64)
+        labels[0:node_count] = label_codes
+        has_parent: np.ndarray = parent >= 0
+        kept: np.ndarray = np.zeros(descriptor_count, dtype=bool)
+        kept[has_parent] = (parent[has_parent] < node_count) & (labels[has_parent] != labels[parent[has_parent]])
+        up: np.ndarray = np.full(descriptor_count, -1, dtype=np.int32)
+        level: int
+        for level in range(1, MAX_HIERARCHY_DEPTH + 1):
+            ids: np.ndarray = np.nonzero(ancestor_count == level)[0]
+            up[ids] = np.where(kept[ids], parent[ids], up[parent[ids]])
+
+        enter, leave = HierarchyIndex.__traverse(parent, ancestor_count)
+        return HierarchyIndex(parent, up, ancestor_count, enter, leave)
+
+    @staticmethod
+    def __traverse(parent: np.ndarray, ancestor_count: np.ndarray) -> tuple:
+        descriptor_count: int = len(parent)
+        valid: np.ndarray = np.nonzero(ancestor_count > 0)[0]
+        children: CsrAdjacency = CsrAdjacency.from_pairs(parent[valid], valid, descriptor_count)
+        child_offsets: List[int] = children.offsets.tolist()
+        child_ids: List[int] = children.targets.tolist()
+        enter: List[int] = [-1] * descriptor_count
+        leave: List[int] = [-1] * descriptor_count
+        position: int = 0
+        root: int
+        for root in np.nonzero(ancestor_count == 0)[0].tolist():
+            # iterative depth first traversal, a node is left after all of its descendants were entered
+            stack: List[tuple] = [(root, False)]
+            while len(stack) > 0:
+                i, done = stack.pop()
+                if done:
+                    leave[i] = position
+                    continue
+                enter[i] = position
+                position += 1
+                stack.append((i, True))
+                stack.extend((x, False) for x in reversed(child_ids[child_offsets[i]:child_offsets[i + 1]]))
+        return np.array(enter, dtype=np.int32), np.array(leave, dtype=np.int32)
+
+    def get_hierarchy_ids(self, i: int) -> List[int]:
+        """
+        Ancestors of i from the nearest to the root, without i itself and without an ancestor sharing the prefLabel
+        of its predecessor on the path
+        """
+        if i < 0 or i >= len(self.parent) or self.ancestor_count[i] < 0:
+            return []
+        result: List[int] = []
+        current: int = int(self.up[i])
+        while current >= 0:
+            result.append(current)
+            current = int(self.up[current])
+        return result
+
+    def is_ancestor(self, ancestor: int, i: int) -> bool:
+        if ancestor < 0 or i < 0 or self.enter[ancestor] < 0 or self.enter[i] < 0:
+            return False
+        return bool(self.enter[ancestor] < self.enter[i] and self.leave[i] <= self.leave[ancestor])
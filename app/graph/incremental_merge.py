@@ -0,0 +1,167 @@
+import os
+import struct
+from typing import List, Optional, Tuple, Dict
+
+import numpy as np
+
+from graph.columns import CsrAdjacency
+from graph.frozen_skos_graph import FrozenSkosGraph
+from graph.graph_file import GraphFileReader, read_graph_file, write_graph_file
+from graph.instrumentation import stage, Stage
+from graph.skos_graph import SkosGraph, SkosNode, SkosRelation, SCHEMA_HISTORY_NOTE, SCHEMA_SYNONYM
+
+# partition files are kept next to the merged graph, <target>.partitions/<source name>.graph
+PARTITIONS_SUFFIX: str = ".partitions"
+
+
+class _EarlierNames:
+    """
+    The nodes of the partitions of the earlier sources by name key: per partition the codes of its name keys and the
+    nodes of each code as CSR adjacency, built from the arrays of the partition files without decoding their nodes
+    """
+
+    def __init__(self, partitions: List[FrozenSkosGraph]):
+        self.partitions: List[FrozenSkosGraph] = partitions
+        self.key_nodes: List[CsrAdjacency] = []
+        partition: FrozenSkosGraph
+        for partition in partitions:
+            codes: np.ndarray = partition.name_keys.codes
+            has_key: np.ndarray = codes >= 0
+            self.key_nodes.append(CsrAdjacency.from_pairs(codes[has_key], np.nonzero(has_key)[0],
+                                                          len(partition.name_keys.dictionary)))
+
+    def get_descriptors(self, key: str) -> List[str]:
+        """
+        Descriptors of the earlier nodes with the name key, in the order of the merged graph
+        """
+        descriptors: List[str] = []
+        partition: FrozenSkosGraph
+        key_nodes: CsrAdjacency
+        for partition, key_nodes in zip(self.partitions, self.key_nodes):
+            code: int = partition.name_keys.code_of(key)
+            if code >= 0:
+                descriptors += [partition.descriptors.get(x) for x in key_nodes.get(code).tolist()]
+        return descriptors
+
+
+def get_partition_path(target_path: str, source_name: str) -> str:
+    return os.path.join(target_path + PARTITIONS_SUFFIX, source_name + ".graph")
+
+
+def build_partition(source: SkosGraph, source_name: str, earlier: List[FrozenSkosGraph]) -> SkosGraph:
+    """
+    The part of the merged graph contributed by one source, as in merge_graphs: its nodes with the source name as
+    history note, the synonym relations from its nodes to the nodes of the earlier partitions with the same name key
+    and its own relations
+    """
+    partition: SkosGraph = SkosGraph(source_name)
+    names: _EarlierNames = _EarlierNames(earlier)
+    matches: Dict[str, List[str]] = {}
+    node: SkosNode
+    for node in source.nodes:
+        node.add_attribute(SCHEMA_HISTORY_NOTE, source_name)
+        partition.add_node(node)
+    for node in source.nodes:
+        key: Optional[str] = node.get_name_key()
+        if key is None:
+            continue
+        descriptors: Optional[List[str]] = matches.get(key)
+        if descriptors is None:
+            descriptors = names.get_descriptors(key)
+            matches[key] = descriptors
+        end: str
+        for end in descriptors:
+            partition.add_synonym_relation(node.descriptor, end)
+    relation: SkosRelation
+    for relation in source.relations:
+        partition.add_relation(relation)
+    return partition
+
+
+def concatenate_partitions(name: str, partitions: List[FrozenSkosGraph]) -> FrozenSkosGraph:
+    """
+    The merged graph of the partitions. Each partition holds every synonym relation once, a pair of descriptors
+    repeated across partitions keeps its first synonym relation as in SkosGraph.add_relation
+    """
+    merged: FrozenSkosGraph = FrozenSkosGraph.concatenate(name, partitions)
+    synonym_code: int = merged.relation_labels.index(SCHEMA_SYNONYM)
+    synonyms: np.ndarray = np.nonzero(merged.edge_label == synonym_code)[0]
+    start: np.ndarray = merged.edge_start[synonyms].astype(np.int64)
+    end: np.ndarray = merged.edge_end[synonyms].astype(np.int64)
+    pairs: np.ndarray = np.minimum(start, end) * len(merged.descriptors) + np.maximum(start, end)
+    first: np.ndarray = np.unique(pairs, return_index=True)[1]
+    if len(first) == len(synonyms):
+        return merged
+    kept: np.ndarray = np.ones(len(merged.edge_label), dtype=bool)
+    kept[synonyms] = False
+    kept[synonyms[first]] = True
+    return FrozenSkosGraph(name, merged.node_count, merged.descriptors, merged.columns, merged.edge_start[kept],
+                           merged.edge_end[kept], merged.edge_label[kept], merged.extra_node, merged.extra_schema,
+                           merged.extra_literal, merged.relation_labels, name_keys=merged.name_keys)
+
+
+def _read_header(file_path: str) -> Optional[dict]:
+    """
+    Header of a graph file, None if it is missing or unreadable (e.g. left partially written by an aborted run)
+    """
+    if not os.path.exists(file_path):
+        return None
+    try:
+        reader: GraphFileReader = GraphFileReader(file_path)
+    except (OSError, ValueError, struct.error):
+        return None
+    reader.close()
+    return reader.header
+
+
+def merge_graph_files_incremental(source_paths: List[str], target_path: str,
+                                  source_names: Optional[List[str]] = None, with_indexes: bool = False) -> List[str]:
+    """
+    merge_graphs of the graph files, kept as one partition file per source next to the target. A partition records
+    the content hashes of its source and of all earlier sources (whose nodes its synonym relations point to) and is
+    only rebuilt if one of them changed, so after a change of the last source only that source is parsed into nodes,
+    matched and written again. The other partitions are read and concatenated as arrays. The merged graph has the
+    nodes and relations of merge_graphs, only descriptors without a node may be ordered differently. Returns the
+    names of the rebuilt partitions, the target is not written again if none was rebuilt and it is up to date.
+    Without with_indexes the index file is built by the web application on first start, as after merge_graph_files
+    """
+    if source_names is None:
+        source_names = [os.path.basename(x).replace(".graph", "") for x in source_paths]
+    os.makedirs(target_path + PARTITIONS_SUFFIX, exist_ok=True)
+    sources: List[Tuple[str, str]] = []
+    partitions: List[FrozenSkosGraph] = []
+    partition_hashes: List[str] = []
+    rebuilt: List[str] = []
+    source_path: str
+    source_name: str
+    for source_path, source_name in zip(source_paths, source_names):
+        reader: GraphFileReader = GraphFileReader(source_path)
+        sources.append((source_name, reader.get_content_hash()))
+        reader.close()
+        partition_path: str = get_partition_path(target_path, source_name)
+        header: Optional[dict] = _read_header(partition_path)
+        current: Stage
+        with stage(source_name, unit="nodes") as current:
+            if header is not None and [tuple(x) for x in header.get("sources", [])] == sources:
+                with stage("reading"):
+                    partition: FrozenSkosGraph = read_graph_file(partition_path)
+                partition_hashes.append(header["content_hash"])
+            else:
+                with stage("rebuilding"):
+                    source: SkosGraph = read_graph_file(source_path).to_skos_graph()
+                    partition = FrozenSkosGraph.from_skos_graph(build_partition(source, source_name, partitions))
+                with stage("writing"):
+                    partition_hashes.append(write_graph_file(partition, partition_path, header={"sources": sources}))
+                rebuilt.append(source_name)
+            partitions.append(partition)
+            current.count(partition.node_count)
+            current.add_count("relations", len(partition.edge_label))
+
+    target_header: Optional[dict] = _read_header(target_path)
+    if len(rebuilt) == 0 and target_header is not None and target_header.get("partitions") == partition_hashes:
+        return rebuilt
+    with stage("assembling", sum(x.node_count for x in partitions), "nodes"):
+        merged: FrozenSkosGraph = concatenate_partitions("merged graph", partitions)
+    with stage("writing", merged.node_count, "nodes"):
+        write_graph_file(merged, target_path, with_indexes, header={"partitions": partition_hashes})
+    return rebuilt
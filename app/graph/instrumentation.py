@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import platform
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import List, Optional, Iterator, Dict, Tuple
+
+# progress of a stage is logged at most once per interval (seconds)
+PROGRESS_INTERVAL: float = 5.0
+TOP_ALLOCATIONS: int = 10
+
+log = logging.getLogger("Instrumentation")
+
+
+def get_rss_mib() -> float:
+    """
+    Current resident set size, 0 where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def get_peak_rss_mib() -> float:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if platform.system() == "Darwin" else peak / (1 << 10)
+
+
+class Stage:
+    """
+    One timed stage of a run: wall time, the number of items (rows, nodes, ...) it processed, the RSS at its end,
+    the peak RSS of the process so far and, while tracemalloc traces, the traced peak and the lines which allocated
+    most during the stage. The traced peak is process wide, so it is left out for stages which overlapped stages of
+    other threads
+    """
+
+    def __init__(self, name: str, items: int = 0, unit: str = "items"):
+        self.name: str = name
+        self.items: int = items
+        self.unit: str = unit
+        self.counts: Dict[str, int] = {}
+        self.start: float = time.perf_counter()
+        self.wall: float = 0
+        self.rss_mib: float = 0
+        self.peak_rss_mib: float = 0
+        self.traced_peak_mib: Optional[float] = None
+        self.top_allocations: List[dict] = []
+        self.parallel: bool = False
+        self.__last_progress: float = self.start
+        # the traced peaks of the intervals between the resets of the peak by the stages started meanwhile
+        self.__traced_peak: int = 0
+        self.__snapshot: Optional[tracemalloc.Snapshot] = None
+        if tracemalloc.is_tracing():
+            self.__snapshot = tracemalloc.take_snapshot()
+
+    def count(self, items: int, unit: Optional[str] = None):
+        self.items += items
+        if unit is not None:
+            self.unit = unit
+
+    def add_count(self, name: str, value: int):
+        """
+        Further sizes of the stage, e.g. the relations besides the nodes
+        """
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def progress(self, done: int, total: Optional[int] = None):
+        """
+        Logs the progress of a long stage, at most once per PROGRESS_INTERVAL
+        """
+        now: float = time.perf_counter()
+        if now - self.__last_progress < PROGRESS_INTERVAL:
+            return
+        self.__last_progress = now
+        rate: float = done / max(now - self.start, 1e-9)
+        if total:
+            log.info("%s: %d/%d %s (%.0f%%, %.0f/s, RSS %.0f MiB)", self.name, done, total, self.unit,
+                     100 * done / total, rate, get_rss_mib())
+        else:
+            log.info("%s: %d %s (%.0f/s, RSS %.0f MiB)", self.name, done, self.unit, rate, get_rss_mib())
+
+    def add_traced_peak(self, peak: int):
+        self.__traced_peak = max(self.__traced_peak, peak)
+
+    def finish(self):
+        """
+        Records the sizes at the end of the stage, the traced peak has to be added before
+        """
+        self.wall = time.perf_counter() - self.start
+        self.rss_mib = get_rss_mib()
+        self.peak_rss_mib = get_peak_rss_mib()
+        if self.parallel:
+            self.__snapshot = None
+        if self.__snapshot is not None and tracemalloc.is_tracing():
+            self.traced_peak_mib = self.__traced_peak / (1 << 20)
+            statistics = tracemalloc.take_snapshot().compare_to(self.__snapshot, "lineno")
+            self.top_allocations = [{"where": str(x.traceback), "size_kib": round(x.size_diff / 1024, 1),
+                                     "count": x.count_diff} for x in statistics[:TOP_ALLOCATIONS]]
+            self.__snapshot = None
+
+    def get_rate(self) -> float:
+        return self.items / self.wall if self.wall > 0 else 0
+
+    def to_dict(self) -> dict:
+        result: dict = {"name": self.name, "wall": round(self.wall, 3), "items": self.items, "unit": self.unit,
+                        "per_second": round(self.get_rate(), 1), "rss_mib": round(self.rss_mib, 1),
+                        "peak_rss_mib": round(self.peak_rss_mib, 1)}
+        if len(self.counts) > 0:
+            result["counts"] = self.counts
+        if self.traced_peak_mib is not None:
+            result["traced_peak_mib"] = round(self.traced_peak_mib, 1)
+            result["top_allocations"] = self.top_allocations
+        return result
+
+
+class RunReport:
+    """
+    The stages of one run (parse, merge or export) in the order they were started. Stages started inside another
+    stage of the same thread are named parent/child. Stages of worker processes are sent back as dicts and added
+    with add_stages.
+    tracemalloc keeps one peak per process. Before a stage resets it on start, and when a stage finishes, the peak
+    reached so far is added to all open stages, so the peak of a stage includes the peaks of the stages nested in it
+    """
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.started: float = time.time()
+        self.start: float = time.perf_counter()
+        self.stages: List[dict] = []
+        self.__lock: threading.Lock = threading.Lock()
+        self.__local: threading.local = threading.local()
+        # the open stages of all threads with the ident of their thread
+        self.__open: List[Tuple[int, Stage]] = []
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0, unit: str = "items") -> Iterator[Stage]:
+        parents: List[str] = self.__get_parents()
+        current: Stage = Stage("/".join(parents + [name]), items, unit)
+        log.info("%s...", current.name)
+        thread: int = threading.get_ident()
+        with self.__lock:
+            # reserved at the start, so the stages keep the order in which they were started
+            position: int = len(self.stages)
+            self.stages.append({})
+            other: Stage
+            for other in [x for t, x in self.__open if t != thread]:
+                other.parallel = True
+                current.parallel = True
+            self.__add_traced_peak()
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            self.__open.append((thread, current))
+        parents.append(name)
+        try:
+            yield current
+        finally:
+            parents.pop()
+            with self.__lock:
+                self.__add_traced_peak()
+                self.__open.remove((thread, current))
+                current.finish()
+                self.stages[position] = current.to_dict()
+            throughput: str = "" if current.items == 0 else \
+                ", %d %s (%.0f/s)" % (current.items, current.unit, current.get_rate())
+            log.info("%s: %.2fs%s, RSS %.0f MiB, peak %.0f MiB", current.name, current.wall, throughput,
+                     current.rss_mib, current.peak_rss_mib)
+
+    def add_stages(self, stages: List[dict], prefix: str = ""):
+        with self.__lock:
+            self.stages += [dict(x, name=prefix + x["name"]) for x in stages]
+
+    def to_dict(self) -> dict:
+        with self.__lock:
+            stages: List[dict] = list(self.stages)
+        return {"name": self.name, "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "wall": round(time.perf_counter() - self.start, 3), "peak_rss_mib": round(get_peak_rss_mib(), 1),
+                "python": platform.python_version(), "tracemalloc": tracemalloc.is_tracing(), "stages": stages}
+
+    def write(self, file_path: str):
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        log.info("Run report written to %s", file_path)
+
+    def __add_traced_peak(self):
+        if tracemalloc.is_tracing():
+            peak: int = tracemalloc.get_traced_memory()[1]
+            for _, current in self.__open:
+                current.add_traced_peak(peak)
+
+    def __get_parents(self) -> List[str]:
+        parents: Optional[List[str]] = getattr(self.__local, "parents", None)
+        if parents is None:
+            parents = []
+            self.__local.parents = parents
+        return parents
+
+
+# one report per process, stages anywhere in the code record into it (as loggers do)
+_report: RunReport = RunReport("run")
+
+
+def start_report(name: str, trace_memory: bool = False) -> RunReport:
+    """
+    Starts a new report of this process, with trace_memory the stages record tracemalloc peaks and top allocators
+    (at a considerable cost in speed)
+    """
+    global _report
+    _report = RunReport(name)
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return _report
+
+
+def get_report() -> RunReport:
+    return _report
+
+
+def stage(name: str, items: int = 0, unit: str = "items"):
+    """
+    Times the enclosed code as stage of the report of this process
+    """
+    return _report.stage(name, items, unit)
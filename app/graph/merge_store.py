@@ -0,0 +1,291 @@
+import os
+import sqlite3
+from typing import List, Optional, Iterator, Callable, Dict
+
+import numpy as np
+
+from graph.columns import StringColumn, DictionaryColumn
+from graph.frozen_skos_graph import FrozenSkosGraph, FROZEN_SCHEMAS
+from graph.graph_file import GraphFileWriter, read_graph_file
+from graph.instrumentation import stage, Stage
+from graph.skos_graph import RELATION_LABELS, SCHEMA_HISTORY_NOTE, SCHEMA_SYNONYM, NODE_SCHEMA_FIELDS
+
+DEFAULT_MEMORY_BUDGET_MIB: int = 256
+# rough size of one staged row in Python objects, the batches take half of the budget, the page cache the other half
+_BYTES_PER_ROW: int = 1024
+_MIN_BATCH_ROWS: int = 1000
+# columns of the nodes table, named after the fields of SkosNode
+_NODE_COLUMNS: List[str] = [NODE_SCHEMA_FIELDS[x] for x in FROZEN_SCHEMAS]
+# the position of a relation is its part (the synonyms to earlier sources, then the relations of each source) shifted
+# by _PART_BITS plus its row in the part, so ordering by position gives the relation order of merge_graphs
+_PART_BITS: int = 40
+# positions of the end descriptors follow the ones of all start descriptors
+_END_OFFSET: int = 1 << 50
+
+_SCHEMA: List[str] = [
+    "CREATE TABLE nodes (id INTEGER PRIMARY KEY, source INTEGER, descriptor TEXT, "
+    + ", ".join(x + " TEXT" for x in _NODE_COLUMNS) + ", name_key TEXT)",
+    "CREATE TABLE extra (id INTEGER PRIMARY KEY, node INTEGER, schema TEXT, literal TEXT)",
+    "CREATE TABLE relations (position INTEGER PRIMARY KEY, start TEXT, label INTEGER, end TEXT)",
+    # descriptors referenced by relations without a node of their own, by first reference as start, then as end
+    "CREATE TABLE references_only (id INTEGER PRIMARY KEY, descriptor TEXT)",
+    "CREATE TABLE descriptor_ids (descriptor TEXT PRIMARY KEY, id INTEGER) WITHOUT ROWID"
+]
+
+
+class MergeStore:
+    """
+    On-disk staging store of an out-of-core merge (see merge_graph_files). The source graph files are streamed in
+    batches into the tables of a SQLite file, the name keys are joined by an index of that file and the merged graph
+    is streamed section by section into its graph file. Memory is bounded by the budget: half of it is the page cache
+    of SQLite, which sorts and joins in temporary files beyond it, the other half the batches in flight. The merged
+    graph is the same as of merge_graphs with the same sources
+    """
+
+    def __init__(self, file_path: str, memory_budget_mib: int = DEFAULT_MEMORY_BUDGET_MIB):
+        self.file_path: str = file_path
+        self.batch_rows: int = max(_MIN_BATCH_ROWS, memory_budget_mib * (1 << 20) // 2 // _BYTES_PER_ROW)
+        self.relation_labels: List[str] = list(RELATION_LABELS)
+        self.source_names: List[str] = []
+        self.node_count: int = 0
+        self.relation_count: int = 0
+        self.synonym_count: int = 0
+        self.content_hash: Optional[str] = None
+        self.__extra_count: int = 0
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        self.connection: sqlite3.Connection = sqlite3.connect(file_path)
+        # a scratch file, rebuilt from the sources after a crash instead of being recovered
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("PRAGMA temp_store = FILE")
+        self.connection.execute("PRAGMA cache_size = " + str(-memory_budget_mib * 1024 // 2))
+        statement: str
+        for statement in _SCHEMA:
+            self.connection.execute(statement)
+
+    def add_source(self, graph_file_path: str, source_name: str):
+        """
+        Stages the nodes, extra attributes and relations of a source graph file (memory mapped, so only the batches
+        are decoded) with the source name as history note of its nodes
+        """
+        source: FrozenSkosGraph = read_graph_file(graph_file_path, use_mmap=True)
+        index: int = len(self.source_names)
+        self.source_names.append(source_name)
+        label_map: List[int] = []
+        label: str
+        for label in source.relation_labels:
+            if label not in self.relation_labels:
+                self.relation_labels.append(label)
+            label_map.append(self.relation_labels.index(label))
+
+        current: Stage
+        with stage(source_name, source.node_count, "nodes") as current:
+            start: int
+            for start in range(0, source.node_count, self.batch_rows):
+                end: int = min(start + self.batch_rows, source.node_count)
+                columns: List[List[Optional[str]]] = [_decode_codes(source.columns[x], start, end)
+                                                      for x in FROZEN_SCHEMAS]
+                history_notes: List[Optional[str]] = columns[FROZEN_SCHEMAS.index(SCHEMA_HISTORY_NOTE)]
+                columns[FROZEN_SCHEMAS.index(SCHEMA_HISTORY_NOTE)] = [source_name if x is None else x
+                                                                      for x in history_notes]
+                self.connection.executemany(
+                    "INSERT INTO nodes VALUES (?, ?, ?, " + ", ".join("?" for _ in _NODE_COLUMNS) + ", ?)",
+                    zip(range(self.node_count + start, self.node_count + end), [index] * (end - start),
+                        _decode_strings(source.descriptors, start, end), *columns,
+                        _decode_codes(source.name_keys, start, end)))
+                current.progress(end, source.node_count)
+
+            if source.extra_schema is not None:
+                extra_count: int = len(source.extra_node)
+                for start in range(0, extra_count, self.batch_rows):
+                    end: int = min(start + self.batch_rows, extra_count)
+                    self.connection.executemany(
+                        "INSERT INTO extra VALUES (?, ?, ?, ?)",
+                        zip(range(self.__extra_count + start, self.__extra_count + end),
+                            (source.extra_node[start:end] + self.node_count).tolist(),
+                            _decode_codes(source.extra_schema, start, end),
+                            _decode_strings(source.extra_literal, start, end)))
+                self.__extra_count += extra_count
+
+            relation_count: int = len(source.edge_start)
+            code_map: np.ndarray = np.array(label_map, dtype=np.int64)
+            part: int = (2 * index + 1) << _PART_BITS
+            for start in range(0, relation_count, self.batch_rows):
+                end: int = min(start + self.batch_rows, relation_count)
+                self.connection.executemany(
+                    "INSERT INTO relations VALUES (?, ?, ?, ?)",
+                    zip(range(part + start, part + end),
+                        [source.descriptors.get(x) for x in source.edge_start[start:end].tolist()],
+                        code_map[source.edge_label[start:end]].tolist(),
+                        [source.descriptors.get(x) for x in source.edge_end[start:end].tolist()]))
+            current.add_count("relations", relation_count)
+        self.node_count += source.node_count
+        self.relation_count += relation_count
+        self.connection.commit()
+
+    def match(self) -> int:
+        """
+        Stages the synonym relations between nodes of different sources with the same name key, in the order of
+        merge_graphs: from each node to the nodes of the earlier sources, ahead of the relations of its source.
+        Returns their number after dropping the repeated synonym relations
+        """
+        with stage("matching", self.node_count, "nodes") as current:
+            self.connection.execute("CREATE INDEX nodes_name_key ON nodes (name_key, source, id) "
+                                    "WHERE name_key IS NOT NULL")
+            synonym_code: int = self.relation_labels.index(SCHEMA_SYNONYM)
+            self.connection.execute(
+                "INSERT INTO relations SELECT ((2 * a.source) << ?) + ROW_NUMBER() OVER (ORDER BY a.id, b.id), "
+                "a.descriptor, ?, b.descriptor FROM nodes a JOIN nodes b ON b.name_key = a.name_key "
+                "AND b.source < a.source WHERE a.name_key IS NOT NULL", (_PART_BITS, synonym_code))
+            # as SkosGraph.add_relation every pair of descriptors keeps its first synonym relation in either direction
+            self.connection.execute(
+                "DELETE FROM relations WHERE label = ? AND position NOT IN (SELECT MIN(position) FROM relations "
+                "WHERE label = ? GROUP BY MIN(start, end), MAX(start, end))", (synonym_code, synonym_code))
+            self.synonym_count = self.connection.execute(
+                "SELECT COUNT(*) FROM relations WHERE (position >> ?) % 2 = 0", (_PART_BITS,)).fetchone()[0]
+            self.relation_count = self.connection.execute(
+                "SELECT COUNT(*) FROM relations").fetchone()[0] - self.synonym_count
+            current.add_count("synonym relations", self.synonym_count)
+        self.connection.commit()
+        return self.synonym_count
+
+    def write_graph_file(self, file_path: str, name: str = "merged graph") -> str:
+        """
+        Streams the merged graph into a graph file and returns its content hash. As in FrozenSkosGraph.from_skos_graph
+        a relation references the first node of its descriptor and descriptors without a node follow all nodes
+        """
+        with stage("descriptor ids", self.node_count, "nodes"):
+            self.connection.execute("INSERT OR IGNORE INTO descriptor_ids SELECT descriptor, id FROM nodes ORDER BY id")
+            self.connection.execute(
+                "INSERT INTO references_only (descriptor) SELECT descriptor FROM "
+                "(SELECT position, start AS descriptor FROM relations UNION ALL SELECT ? + position, end FROM relations) "
+                "WHERE descriptor NOT IN (SELECT descriptor FROM descriptor_ids) "
+                "GROUP BY descriptor ORDER BY MIN(position)", (_END_OFFSET,))
+            self.connection.execute("INSERT INTO descriptor_ids SELECT descriptor, ? + id - 1 FROM references_only",
+                                    (self.node_count,))
+            self.connection.commit()
+
+        relation_count: int = self.synonym_count + self.relation_count
+        with stage("writing", self.node_count, "nodes") as current:
+            writer: GraphFileWriter = GraphFileWriter(file_path)
+            _write_strings(writer, "descriptors", lambda: _chain(
+                self.__select("SELECT descriptor FROM nodes ORDER BY id"),
+                self.__select("SELECT descriptor FROM references_only ORDER BY id")))
+            schema: str
+            for schema in FROZEN_SCHEMAS:
+                self.__write_dictionary_column(writer, "columns." + schema, "nodes", NODE_SCHEMA_FIELDS[schema])
+            self.__write_dictionary_column(writer, "name_keys", "nodes", "name_key")
+            endpoint: str
+            for endpoint in ["start", "end"]:
+                writer.write_chunks("edges." + endpoint, np.int32, (np.array(x, dtype=np.int32) for x in self.__select(
+                    "SELECT d.id FROM relations r CROSS JOIN descriptor_ids d ON d.descriptor = r." + endpoint
+                    + " ORDER BY r.position")))
+            writer.write_chunks("edges.label", np.uint8, (np.array(x, dtype=np.uint8) for x in
+                                                          self.__select("SELECT label FROM relations ORDER BY position")))
+            writer.write_chunks("extra.node", np.int32, (np.array(x, dtype=np.int32) for x in
+                                                         self.__select("SELECT node FROM extra ORDER BY id")))
+            self.__write_dictionary_column(writer, "extra.schema", "extra", "schema")
+            _write_strings(writer, "extra.literal", lambda: self.__select("SELECT literal FROM extra ORDER BY id"))
+            current.add_count("relations", relation_count)
+            self.content_hash = writer.close({
+                "content": "graph",
+                "name": name,
+                "node_count": self.node_count,
+                "relation_labels": self.relation_labels
+            })
+        return self.content_hash
+
+    def close(self):
+        self.connection.close()
+
+    def __select(self, query: str) -> Iterator[list]:
+        """
+        The first column of the rows of the query in batches of batch_rows
+        """
+        cursor: sqlite3.Cursor = self.connection.execute(query)
+        rows: List[tuple] = cursor.fetchmany(self.batch_rows)
+        while len(rows) > 0:
+            yield [x[0] for x in rows]
+            rows = cursor.fetchmany(self.batch_rows)
+
+    def __write_dictionary_column(self, writer: GraphFileWriter, name: str, table: str, column: str):
+        # the distinct values sorted by SQLite in byte order of their utf-8, which is the order of DictionaryColumn
+        self.connection.execute("DROP TABLE IF EXISTS dictionary")
+        self.connection.execute("CREATE TABLE dictionary (code INTEGER PRIMARY KEY, value TEXT UNIQUE)")
+        self.connection.execute("INSERT INTO dictionary (code, value) SELECT ROW_NUMBER() OVER (ORDER BY " + column
+                                + ") - 1, " + column + " FROM (SELECT DISTINCT " + column + " FROM " + table
+                                + " WHERE " + column + " IS NOT NULL)")
+        writer.write_chunks(name + ".codes", np.int32, (np.array(x, dtype=np.int32) for x in self.__select(
+            "SELECT IFNULL(d.code, -1) FROM " + table + " t LEFT JOIN dictionary d ON d.value = t." + column
+            + " ORDER BY t.id")))
+        _write_strings(writer, name + ".dictionary", lambda: self.__select("SELECT value FROM dictionary ORDER BY code"))
+
+
+def _chain(*batches: Iterator[list]) -> Iterator[list]:
+    iterator: Iterator[list]
+    for iterator in batches:
+        yield from iterator
+
+
+def _decode_strings(column: StringColumn, start: int, end: int) -> List[str]:
+    offsets: List[int] = (column.offsets[start:end + 1] - column.offsets[start]).tolist()
+    data: bytes = bytes(column.data[column.base + int(column.offsets[start]):column.base + int(column.offsets[end])])
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(0, end - start)]
+
+
+def _decode_codes(column: DictionaryColumn, start: int, end: int) -> List[Optional[str]]:
+    # each distinct code of the batch is decoded once
+    codes: List[int] = column.codes[start:end].tolist()
+    values: Dict[int, str] = {x: column.dictionary.get(x) for x in set(codes) if x >= 0}
+    return [values.get(x) for x in codes]
+
+
+def _write_strings(writer: GraphFileWriter, name: str, select: Callable[[], Iterator[List[str]]]):
+    """
+    Writes the strings of the batches of select as string column. The offsets precede the data in the file, so the
+    strings are selected twice instead of being held in memory
+    """
+    writer.write_chunks(name + ".offsets", np.int64, _get_offset_chunks(select()))
+    writer.write_chunks(name + ".data", np.uint8, (np.frombuffer(b"".join(x.encode("utf-8") for x in batch),
+                                                                 dtype=np.uint8) for batch in select()))
+
+
+def _get_offset_chunks(batches: Iterator[List[str]]) -> Iterator[np.ndarray]:
+    shift: int = 0
+    yield np.zeros(1, dtype=np.int64)
+    batch: List[str]
+    for batch in batches:
+        lengths: np.ndarray = np.fromiter((len(x.encode("utf-8")) for x in batch), dtype=np.int64, count=len(batch))
+        offsets: np.ndarray = np.cumsum(lengths) + shift
+        if len(offsets) > 0:
+            shift = int(offsets[-1])
+        yield offsets
+
+
+def merge_graph_files(source_paths: List[str], target_path: str, source_names: Optional[List[str]] = None,
+                      memory_budget_mib: int = DEFAULT_MEMORY_BUDGET_MIB, staging_path: Optional[str] = None) \
+        -> MergeStore:
+    """
+    merge_graphs of the graph files, out of core: neither the sources nor the merged graph are held in memory but
+    staged in a SQLite file (staging_path, next to the target by default, removed afterwards). Returns the closed store
+    with the counts and the content hash of the written graph file
+    """
+    if source_names is None:
+        source_names = [os.path.basename(x).replace(".graph", "") for x in source_paths]
+    if staging_path is None:
+        staging_path = target_path + ".staging"
+    store: MergeStore = MergeStore(staging_path, memory_budget_mib)
+    try:
+        with stage("staging", unit="nodes") as current:
+            source_path: str
+            source_name: str
+            for source_path, source_name in zip(source_paths, source_names):
+                store.add_source(source_path, source_name)
+            current.count(store.node_count)
+        store.match()
+        store.write_graph_file(target_path)
+    finally:
+        store.close()
+        os.remove(staging_path)
+    return store
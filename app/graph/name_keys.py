@@ -0,0 +1,120 @@
+import unicodedata
+from functools import lru_cache
+from typing import Optional, List, Dict
+
+import numpy as np
+
+from graph.columns import DictionaryColumn
+
+HYBRID_MARKER: str = "×"
+# rank abbreviations and their spelled out forms, mapped to one canonical marker
+RANK_MARKERS: Dict[str, str] = {
+    "subsp.": "subsp.", "subsp": "subsp.", "ssp.": "subsp.", "ssp": "subsp.", "subspecies": "subsp.",
+    "var.": "var.", "var": "var.", "variety": "var.",
+    "subvar.": "subvar.", "subvar": "subvar.",
+    "f.": "f.", "f": "f.", "fo.": "f.", "fo": "f.", "forma": "f.",
+    "subf.": "subf.", "subf": "subf."
+}
+# ranks between genus and species, followed by a capitalized name
+INFRAGENERIC_MARKERS: Dict[str, str] = {
+    "subg.": "subg.", "subgen.": "subg.", "subgenus": "subg.", "sect.": "sect.", "section": "sect.",
+    "subsect.": "subsect.", "ser.": "ser.", "series": "ser."
+}
+# lowercase words of an authorship, e.g. "L. ex DC." or "van Steenis"
+AUTHOR_PARTICLES = {"ex", "et", "&", "in", "de", "da", "del", "van", "von", "der", "den", "du", "la", "le", "d'"}
+_CACHE_SIZE: int = 1 << 16
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def get_name_key(label: Optional[str], author: Optional[str] = None) -> Optional[str]:
+    """
+    Canonical key of a scientific name, names which only differ in case, whitespace, diacritics, hybrid markers,
+    the spelling of the rank abbreviations or an authorship written into the label share the key, e.g.
+    "×Mentha  Piperita L. ssp. citrata (Ehrh.) Briq." and "mentha piperita subsp. citrata" -> "mentha piperita
+    subsp. citrata". The authorship is the given author at the end of the label or, without one, everything from the
+    first word which looks like an author (capitalized after the epithet, abbreviated, in parentheses or a particle
+    like "ex") up to the next rank marker. The word after a rank marker is its epithet in any case, as "Rosa canina
+    var. Alba". None for nodes without (or with an empty) label
+    """
+    if label is None:
+        return None
+    if author and label.endswith(author) and len(label) > len(author):
+        label = label[:-len(author)]
+    # diacritics are dropped, so Cephaëlis and Cephaelis share the key
+    text: str = "".join(x for x in unicodedata.normalize("NFKD", label) if not unicodedata.combining(x))
+    if not any(x.islower() for x in text):
+        # all caps labels carry no case to tell epithets from authors
+        text = text.lower()
+    tokens: List[str] = text.replace(HYBRID_MARKER, " " + HYBRID_MARKER + " ").split()
+    formula: List[int] = [i for i, x in enumerate(tokens) if i >= 2 and _is_hybrid_marker(x)]
+    if len(formula) > 0:
+        # a hybrid formula like "Mentha aquatica × Mentha spicata", the key of each parent joined by the marker
+        parts: List[str] = [" ".join(tokens[x + 1:y]) for x, y in zip([-1] + formula, formula + [len(tokens)])]
+        return (" " + HYBRID_MARKER + " ").join(str(get_name_key(x)) for x in parts)
+    tokens = [x for x in tokens if not _is_hybrid_marker(x)]
+    if len(tokens) == 0:
+        return None
+    key: List[str] = [tokens[0].lower()]
+    in_authorship: bool = False
+    i: int = 1
+    while i < len(tokens):
+        token: str = tokens[i]
+        following: Optional[str] = tokens[i + 1] if i + 1 < len(tokens) else None
+        i += 1
+        marker: Optional[str] = RANK_MARKERS.get(token.lower())
+        if marker is not None:
+            # "f." after an authorship without an epithet following it is "filius"
+            if following is not None and _is_epithet(following):
+                key += [marker, following.lower()]
+                in_authorship = False
+                i += 1
+            continue
+        marker = INFRAGENERIC_MARKERS.get(token.lower())
+        if marker is not None and following is not None and following.isalpha():
+            key += [marker, following.lower()]
+            in_authorship = False
+            i += 1
+            continue
+        if in_authorship or (len(key) == 1 and _is_subgenus(token)):
+            continue
+        if _is_author(token, len(key) == 1):
+            in_authorship = True
+        else:
+            key.append(token.lower())
+    return " ".join(key)
+
+
+def _is_hybrid_marker(token: str) -> bool:
+    return token == HYBRID_MARKER or token == "x" or token == "X"
+
+
+def _is_author(token: str, after_genus: bool) -> bool:
+    # epithets are never abbreviated, so "l." of an all caps label is an author as well
+    if token in AUTHOR_PARTICLES or token.startswith("(") or "." in token:
+        return True
+    # a capitalized word right after the genus without further signs of an author is taken as epithet
+    return token[0].isupper() and not (after_genus and token.isalpha())
+
+
+def _is_epithet(token: str) -> bool:
+    return token.replace("-", "").isalpha() and token.lower() not in AUTHOR_PARTICLES
+
+
+def _is_subgenus(token: str) -> bool:
+    return token.startswith("(") and token.endswith(")") and token[1:-1].isalpha() and token[1].isupper()
+
+
+def build_name_key_column(labels: DictionaryColumn, authors: DictionaryColumn) -> DictionaryColumn:
+    """
+    The name keys of the nodes of the label and author columns, computed once per distinct pair of label and author
+    """
+    width: int = len(authors.dictionary) + 1
+    pairs: np.ndarray = labels.codes.astype(np.int64) * width + authors.codes + 1
+    distinct, inverse = np.unique(pairs, return_inverse=True)
+    label_values: List[str] = labels.dictionary.to_list()
+    author_values: List[str] = authors.dictionary.to_list()
+    keys: List[Optional[str]] = [None if x < 0 else get_name_key(label_values[x // width],
+                                                                 author_values[x % width - 1] if x % width else None)
+                                 for x in distinct.tolist()]
+    distinct_keys: DictionaryColumn = DictionaryColumn.from_values(keys)
+    return DictionaryColumn(distinct_keys.codes[inverse.reshape(-1)], distinct_keys.dictionary)
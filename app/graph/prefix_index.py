@@ -0,0 +1,55 @@
+from typing import List
+
+import numpy as np
+
+from graph.columns import StringColumn, DictionaryColumn, CsrAdjacency
+
+
+class PrefixIndex:
+    """
+    Typeahead index over the lowercase prefLabels.
+    keys holds the distinct lowercase labels sorted by their length and then by their utf-8 bytes, the keys of
+    length l are keys[length_offsets[l]:length_offsets[l + 1]] and key_nodes maps a key to its node ids.
+    The k shortest labels starting with a prefix are found with one binary search per label length, so a query
+    costs O(log n + k) for the bounded number of label lengths
+    """
+
+    def __init__(self, keys: StringColumn, length_offsets: np.ndarray, key_nodes: CsrAdjacency):
+        self.keys: StringColumn = keys
+        self.length_offsets: np.ndarray = length_offsets
+        self.key_nodes: CsrAdjacency = key_nodes
+
+    @staticmethod
+    def build(labels: DictionaryColumn) -> 'PrefixIndex':
+        lowered: List[str] = [x.lower() for x in labels.dictionary.to_list()]
+        distinct: List[str] = sorted(set(lowered), key=lambda x: (len(x), x.encode("utf-8")))
+        key_of: dict = {value: key for key, value in enumerate(distinct)}
+        key_of_code: np.ndarray = np.fromiter((key_of[x] for x in lowered), dtype=np.int32, count=len(lowered))
+
+        lengths: np.ndarray = np.fromiter((len(x) for x in distinct), dtype=np.int64, count=len(distinct))
+        max_length: int = int(lengths.max()) if len(lengths) > 0 else 0
+        length_offsets: np.ndarray = np.zeros(max_length + 2, dtype=np.int64)
+        np.cumsum(np.bincount(lengths, minlength=max_length + 1), out=length_offsets[1:])
+
+        has_label: np.ndarray = labels.codes >= 0
+        key_nodes: CsrAdjacency = CsrAdjacency.from_pairs(key_of_code[labels.codes[has_label]],
+                                                          np.nonzero(has_label)[0], len(distinct))
+        return PrefixIndex(StringColumn.from_strings(distinct), length_offsets, key_nodes)
+
+    def get_node_ids_with_prefix(self, prefix: str, max_result_count: int) -> List[int]:
+        """
+        Ids of the nodes with the shortest lowercase labels starting with the lowercase prefix,
+        ordered by label length, label and node id
+        """
+        key: bytes = prefix.encode("utf-8")
+        result: List[int] = []
+        length: int
+        for length in range(len(prefix), len(self.length_offsets) - 1):
+            if len(result) >= max_result_count:
+                break
+            hi: int = int(self.length_offsets[length + 1])
+            position: int = self.keys.bisect_left(prefix, lo=int(self.length_offsets[length]), hi=hi)
+            while position < hi and len(result) < max_result_count and self.keys.get_bytes(position).startswith(key):
+                result += self.key_nodes.get(position).tolist()
+                position += 1
+        return result[:max_result_count]
@@ -1,5 +1,9 @@
+import sys
 from collections import defaultdict
-from typing import Optional, List, Callable
+from itertools import repeat
+from typing import Optional, List, Callable, Dict, Sequence
+
+from graph.name_keys import get_name_key
 
 CONCEPT_FAMILY = "family"
 CONCEPT_KINGDOM = "kingdom"
@@ -19,67 +23,233 @@ SCHEMA_HISTORY_NOTE = "skos:historyNote"
 SCHEMA_AUTHOR = "skos:scopeNote"
 
 
+RELATION_LABELS: List[str] = [SCHEMA_BROADER, SCHEMA_NARROWER, SCHEMA_SYNONYM]
+_RELATION_LABEL_CODES: Dict[str, int] = {label: code for code, label in enumerate(RELATION_LABELS)}
+# inverse labels which are never stored: the skos:narrower relation from a parent to its child is derived from the
+# skos:broader relation from the child to the parent at query and export time
+DERIVED_LABELS: Dict[str, str] = {SCHEMA_NARROWER: SCHEMA_BROADER}
+# labels of undirected relations, every pair of descriptors is stored once in either direction
+SYMMETRIC_LABELS: List[str] = [SCHEMA_SYNONYM]
+_DERIVED_LABEL_CODES: Dict[int, int] = {_RELATION_LABEL_CODES[x]: _RELATION_LABEL_CODES[y]
+                                        for x, y in DERIVED_LABELS.items()}
+_INVERSE_LABEL_CODES: Dict[int, int] = {y: x for x, y in _DERIVED_LABEL_CODES.items()}
+_SYMMETRIC_LABEL_CODES = {_RELATION_LABEL_CODES[x] for x in SYMMETRIC_LABELS}
+
+# attributes every node carries are stored in a fixed field of the node instead of a list
+NODE_SCHEMA_FIELDS: Dict[str, str] = {
+    SCHEMA_PREF_LABEL: "pref_label",
+    SCHEMA_TAXON_STATUS: "taxon_status",
+    SCHEMA_AUTHOR: "author",
+    SCHEMA_IN_SCHEME: "in_scheme",
+    SCHEMA_HISTORY_NOTE: "history_note"
+}
+# literals with few distinct values, interned so all nodes share one string object per value
+_INTERNED_SCHEMAS = {SCHEMA_TAXON_STATUS, SCHEMA_AUTHOR, SCHEMA_IN_SCHEME, SCHEMA_HISTORY_NOTE}
+# the schemas the name key of a node is computed from
+_NAME_KEY_SCHEMAS = {SCHEMA_PREF_LABEL, SCHEMA_AUTHOR}
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def _to_list(values) -> list:
+    return values.tolist() if hasattr(values, "tolist") else list(values)
+
+
+def _to_column(values):
+    # a single literal (or None) is repeated for every row
+    return repeat(values) if values is None or isinstance(values, str) else _to_list(values)
+
+
+def get_relation_label_code(label: str) -> int:
+    code: Optional[int] = _RELATION_LABEL_CODES.get(label)
+    if code is None:
+        code = len(RELATION_LABELS)
+        RELATION_LABELS.append(sys.intern(label))
+        _RELATION_LABEL_CODES[label] = code
+    return code
+
+
 class SkosAttribute:
     """
     SkosAttributes are attributes which should be stored in a node to save values corresponding to this node
     """
+    __slots__ = ("schema", "literal")
 
     def __init__(self, schema: str, literal: str):
-        self.schema = schema
+        self.schema = _intern(schema)
         self.literal = literal
 
+    def __getstate__(self):
+        return self.schema, self.literal
+
+    def __setstate__(self, state):
+        # graphs pickled before __slots__ carry the plain __dict__
+        if isinstance(state, dict):
+            state = (state["schema"], state["literal"])
+        self.schema, self.literal = state
+
     def __str__(self):
         return "Schema: " + self.schema + " | Literal: " + self.literal
 
+    def to_dict(self) -> dict:
+        return {"schema": self.schema, "literal": self.literal}
+
 
 class SkosNode:
     """
     A SkosNode represents a node (like plant, family, genus etc.) with the corresponding attributes.
     A SkosNode is a sub-graph with a central node (descriptor) and the attributes as single leaves
     Leaves are not interconnectabble within a SkosNode
+    The known schemas are kept in fixed fields, any other schema in extra_attributes. name_key is no attribute but
+    the normalized prefLabel used to match names across sources, see get_name_key
     """
+    __slots__ = ("descriptor", "pref_label", "taxon_status", "author", "in_scheme", "history_note",
+                 "extra_attributes", "name_key")
 
     def __init__(self, descriptor: str, pref_label: str, init_attributes: [SkosAttribute]):
-        self.descriptor: str = descriptor
-        self.attributes: [SkosAttribute] = []
+        self.descriptor: str = _intern(descriptor)
+        self.pref_label: Optional[str] = None
+        self.taxon_status: Optional[str] = None
+        self.author: Optional[str] = None
+        self.in_scheme: Optional[str] = None
+        self.history_note: Optional[str] = None
+        self.extra_attributes: Optional[tuple] = None
+        self.name_key: Optional[str] = None
         self.add_attribute(SCHEMA_PREF_LABEL, pref_label)
         if init_attributes is not None:
             att: SkosAttribute
             for att in init_attributes:
                 self.add_attribute(att.schema, att.literal)
 
+    def __getstate__(self):
+        return (self.descriptor, self.pref_label, self.taxon_status, self.author, self.in_scheme,
+                self.history_note, self.extra_attributes, self.name_key)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # graphs pickled before __slots__ carry a descriptor and a list of attributes
+            self.__init__(state["descriptor"], None, state["attributes"])
+            return
+        if len(state) == 7:
+            # pickled before name keys were stored
+            state = state + (None,)
+        self.descriptor, self.pref_label, self.taxon_status, self.author, self.in_scheme, \
+            self.history_note, self.extra_attributes, self.name_key = state
+
+    @staticmethod
+    def from_fields(descriptor: str, pref_label: Optional[str], taxon_status: Optional[str] = None,
+                    author: Optional[str] = None, in_scheme: Optional[str] = None, history_note: Optional[str] = None,
+                    extra_attributes: Optional[tuple] = None, name_key: Optional[str] = None) -> 'SkosNode':
+        node: SkosNode = SkosNode.__new__(SkosNode)
+        node.__setstate__((descriptor, pref_label, taxon_status, author, in_scheme, history_note, extra_attributes,
+                           name_key))
+        return node
+
+    def get_name_key(self) -> Optional[str]:
+        """
+        The normalized prefLabel (see name_keys.get_name_key), computed on first use and kept with the node until
+        its prefLabel or author is set
+        """
+        if self.name_key is None and self.pref_label is not None:
+            self.name_key = get_name_key(self.pref_label, self.author)
+        return self.name_key
+
     def __str__(self):
         out = "Descriptor: " + str(self.descriptor) + "\n"
         for attribute in self.attributes:
             out += "-> " + str(attribute) + "\n"
         return out
 
+    @property
+    def attributes(self) -> [SkosAttribute]:
+        attributes: [SkosAttribute] = []
+        schema: str
+        field: str
+        for schema, field in NODE_SCHEMA_FIELDS.items():
+            literal = getattr(self, field)
+            if literal is not None:
+                attributes.append(SkosAttribute(schema, literal))
+        if self.extra_attributes is not None:
+            attributes += self.extra_attributes
+        return attributes
+
     def add_attribute(self, schema: str, literal: str) -> bool:
+        field: Optional[str] = NODE_SCHEMA_FIELDS.get(schema)
+        if field is not None:
+            if getattr(self, field) is not None or literal is None:
+                return False
+            setattr(self, field, _intern(literal) if schema in _INTERNED_SCHEMAS else literal)
+            if schema in _NAME_KEY_SCHEMAS:
+                self.name_key = None
+            return True
         if self.get_attribute_by_schema(schema) is not None:
             return False
-        self.attributes.append(SkosAttribute(schema, literal))
+        extra: tuple = () if self.extra_attributes is None else self.extra_attributes
+        self.extra_attributes = extra + (SkosAttribute(schema, literal),)
         return True
 
+    def get_literal_by_schema(self, schema: str) -> Optional[str]:
+        field: Optional[str] = NODE_SCHEMA_FIELDS.get(schema)
+        if field is not None:
+            return getattr(self, field)
+        attribute: Optional[SkosAttribute] = self.get_attribute_by_schema(schema)
+        return None if attribute is None else attribute.literal
+
     def get_attribute_by_schema(self, schema: str) -> Optional[SkosAttribute]:
+        field: Optional[str] = NODE_SCHEMA_FIELDS.get(schema)
+        if field is not None:
+            literal = getattr(self, field)
+            return None if literal is None else SkosAttribute(schema, literal)
+        if self.extra_attributes is None:
+            return None
         attribute: SkosAttribute
-        for attribute in self.attributes:
+        for attribute in self.extra_attributes:
             if attribute.schema == schema:
                 return attribute
         return None
 
+    def to_dict(self) -> dict:
+        return {"descriptor": self.descriptor, "attributes": [x.to_dict() for x in self.attributes]}
+
 
 class SkosRelation:
     """
     SkosRelation´s class represents a unidirectional connection between nodes from start to end
     start is equal to a child in a tree, end to a parent
     visually an arrows would be drawn from start to end
-    label is the type of relation
+    label is the type of relation, stored as index into RELATION_LABELS
     """
+    __slots__ = ("start_descriptor", "label_code", "end_descriptor")
 
     def __init__(self, start_descriptor: str, label: str, end_descriptor: str):
-        self.end_descriptor = end_descriptor
-        self.label = label
-        self.start_descriptor = start_descriptor
+        self.end_descriptor = _intern(end_descriptor)
+        self.label_code: int = get_relation_label_code(label)
+        self.start_descriptor = _intern(start_descriptor)
+
+    def __getstate__(self):
+        return self.start_descriptor, self.label_code, self.end_descriptor
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # graphs pickled before __slots__ carry the label as string
+            state = (state["start_descriptor"], get_relation_label_code(state["label"]), state["end_descriptor"])
+        self.start_descriptor, self.label_code, self.end_descriptor = state
+
+    @staticmethod
+    def from_fields(start_descriptor: str, label_code: int, end_descriptor: str) -> 'SkosRelation':
+        relation: SkosRelation = SkosRelation.__new__(SkosRelation)
+        relation.__setstate__((start_descriptor, label_code, end_descriptor))
+        return relation
+
+    @property
+    def label(self) -> str:
+        return RELATION_LABELS[self.label_code]
+
+    @label.setter
+    def label(self, label: str):
+        self.label_code = get_relation_label_code(label)
 
     def __str__(self):
         return "Start: " + str(self.start_descriptor) \
@@ -90,36 +260,218 @@ class SkosRelation:
 class SkosGraph:
     """
     A SkosGraph is a container for all nodes and there relations with manipulator methods
+    Nodes and relations are additionally kept in hash indexes (descriptor, prefLabel, start and end descriptor),
+    which are maintained by every manipulator, so lookups do not need to scan the nodes and relations lists. The name
+    key index is built on its first lookup and maintained from then on.
+    relations holds every relation once: relations of DERIVED_LABELS are stored as their inverse and returned by the
+    queries as derived relations, a pair of SYMMETRIC_LABELS is only added in the first direction
     """
 
     def __init__(self, name=""):
         self.name: str = name
         self.nodes: [SkosNode] = []
         self.relations: [SkosRelation] = []
+        self.__build_indexes()
+
+    def __getstate__(self):
+        return {"name": self.name, "nodes": self.nodes, "relations": self.relations}
+
+    def __setstate__(self, state: dict):
+        # graphs pickled before the indexes existed carry neither indexes nor a name
+        self.name = state.get("name", "")
+        self.nodes = state["nodes"]
+        # graphs pickled before relations were stored once carry the mirrored narrower relations as well
+        self.relations = [x for x in state["relations"] if x.label_code not in _DERIVED_LABEL_CODES]
+        self.__build_indexes()
+
+    @staticmethod
+    def from_indexed(name: str, nodes: List[SkosNode], relations: List[SkosRelation],
+                     nodes_by_label: Dict[str, List[SkosNode]], relations_by_start: Dict[str, List[SkosRelation]],
+                     relations_by_end: Dict[str, List[SkosRelation]]) -> 'SkosGraph':
+        """
+        A graph of nodes and relations whose indexes were grouped in bulk by the caller (see
+        FrozenSkosGraph.to_skos_graph) instead of one add_node and add_relation per entry. The relations have to be
+        stored as add_relation stores them and the lists of the indexes have to keep the order of nodes and relations
+        """
+        graph: SkosGraph = SkosGraph.__new__(SkosGraph)
+        graph.name = name
+        graph.nodes = nodes
+        graph.relations = relations
+        # reversed, so the first node of a descriptor is the one kept
+        graph.__node_by_descriptor = {x.descriptor: x for x in reversed(nodes)}
+        graph.__nodes_by_label = nodes_by_label
+        graph.__nodes_by_name_key = None
+        graph.__relations_by_start = relations_by_start
+        graph.__relations_by_end = relations_by_end
+        return graph
+
+    def __build_indexes(self):
+        self.__node_by_descriptor: Dict[str, SkosNode] = {}
+        self.__nodes_by_label: Dict[str, List[SkosNode]] = {}
+        self.__nodes_by_name_key: Optional[Dict[str, List[SkosNode]]] = None
+        self.__relations_by_start: Dict[str, List[SkosRelation]] = {}
+        self.__relations_by_end: Dict[str, List[SkosRelation]] = {}
+        node: SkosNode
+        for node in self.nodes:
+            self.__index_node(node)
+        relation: SkosRelation
+        for relation in self.relations:
+            self.__index_relation(relation)
+
+    def __index_node(self, node: SkosNode):
+        # the first node added for a descriptor wins, as with the former linear search
+        self.__node_by_descriptor.setdefault(node.descriptor, node)
+        if node.pref_label is not None:
+            self.__nodes_by_label.setdefault(node.pref_label, []).append(node)
+        if self.__nodes_by_name_key is not None:
+            self.__index_name_key(node)
+
+    def __index_name_key(self, node: SkosNode):
+        key: Optional[str] = node.get_name_key()
+        if key is not None:
+            self.__nodes_by_name_key.setdefault(key, []).append(node)
+
+    def __index_relation(self, relation: SkosRelation):
+        self.__relations_by_start.setdefault(relation.start_descriptor, []).append(relation)
+        self.__relations_by_end.setdefault(relation.end_descriptor, []).append(relation)
+
+    def add_node(self, node: SkosNode) -> SkosNode:
+        self.nodes.append(node)
+        self.__index_node(node)
+        return node
+
+    def add_relation(self, relation: SkosRelation) -> SkosRelation:
+        """
+        Adds the relation, a relation of a derived label as its inverse. For a symmetric label the relation already
+        stored for the pair is returned instead of adding another one
+        """
+        stored_code: Optional[int] = _DERIVED_LABEL_CODES.get(relation.label_code)
+        if stored_code is not None:
+            relation = SkosRelation.from_fields(relation.end_descriptor, stored_code, relation.start_descriptor)
+        elif relation.label_code in _SYMMETRIC_LABEL_CODES:
+            existing: Optional[SkosRelation] = self.__find_symmetric_relation(relation)
+            if existing is not None:
+                return existing
+        self.relations.append(relation)
+        self.__index_relation(relation)
+        return relation
+
+    def __find_symmetric_relation(self, relation: SkosRelation) -> Optional[SkosRelation]:
+        other: SkosRelation
+        for other in self.__relations_by_start.get(relation.start_descriptor, ()):
+            if other.end_descriptor == relation.end_descriptor and other.label_code == relation.label_code:
+                return other
+        for other in self.__relations_by_start.get(relation.end_descriptor, ()):
+            if other.end_descriptor == relation.start_descriptor and other.label_code == relation.label_code:
+                return other
+        return None
+
+    def add_nodes_bulk(self, descriptors: Sequence[str], labels: Sequence[str], concept,
+                       taxon_status=None, author=None) -> int:
+        """
+        Adds a node of the concept per entry of the equally long descriptor and label columns (lists, arrays or
+        Series), without building attribute lists per node. concept, taxon_status and author are either one literal
+        for all nodes or a column, None leaves the attribute out
+        """
+        count: int = 0
+        descriptor: str
+        for descriptor, label, node_concept, status_literal, author_literal in zip(
+                _to_list(descriptors), _to_list(labels), _to_column(concept), _to_column(taxon_status),
+                _to_column(author)):
+            self.add_node(SkosNode.from_fields(_intern(descriptor), label, _intern(status_literal),
+                                               _intern(author_literal), _intern(node_concept)))
+            count += 1
+        return count
+
+    def add_edges_bulk(self, children: Sequence[str], parents: Sequence[str], label: str = SCHEMA_BROADER) -> int:
+        """
+        Adds a relation of the label from every child to its parent, as by the add_*_to_* methods (see add_relation)
+        """
+        label_code: int = get_relation_label_code(label)
+        count: int = 0
+        child: str
+        parent: str
+        for child, parent in zip(_to_list(children), _to_list(parents)):
+            self.add_relation(SkosRelation.from_fields(_intern(child), label_code, _intern(parent)))
+            count += 1
+        return count
 
     def get_outgoing_relations_with_descriptor(self, start_descriptor: str) -> [SkosRelation]:
-        return [x for x in self.relations if x.start_descriptor == start_descriptor]
+        """
+        The stored relations starting at start_descriptor followed by the derived ones (see DERIVED_LABELS)
+        """
+        return list(self.__relations_by_start.get(start_descriptor, ())) \
+            + [SkosRelation.from_fields(start_descriptor, _INVERSE_LABEL_CODES[x.label_code], x.start_descriptor)
+               for x in self.__relations_by_end.get(start_descriptor, ()) if x.label_code in _INVERSE_LABEL_CODES]
+
+    def get_incoming_relations_with_descriptor(self, end_descriptor: str) -> [SkosRelation]:
+        return list(self.__relations_by_end.get(end_descriptor, ())) \
+            + [SkosRelation.from_fields(x.end_descriptor, _INVERSE_LABEL_CODES[x.label_code], end_descriptor)
+               for x in self.__relations_by_start.get(end_descriptor, ()) if x.label_code in _INVERSE_LABEL_CODES]
+
+    def get_end_descriptors(self, start_descriptor: str, label: str) -> List[str]:
+        stored: Optional[str] = DERIVED_LABELS.get(label)
+        if stored is not None:
+            return self.get_start_descriptors(start_descriptor, stored)
+        return [x.end_descriptor for x in self.__relations_by_start.get(start_descriptor, ()) if x.label == label]
+
+    def get_start_descriptors(self, end_descriptor: str, label: str) -> List[str]:
+        stored: Optional[str] = DERIVED_LABELS.get(label)
+        if stored is not None:
+            return self.get_end_descriptors(end_descriptor, stored)
+        return [x.start_descriptor for x in self.__relations_by_end.get(end_descriptor, ()) if x.label == label]
+
+    def get_adjacent_descriptors(self, descriptor: str, label: str) -> List[str]:
+        return list(dict.fromkeys(self.get_end_descriptors(descriptor, label)
+                                  + self.get_start_descriptors(descriptor, label)))
+
+    def get_related_descriptors(self, descriptor: str, depth: int) -> List[str]:
+        """
+        Descriptors connected to descriptor by 1 to depth synonym relations, ordered by hop distance.
+        As any walk may return to its start, descriptor itself is part of the result from depth 2 on
+        (from depth 1 on with a synonym relation to itself)
+        """
+        distances: Dict[str, int] = {descriptor: 0}
+        frontier: List[str] = [descriptor]
+        distance: int
+        for distance in range(1, depth + 1):
+            next_frontier: List[str] = []
+            current: str
+            for current in frontier:
+                other: str
+                for other in self.get_adjacent_descriptors(current, SCHEMA_SYNONYM):
+                    if other not in distances:
+                        distances[other] = distance
+                        next_frontier.append(other)
+            frontier = next_frontier
+        result: List[str] = list(distances.keys())[1:]
+        if (depth >= 2 and len(result) > 0) \
+                or (depth >= 1 and descriptor in self.get_end_descriptors(descriptor, SCHEMA_SYNONYM)):
+            result.append(descriptor)
+        return result
 
     def get_node_by_descriptor(self, descriptor: str) -> Optional[SkosNode]:
-        node: SkosNode
-        for node in self.nodes:
-            if node.descriptor == descriptor:
-                return node
-        return None
+        return self.__node_by_descriptor.get(descriptor)
 
     def get_node_by_name(self, name: str) -> Optional[SkosNode]:
-        node: SkosNode
-        for node in self.nodes:
-            if node.get_attribute_by_schema(SCHEMA_PREF_LABEL).literal == name:
-                return node
-        return None
+        nodes: List[SkosNode] = self.__nodes_by_label.get(name)
+        return nodes[0] if nodes else None
 
     def get_all_nodes_by_name(self, name: str) -> List[SkosNode]:
-        nodes: List[SkosNode] = []
-        for node in self.nodes:
-            if node.get_attribute_by_schema(SCHEMA_PREF_LABEL).literal == name:
-                nodes.append(node)
-        return nodes
+        return list(self.__nodes_by_label.get(name, ()))
+
+    def get_all_nodes_by_name_key(self, name: str) -> List[SkosNode]:
+        """
+        Nodes whose name key equals the one of name (see SkosNode.get_name_key). The index is built on the first call,
+        nodes are expected to have their prefLabel and author once they are added
+        """
+        if self.__nodes_by_name_key is None:
+            self.__nodes_by_name_key = {}
+            node: SkosNode
+            for node in self.nodes:
+                self.__index_name_key(node)
+        key: Optional[str] = get_name_key(name)
+        return [] if key is None else list(self.__nodes_by_name_key.get(key, ()))
 
     def add_kingdom_node(self, descriptor: str,
                          kingdom_name: str = "insert kingdom name here...",
@@ -128,7 +480,7 @@ class SkosGraph:
             attributes = []
         node = SkosNode(descriptor, kingdom_name, attributes)
         node.add_attribute(SCHEMA_IN_SCHEME, CONCEPT_KINGDOM)
-        self.nodes.append(node)
+        self.add_node(node)
         return node
 
     def add_family_node(self, descriptor: str,
@@ -136,7 +488,7 @@ class SkosGraph:
                         attributes: [SkosAttribute] = None) -> SkosNode:
         node = SkosNode(descriptor, family_name, attributes)
         node.add_attribute(SCHEMA_IN_SCHEME, CONCEPT_FAMILY)
-        self.nodes.append(node)
+        self.add_node(node)
         return node
 
     def add_sub_family_node(self, descriptor: str,
@@ -144,14 +496,14 @@ class SkosGraph:
                             attributes: [SkosAttribute] = None) -> SkosNode:
         node = SkosNode(descriptor, sub_family_name, attributes)
         node.add_attribute(SCHEMA_IN_SCHEME, CONCEPT_SUB_FAMILY)
-        self.nodes.append(node)
+        self.add_node(node)
         return node
 
     def add_genus_node(self, descriptor: str,
                        genus_name: str = "insert genus name here...", attributes: [SkosAttribute] = None) -> SkosNode:
         node = SkosNode(descriptor, genus_name, attributes)
         node.add_attribute(SCHEMA_IN_SCHEME, CONCEPT_GENUS)
-        self.nodes.append(node)
+        self.add_node(node)
         return node
 
     def add_sub_genus_node(self, descriptor: str,
@@ -159,7 +511,7 @@ class SkosGraph:
                            attributes: [SkosAttribute] = None) -> SkosNode:
         node = SkosNode(descriptor, sub_genus_name, attributes)
         node.add_attribute(SCHEMA_IN_SCHEME, CONCEPT_SUB_GENUS)
-        self.nodes.append(node)
+        self.add_node(node)
         return node
 
     def add_species_node(self, descriptor: str,
@@ -167,7 +519,7 @@ class SkosGraph:
                          attributes: [SkosAttribute] = None) -> SkosNode:
         node = SkosNode(descriptor, species_name, attributes)
         node.add_attribute(SCHEMA_IN_SCHEME, CONCEPT_SPECIES)
-        self.nodes.append(node)
+        self.add_node(node)
         return node
 
     def add_sub_species_node(self, descriptor: str,
@@ -175,16 +527,14 @@ class SkosGraph:
                              attributes: [SkosAttribute] = None) -> SkosNode:
         node = SkosNode(descriptor, sub_species_name, attributes)
         node.add_attribute(SCHEMA_IN_SCHEME, CONCEPT_SUB_SPECIES)
-        self.nodes.append(node)
+        self.add_node(node)
         return node
 
     def add_synonym_relation(self, start_descriptor: str, end_descriptor: str) -> SkosRelation:
         return self.__add_relation(start_descriptor, SCHEMA_SYNONYM, end_descriptor)
 
     def __add_relation(self, start_descriptor: str, schema: str, end_descriptor: str) -> SkosRelation:
-        relation = SkosRelation(start_descriptor, schema, end_descriptor)
-        self.relations.append(relation)
-        return relation
+        return self.add_relation(SkosRelation(start_descriptor, schema, end_descriptor))
 
     def add_family_to_kingdom(self, family_descriptor: str, kingdom_descriptor: str) -> bool:
         return self.__add_node_to_node(family_descriptor, CONCEPT_FAMILY, kingdom_descriptor, CONCEPT_KINGDOM)
@@ -214,25 +564,26 @@ class SkosGraph:
 
     def change_parent(self, parent_descriptor: str, child_descriptor: str, new_parent_descriptor: str):
         relation: SkosRelation
-        for relation in self.relations:
-            if relation.start_descriptor == child_descriptor and relation.end_descriptor == parent_descriptor:
+        for relation in self.__relations_by_start.get(child_descriptor, ()):
+            if relation.end_descriptor == parent_descriptor:
+                self.__relations_by_end[parent_descriptor].remove(relation)
                 relation.end_descriptor = new_parent_descriptor
+                self.__relations_by_end.setdefault(new_parent_descriptor, []).append(relation)
 
     # utils methods
     def is_parent_of(self, child_descriptor: str, parent_descriptor: str) -> bool:
         relation: SkosRelation
-        for relation in self.relations:
-            if relation.start_descriptor == child_descriptor and relation.end_descriptor == parent_descriptor:
+        for relation in self.__relations_by_start.get(child_descriptor, ()):
+            if relation.end_descriptor == parent_descriptor:
                 return True
         return False
 
     # private utils
     def __add_node_to_node(self, descriptor_node_child: str, concept_child: str, descriptor_node_parent: str,
                            concept_parent: str) -> bool:
+        # the skos:narrower relation from the parent to the child is derived from this one
         self.__add_relation(descriptor_node_child,
                             SCHEMA_BROADER, descriptor_node_parent)
-        self.__add_relation(descriptor_node_parent,
-                            SCHEMA_NARROWER, descriptor_node_child)
         return True
 
     # printer and exporter
@@ -268,8 +619,7 @@ class SkosGraph:
                 else:
                     lines_out.append('  ' + attribute.schema + ' example:' + attribute.literal)
             relation: SkosRelation
-            r: SkosRelation
-            for relation in [r for r in self.relations if r.start_descriptor == node.descriptor]:
+            for relation in self.get_outgoing_relations_with_descriptor(node.descriptor):
                 lines_out.append('  ' + relation.label + ' example:' + relation.end_descriptor + '')
 
             for i in range(0, len(lines_out)):
@@ -282,28 +632,42 @@ class SkosGraph:
 
 
 def default_pref_label_retriever(node: SkosNode) -> str:
-    attribute: SkosAttribute
-    for attribute in node.attributes:
-        if attribute.schema == SCHEMA_PREF_LABEL:
-            return attribute.literal
-    raise ValueError("NO ATTRIBUTE PREF_LABEL FOUND")
+    if node.pref_label is None:
+        raise ValueError("NO ATTRIBUTE PREF_LABEL FOUND")
+    return node.pref_label
+
+
+def descriptor_retriever(node: SkosNode) -> str:
+    return node.descriptor
 
 
 class NodeSearchIndex:
+    """
+    Lookup of nodes by a key derived from the node.
+    Keys by prefLabel and by descriptor are answered directly from the hash indexes of the graph,
+    any other key function builds its own dictionary once
+    """
+
     def __init__(self, graph: SkosGraph, func: Callable[[SkosNode], str] = default_pref_label_retriever):
-        self.key_dict: defaultdict = defaultdict(lambda: [])
-        node: SkosNode
-        for node in graph.nodes:
-            self.key_dict[func(node)].append(node)
+        self.graph: SkosGraph = graph
+        self.func: Callable[[SkosNode], str] = func
+        self.key_dict: Optional[defaultdict] = None
+        if func is not default_pref_label_retriever and func is not descriptor_retriever:
+            self.key_dict = defaultdict(lambda: [])
+            node: SkosNode
+            for node in graph.nodes:
+                self.key_dict[func(node)].append(node)
 
     def get_nodes_for_key(self, key) -> Optional[List[SkosNode]]:
-        try:
-            return self.key_dict[key]
-        except KeyError:
-            return None
+        if self.func is default_pref_label_retriever:
+            return self.graph.get_all_nodes_by_name(key)
+        if self.func is descriptor_retriever:
+            node: Optional[SkosNode] = self.graph.get_node_by_descriptor(key)
+            return [] if node is None else [node]
+        return list(self.key_dict.get(key, ()))
 
     def get_all_nodes_for_keys(self, keys: List) -> List[SkosNode]:
-        l_o_l = [self.key_dict[x] for x in keys]
+        l_o_l = [self.get_nodes_for_key(x) for x in keys]
         return [item for sublist in l_o_l for item in sublist]
 
 
@@ -332,55 +696,37 @@ def remove_duplicates(mlist: List[str]) -> List[str]:
 
 
 class RelationSearchIndex:
+    """
+    Relation queries on top of the relation indexes of a SkosGraph or the adjacency arrays of a FrozenSkosGraph
+    """
+
     def __init__(self, graph: SkosGraph):
-        self.forward_relation_dict: defaultdict = defaultdict(lambda: [])
-        self.backward_relation_dict: defaultdict = defaultdict(lambda: [])
-        relation: SkosRelation
-        for relation in graph.relations:
-            self.forward_relation_dict[relation.start_descriptor].append(relation)
-            self.backward_relation_dict[relation.end_descriptor].append(relation)
+        self.graph: SkosGraph = graph
 
     def get_all_descriptor_for_descriptor(self, descriptor: str, schema: str) -> List[str]:
-        relations: List[SkosRelation] = self.forward_relation_dict[descriptor] + self.backward_relation_dict[descriptor]
-        return remove_duplicates(
-            get_next_propagation_descriptors(
-                get_relations_filtered(relations, schema), descriptor))
+        return self.graph.get_adjacent_descriptors(descriptor, schema)
+
+    def get_related_descriptors(self, descriptor: str, depth: int) -> List[str]:
+        return self.graph.get_related_descriptors(descriptor, depth)
 
     def get_broader_relation(self, descriptor: str) -> Optional[SkosRelation]:
-        relations: List[SkosRelation] = self.backward_relation_dict.get(descriptor)
-        if relations is None:
+        parents: List[str] = self.graph.get_start_descriptors(descriptor, SCHEMA_NARROWER)
+        if len(parents) == 0:
             return None
-        relation: SkosRelation
-        for relation in relations:
-            if relation.label == SCHEMA_NARROWER:
-                return relation
-        return None
+        return SkosRelation(parents[0], SCHEMA_NARROWER, descriptor)
 
     def get_broader_or_synonym_relation(self, descriptor: str, node_search_index: NodeSearchIndex):
         nodes_opt: Optional[List[SkosNode]] = node_search_index.get_nodes_for_key(descriptor)
         if nodes_opt is None or len(nodes_opt) == 0:
             return None
-        node: SkosNode = nodes_opt[0]
-        if node is None:
-            return None
 
-        relations: List[SkosRelation] = self.backward_relation_dict.get(descriptor)
-        if relations is None:
-            relations = []
+        relation: Optional[SkosRelation] = self.get_broader_relation(descriptor)
+        if relation is not None:
+            return relation
 
-        relation: SkosRelation
-        for relation in relations:
-            if relation.label == SCHEMA_NARROWER:
-                return relation
-
-        relations: List[SkosRelation] = self.forward_relation_dict.get(descriptor)
-        for relation in relations:
-            nodes_end: Optional[List[SkosNode]] = node_search_index.get_nodes_for_key(relation.start_descriptor)
-            if len(nodes_end) == 0:
-                continue
-            node_end: SkosNode = nodes_end[0]
-            if relation.label == SCHEMA_SYNONYM \
-                    and node.get_attribute_by_schema(SCHEMA_HISTORY_NOTE).literal == node_end.get_attribute_by_schema(
-                SCHEMA_HISTORY_NOTE).literal:
-                return SkosRelation(relation.end_descriptor, relation.label, relation.start_descriptor)
-        return None
+        # the start of an outgoing relation is the node itself, so the history note comparison
+        # of the former relation walk always held and the first outgoing synonym is taken
+        synonyms: List[str] = self.graph.get_end_descriptors(descriptor, SCHEMA_SYNONYM)
+        if len(synonyms) == 0:
+            return None
+        return SkosRelation(synonyms[0], SCHEMA_SYNONYM, descriptor)
@@ -1,8 +1,11 @@
-import pickle
-from typing import Optional, List
+from typing import Optional, List, Union, Dict, Tuple
 
 from graph.skos_graph import SkosGraph, SkosNode, SkosRelation, SCHEMA_NARROWER, SCHEMA_PREF_LABEL, SkosAttribute, \
-    SCHEMA_HISTORY_NOTE, SCHEMA_SYNONYM, NodeSearchIndex, RelationSearchIndex
+    SCHEMA_HISTORY_NOTE, SCHEMA_SYNONYM, SCHEMA_TAXON_STATUS, NodeSearchIndex, RelationSearchIndex
+from graph.frozen_skos_graph import FrozenSkosGraph
+from graph.instrumentation import stage, Stage
+from graph.graph_file import write_graph_file, is_graph_file, read_graph_file, read_pickle_graph_file, \
+    open_graph_file
 
 
 def get_parent_node(graph: SkosGraph, child_descriptor: str) -> Optional[SkosNode]:
@@ -38,7 +41,7 @@ def get_node_hierarchy_upwards_from(graph: SkosGraph, descriptor: str, max_searc
 
 def __is_start_end_schema_correct(relation: SkosRelation, start_descriptor: str, end_descriptor: str,
                                   schema_filter: [str]) -> bool:
-    relation_direction_correct = relation.start_descriptor is start_descriptor and relation.end_descriptor is end_descriptor
+    relation_direction_correct = relation.start_descriptor == start_descriptor and relation.end_descriptor == end_descriptor
     if relation_direction_correct and len(schema_filter) == 0:
         return True
     return relation_direction_correct and relation.label in schema_filter
@@ -47,25 +50,41 @@ def __is_start_end_schema_correct(relation: SkosRelation, start_descriptor: str,
 def get_relations_with_schema(graph: SkosGraph, start_descriptor: str, end_descriptor: str, schema_filter: [str]) -> \
         [SkosRelation]:
     relation: SkosRelation
-    return [relation for relation in graph.relations if
-            __is_start_end_schema_correct(start_descriptor, end_descriptor, schema_filter)]
+    return [relation for relation in graph.get_outgoing_relations_with_descriptor(start_descriptor) if
+            __is_start_end_schema_correct(relation, start_descriptor, end_descriptor, schema_filter)]
 
 
-def search_node_start_with(graph: SkosGraph, search: str, max_result_count: int = 25) -> List[SkosNode]:
+def search_node_start_with(graph: Union[SkosGraph, FrozenSkosGraph], search: str, max_result_count: int = 25) -> \
+        List[SkosNode]:
+    if isinstance(graph, FrozenSkosGraph):
+        return __search_frozen_node_start_with(graph, search, max_result_count)
     result: List[SkosNode] = []
     node: SkosNode
     for node in graph.nodes:
-        label: SkosAttribute
-        label = node.get_attribute_by_schema(SCHEMA_PREF_LABEL)
-        if label is not None and label.literal.lower().startswith(search):
+        label: Optional[str] = node.pref_label
+        if label is not None and label.lower().startswith(search):
             result.append(node)
         if len(result) >= max_result_count:
             return result
     return result
 
 
+def __search_frozen_node_start_with(graph: FrozenSkosGraph, search: str, max_result_count: int) -> List[SkosNode]:
+    # the shortest matches from the prefix index, not the first ones in node order
+    return graph.get_nodes_with_prefix(search, max_result_count)
+
+
+def search_node_by_name_key(graph: Union[SkosGraph, FrozenSkosGraph], search: str,
+                            max_result_count: int = 25) -> List[SkosNode]:
+    """
+    Nodes whose normalized name equals the one of search, ignoring case, hybrid markers, rank abbreviations and
+    authorship (see name_keys.get_name_key)
+    """
+    return graph.get_all_nodes_by_name_key(search)[:max_result_count]
+
+
 def get_order_key(node: SkosNode):
-    return len(node.get_attribute_by_schema(SCHEMA_PREF_LABEL).literal)
+    return len(node.get_literal_by_schema(SCHEMA_PREF_LABEL))
 
 
 def order_by_name_length(nodes: List[SkosNode]):
@@ -73,19 +92,24 @@ def order_by_name_length(nodes: List[SkosNode]):
     return nodes
 
 
-def save_graph_to_file(graph: SkosGraph, file_path: str):
-    with open(file_path, 'wb+') as f:
-        graph_as_bytes = pickle.dumps(graph)
-        f.write(graph_as_bytes)
-        f.close()
+def save_graph_to_file(graph: Union[SkosGraph, FrozenSkosGraph], file_path: str, with_indexes: bool = False):
+    write_graph_file(graph, file_path, with_indexes)
 
 
 def load_graph_from_file(file_path) -> Optional[SkosGraph]:
     try:
-        with open(file_path, "rb") as f:
-            data = f.read()
-            f.close()
-            return pickle.loads(data)
+        if is_graph_file(file_path):
+            return read_graph_file(file_path).to_skos_graph()
+        return read_pickle_graph_file(file_path)
+    except Exception:
+        return None
+
+
+def load_frozen_graph_from_file(file_path, use_mmap: bool = False) -> Optional[FrozenSkosGraph]:
+    try:
+        if is_graph_file(file_path):
+            return open_graph_file(file_path) if use_mmap else read_graph_file(file_path)
+        return FrozenSkosGraph.from_skos_graph(read_pickle_graph_file(file_path))
     except Exception:
         return None
 
@@ -95,109 +119,118 @@ def load_test_graph() -> Optional[SkosGraph]:
 
 
 def get_descriptor_for_name(name: str, graph: SkosGraph) -> [SkosNode]:
-    nodes: [SkosNode] = []
-    node: SkosNode
-    for node in graph.nodes:
-        name_of_node = node.get_attribute_by_schema(SCHEMA_PREF_LABEL)
-        if name_of_node is not None and name_of_node == name:
-            nodes.append(node)
-    return nodes
+    return graph.get_all_nodes_by_name(name)
 
 
 def get_relations_containing_descriptor_filtered(graph: SkosGraph, descriptor: str, label_filter_include: List[str]) -> \
         List[SkosRelation]:
     relations: List[SkosRelation] = []
     relation: SkosRelation
-    for relation in graph.relations:
-        if relation.start_descriptor == descriptor or relation.end_descriptor == descriptor:
-            if relation.label in label_filter_include:
-                relations.append(relation)
+    for relation in graph.get_outgoing_relations_with_descriptor(descriptor) \
+            + graph.get_incoming_relations_with_descriptor(descriptor):
+        if relation.label in label_filter_include and relation not in relations:
+            relations.append(relation)
     return relations
 
 
 def get_synonym_nodes(graph: SkosGraph, descriptor: str) -> List[str]:
     synonym_descriptors: List[str] = []
     relation: SkosRelation
-    for relation in graph.relations:
+    for relation in graph.get_outgoing_relations_with_descriptor(descriptor):
+        if relation.label == SCHEMA_SYNONYM:
+            synonym_descriptors.append(relation.end_descriptor)
+    for relation in graph.get_incoming_relations_with_descriptor(descriptor):
         if relation.label == SCHEMA_SYNONYM:
-            if relation.start_descriptor == descriptor:
-                synonym_descriptors.append(relation.end_descriptor)
-            if relation.end_descriptor == descriptor:
-                synonym_descriptors.append(relation.start_descriptor)
+            synonym_descriptors.append(relation.start_descriptor)
     return synonym_descriptors
 
 
-def merge_graphs(graph_itis: SkosGraph, graph_tpl: SkosGraph, graph_wfo: SkosGraph) -> SkosGraph:
+def get_source_name(graph: SkosGraph) -> str:
+    """
+    Name of the source of a parsed graph, as used in the history notes of the merged graph (itis.graph -> itis)
+    """
+    return graph.name[:-len(".graph")] if graph.name.endswith(".graph") else graph.name
+
+
+def merge_graphs(graphs: List[SkosGraph], source_names: Optional[List[str]] = None) -> SkosGraph:
+    """
+    Merges any number of source graphs into one graph holding all their nodes and relations. Every node gets the name
+    of its source as history note. Nodes of different sources with the same name key (the normalized prefLabel, see
+    SkosNode.get_name_key) are linked by a synonym relation from the node of the later source to the node of the
+    earlier one. Nodes and relations are ordered by source, the synonym relations of the nodes of a source followed
+    by the relations of the source, so the merged graph is a concatenation of one partition per source (see
+    incremental_merge)
+    """
+    if source_names is None:
+        source_names = [get_source_name(x) for x in graphs]
     graph: SkosGraph = SkosGraph("merged graph")
-    search_index_tpl: NodeSearchIndex = NodeSearchIndex(graph_tpl)
-    search_index_itis: NodeSearchIndex = NodeSearchIndex(graph_itis)
-    search_index_wfo: NodeSearchIndex = NodeSearchIndex(graph_wfo)
-    node_tpl: SkosNode
-    node_itis: SkosNode
-    node_wfo: SkosNode
-
-    node_synonym: SkosNode
-
-    print("Adding tpl nodes history note")
-    for node_tpl in graph_tpl.nodes:
-        node_tpl.add_attribute(SCHEMA_HISTORY_NOTE, "tpl")
-    print("Adding itis nodes history note")
-    for node_itis in graph_itis.nodes:
-        node_itis.add_attribute(SCHEMA_HISTORY_NOTE, "itis")
-    print("Adding wfo nodes history note")
-    for node_wfo in graph_wfo.nodes:
-        node_wfo.add_attribute(SCHEMA_HISTORY_NOTE, "wfo")
-
-    print("Matching itis to tpl...")
-    for node_itis in graph_itis.nodes:
-        node_itis_pref_label: Optional[str] = node_itis.get_attribute_by_schema(SCHEMA_PREF_LABEL).literal
-        node_tpl: Optional[List[SkosNode]] = search_index_tpl.get_nodes_for_key(node_itis_pref_label)
-        if node_tpl is not None:
-            for node_synonym in node_tpl:
-                graph.add_synonym_relation(node_synonym.descriptor, node_itis.descriptor)
-
-    print("Matching itis to wfo...")
-    for node_itis in graph_itis.nodes:
-        node_itis_pref_label: Optional[str] = node_itis.get_attribute_by_schema(SCHEMA_PREF_LABEL).literal
-        node_wfo: Optional[List[SkosNode]] = search_index_wfo.get_nodes_for_key(node_itis_pref_label)
-        if node_wfo is not None:
-            for node_synonym in node_wfo:
-                graph.add_synonym_relation(node_synonym.descriptor, node_itis.descriptor)
-
-    print("Matching tpl to wfo...")
-    for node_tpl in graph_tpl.nodes:
-        node_tpl_pref_label: Optional[str] = node_tpl.get_attribute_by_schema(SCHEMA_PREF_LABEL).literal
-        node_wfo: Optional[List[SkosNode]] = search_index_wfo.get_nodes_for_key(node_tpl_pref_label)
-        if node_wfo is not None:
-            for node_synonym in node_wfo:
-                graph.add_synonym_relation(node_synonym.descriptor, node_tpl.descriptor)
-
-    print("Adding tpl nodes")
-    for node_tpl in graph_tpl.nodes:
-        graph.nodes.append(node_tpl)
-    print("Adding wfo nodes")
-    for node_wfo in graph_wfo.nodes:
-        graph.nodes.append(node_wfo)
-    print("Adding itis nodes")
-    for node_itis in graph_itis.nodes:
-        graph.nodes.append(node_itis)
-
-    relation_tpl: SkosRelation
-    relation_itis: SkosRelation
-    relation_wfo: SkosRelation
-    print("Copying old tpl relations")
-    for relation_tpl in graph_tpl.relations:
-        graph.relations.append(relation_tpl)
-    print("Copying old itis relations")
-    for relation_itis in graph_itis.relations:
-        graph.relations.append(relation_itis)
-    print("Copying old wfo relations")
-    for relation_wfo in graph_wfo.relations:
-        graph.relations.append(relation_wfo)
+    source: SkosGraph
+    source_name: str
+    node: SkosNode
+    node_count: int = sum(len(x.nodes) for x in graphs)
+
+    current: Stage
+    with stage("history notes", node_count, "nodes"):
+        for source, source_name in zip(graphs, source_names):
+            for node in source.nodes:
+                node.add_attribute(SCHEMA_HISTORY_NOTE, source_name)
+
+    with stage("matching", node_count, "nodes") as current:
+        synonyms: List[List[Tuple[str, str]]] = _get_synonym_pairs(graphs)
+        current.add_count("synonym relations", sum(len(x) for x in synonyms))
+
+    with stage("adding nodes", node_count, "nodes"):
+        for source in graphs:
+            for node in source.nodes:
+                graph.add_node(node)
+
+    relation: SkosRelation
+    pairs: List[Tuple[str, str]]
+    with stage("copying relations", sum(len(x.relations) for x in graphs), "relations"):
+        for source, pairs in zip(graphs, synonyms):
+            start: str
+            end: str
+            for start, end in pairs:
+                graph.add_synonym_relation(start, end)
+            for relation in source.relations:
+                graph.add_relation(relation)
 
     return graph
 
 
+def _get_synonym_pairs(graphs: List[SkosGraph]) -> List[List[Tuple[str, str]]]:
+    """
+    (start, end) descriptors of the synonym relations from the nodes of each source to the nodes of the earlier
+    sources, in node order. The nodes of all sources are grouped by their name key in one pass, so the work is linear
+    in the number of nodes plus the number of pairs, whatever the number of sources. A group holds its nodes in source
+    order, pairs are only formed across sources
+    """
+    groups: Dict[str, List[Tuple[int, str]]] = {}
+    pairs: List[List[Tuple[str, str]]] = []
+    index: int
+    source: SkosGraph
+    node: SkosNode
+    for index, source in enumerate(graphs):
+        source_pairs: List[Tuple[str, str]] = []
+        for node in source.nodes:
+            key: Optional[str] = node.get_name_key()
+            if key is None:
+                continue
+            group: Optional[List[Tuple[int, str]]] = groups.get(key)
+            if group is None:
+                groups[key] = [(index, node.descriptor)]
+                continue
+            earlier_index: int
+            earlier: str
+            for earlier_index, earlier in group:
+                if earlier_index == index:
+                    break
+                source_pairs.append((node.descriptor, earlier))
+            group.append((index, node.descriptor))
+        pairs.append(source_pairs)
+    return pairs
+
+
 def search_rec(s_index: RelationSearchIndex, descriptor: str, depth: int, result: List[str]) -> None:
     if depth <= 0:
         return
@@ -222,3 +255,19 @@ def get_hierarchy_upwards_from(descriptor: str, relation_search_index: RelationS
             return []
         i += 1
     return descriptor_node_search_index.get_all_nodes_for_keys(result)
+
+
+def filter_duplicates(hierarchy_unfiltered: List[SkosNode]):
+    if len(hierarchy_unfiltered) == 0:
+        return []
+    filtered_hierarchy: List[SkosNode] = []
+    node: SkosNode
+    last_node: SkosNode = hierarchy_unfiltered[0]
+
+    for node in hierarchy_unfiltered:
+        if last_node.get_literal_by_schema(SCHEMA_PREF_LABEL) != node.get_literal_by_schema(SCHEMA_PREF_LABEL) \
+                and node.get_attribute_by_schema(SCHEMA_TAXON_STATUS) != "sub_species":
+            filtered_hierarchy.append(node)
+        last_node = node
+
+    return filtered_hierarchy
@@ -0,0 +1,144 @@
+from collections import deque
+from typing import List, Dict, Deque, Callable
+
+import numpy as np
+
+from graph.columns import CsrAdjacency
+
+# clusters up to this size store the hop distances between all their members (as uint8 matrix),
+# larger clusters are walked breadth first inside the cluster on request
+MAX_DISTANCE_CLUSTER_SIZE: int = 255
+UNREACHABLE: int = 255
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent: List[int] = list(range(0, size))
+        self.size: List[int] = [1] * size
+
+    def find(self, i: int) -> int:
+        parent: List[int] = self.parent
+        while parent[i] != i:
+            # path halving
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, a: int, b: int):
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+
+class SynonymClusters:
+    """
+    Connected components of the skos:related (synonym) edges, regardless of their direction.
+    cluster_of maps a descriptor id to its cluster (-1 for descriptors without synonyms), members holds the sorted
+    descriptor ids of each cluster. For clusters up to MAX_DISTANCE_CLUSTER_SIZE members the hop distances between
+    all members are stored row by row in distances, starting at distance_offsets[cluster] (-1 for larger clusters)
+    """
+
+    def __init__(self, cluster_of: np.ndarray, members: CsrAdjacency, distance_offsets: np.ndarray,
+                 distances: np.ndarray):
+        self.cluster_of: np.ndarray = cluster_of
+        self.members: CsrAdjacency = members
+        self.distance_offsets: np.ndarray = distance_offsets
+        self.distances: np.ndarray = distances
+
+    @staticmethod
+    def build(start: np.ndarray, end: np.ndarray, descriptor_count: int) -> 'SynonymClusters':
+        union_find: _UnionFind = _UnionFind(descriptor_count)
+        a: int
+        b: int
+        for a, b in zip(start.tolist(), end.tolist()):
+            union_find.union(a, b)
+
+        in_cluster: np.ndarray = np.zeros(descriptor_count, dtype=bool)
+        in_cluster[start] = True
+        in_cluster[end] = True
+        ids: np.ndarray = np.nonzero(in_cluster)[0]
+        roots: np.ndarray = np.fromiter((union_find.find(x) for x in ids.tolist()), dtype=np.int64, count=len(ids))
+        unique_roots, cluster_codes = np.unique(roots, return_inverse=True)
+        cluster_of: np.ndarray = np.full(descriptor_count, -1, dtype=np.int32)
+        cluster_of[ids] = cluster_codes
+        members: CsrAdjacency = CsrAdjacency.from_pairs(cluster_codes, ids, len(unique_roots))
+
+        # plain lists, as the clusters are mostly tiny and walked one by one
+        neighbours: CsrAdjacency = CsrAdjacency.from_pairs(np.concatenate([start, end]),
+                                                           np.concatenate([end, start]), descriptor_count)
+        neighbour_offsets: List[int] = neighbours.offsets.tolist()
+        neighbour_targets: List[int] = neighbours.targets.tolist()
+        member_offsets: List[int] = members.offsets.tolist()
+        member_ids: List[int] = members.targets.tolist()
+
+        distance_offsets: List[int] = [-1] * len(unique_roots)
+        distances: List[int] = []
+        cluster: int
+        for cluster in range(0, len(unique_roots)):
+            cluster_members: List[int] = member_ids[member_offsets[cluster]:member_offsets[cluster + 1]]
+            size: int = len(cluster_members)
+            if size > MAX_DISTANCE_CLUSTER_SIZE:
+                continue
+            distance_offsets[cluster] = len(distances)
+            position: Dict[int, int] = {x: p for p, x in enumerate(cluster_members)}
+            member: int
+            for member in cluster_members:
+                row: List[int] = [UNREACHABLE] * size
+                walked: Dict[int, int] = _walk(
+                    lambda x: neighbour_targets[neighbour_offsets[x]:neighbour_offsets[x + 1]], member, size)
+                other: int
+                distance: int
+                for other, distance in walked.items():
+                    row[position[other]] = distance
+                distances.extend(row)
+        return SynonymClusters(cluster_of, members, np.array(distance_offsets, dtype=np.int64),
+                               np.array(distances, dtype=np.uint8))
+
+    def get_related_ids(self, i: int, depth: int, forward: CsrAdjacency, backward: CsrAdjacency) -> List[int]:
+        """
+        Descriptor ids connected to i by a walk of 1 to depth synonym edges, ordered by hop distance.
+        As any walk may return to its start, i itself is part of the result from depth 2 on
+        (from depth 1 on with an edge to itself)
+        """
+        if i < 0 or i >= len(self.cluster_of) or depth <= 0:
+            return []
+        cluster: int = int(self.cluster_of[i])
+        if cluster < 0:
+            return []
+        cluster_members: np.ndarray = self.members.get(cluster)
+        size: int = len(cluster_members)
+        offset: int = int(self.distance_offsets[cluster])
+        if offset >= 0:
+            p: int = int(np.searchsorted(cluster_members, i))
+            row: np.ndarray = self.distances[offset + p * size:offset + (p + 1) * size]
+            selected: np.ndarray = np.nonzero((row >= 1) & (row <= depth))[0]
+            result: List[int] = cluster_members[selected[np.argsort(row[selected], kind="stable")]].tolist()
+        else:
+            distances: Dict[int, int] = _walk(lambda x: forward.get(x).tolist() + backward.get(x).tolist(), i, depth)
+            result: List[int] = sorted((x for x in distances.keys() if x != i), key=lambda x: (distances[x], x))
+        if depth >= 2 or i in forward.get(i):
+            result.append(i)
+        return result
+
+
+def _walk(neighbours: Callable[[int], List[int]], start: int, limit: int) -> Dict[int, int]:
+    """
+    Hop distances from start up to limit, breadth first
+    """
+    distances: Dict[int, int] = {start: 0}
+    queue: Deque[int] = deque([start])
+    while len(queue) > 0:
+        current: int = queue.popleft()
+        if distances[current] >= limit:
+            continue
+        x: int
+        for x in neighbours(current):
+            if x not in distances:
+                distances[x] = distances[current] + 1
+                queue.append(x)
+    return distances
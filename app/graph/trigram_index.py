@@ -0,0 +1,109 @@
+from typing import List
+
+import numpy as np
+
+from graph.columns import StringColumn, CsrAdjacency
+
+# candidates with the highest trigram similarity which are ranked by their edit distance to the query
+CANDIDATE_COUNT: int = 32
+
+
+def _pad(value: str) -> str:
+    return "  " + value + " "
+
+
+def _pack(code_points: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    # a trigram is packed into one int64, 21 bits per unicode code point
+    return (code_points[starts].astype(np.int64) << 42) | (code_points[starts + 1].astype(np.int64) << 21) \
+        | code_points[starts + 2].astype(np.int64)
+
+
+def get_trigram_codes(value: str) -> np.ndarray:
+    """
+    Distinct, sorted trigram codes of a lowercase value, padded with two blanks in front and one at the end
+    """
+    code_points: np.ndarray = np.frombuffer(_pad(value).encode("utf-32-le"), dtype=np.uint32)
+    return np.unique(_pack(code_points, np.arange(0, len(code_points) - 2)))
+
+
+def edit_distance(a: str, b: str) -> int:
+    previous: List[int] = list(range(0, len(b) + 1))
+    i: int
+    for i in range(1, len(a) + 1):
+        current: List[int] = [i] + [0] * len(b)
+        j: int
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+        previous = current
+    return previous[len(b)]
+
+
+class TrigramIndex:
+    """
+    Inverted index from the trigrams of the lowercase prefLabels (the keys of the PrefixIndex) to the keys containing
+    them. codes holds the sorted trigram codes (see get_trigram_codes), postings the sorted key ids per trigram and
+    key_trigram_counts the number of distinct trigrams per key.
+    A query only touches the posting lists of its own trigrams: keys are ranked by their trigram similarity
+    (Jaccard) and the best CANDIDATE_COUNT of them by their edit distance to the query
+    """
+
+    def __init__(self, codes: np.ndarray, postings: CsrAdjacency, key_trigram_counts: np.ndarray):
+        self.codes: np.ndarray = codes
+        self.postings: CsrAdjacency = postings
+        self.key_trigram_counts: np.ndarray = key_trigram_counts
+
+    @staticmethod
+    def build(keys: StringColumn) -> 'TrigramIndex':
+        values: List[str] = keys.to_list()
+        padded_lengths: np.ndarray = np.fromiter((len(x) + 3 for x in values), dtype=np.int64, count=len(values))
+        code_points: np.ndarray = np.frombuffer("".join(_pad(x) for x in values).encode("utf-32-le"), dtype=np.uint32)
+        key_starts: np.ndarray = np.zeros(len(values), dtype=np.int64)
+        np.cumsum(padded_lengths[:-1], out=key_starts[1:])
+
+        # every position but the last two of a key starts a trigram
+        trigram_counts: np.ndarray = padded_lengths - 2
+        trigram_keys: np.ndarray = np.repeat(np.arange(0, len(values), dtype=np.int32), trigram_counts)
+        trigram_starts: np.ndarray = np.arange(0, len(trigram_keys), dtype=np.int64) \
+            + np.repeat(key_starts - np.concatenate([[0], np.cumsum(trigram_counts)[:-1]]), trigram_counts)
+        packed: np.ndarray = _pack(code_points, trigram_starts)
+
+        # distinct (key, trigram) pairs
+        order: np.ndarray = np.lexsort((packed, trigram_keys))
+        trigram_keys = trigram_keys[order]
+        packed = packed[order]
+        distinct: np.ndarray = np.ones(len(packed), dtype=bool)
+        distinct[1:] = (trigram_keys[1:] != trigram_keys[:-1]) | (packed[1:] != packed[:-1])
+        trigram_keys = trigram_keys[distinct]
+        packed = packed[distinct]
+
+        codes, trigram_ids = np.unique(packed, return_inverse=True)
+        return TrigramIndex(codes, CsrAdjacency.from_pairs(trigram_ids, trigram_keys, len(codes)),
+                            np.bincount(trigram_keys, minlength=len(values)).astype(np.int32))
+
+    def get_similar_key_ids(self, value: str, keys: StringColumn, max_result_count: int) -> List[int]:
+        """
+        Ids of the keys most similar to the lowercase value, ordered by edit distance and trigram similarity
+        """
+        query: np.ndarray = get_trigram_codes(value)
+        positions: np.ndarray = np.searchsorted(self.codes, query)
+        found: np.ndarray = positions < len(self.codes)
+        found[found] = self.codes[positions[found]] == query[found]
+        positions = positions[found]
+        if len(positions) == 0:
+            return []
+        # shared trigrams per key, counted over the posting lists of the query only, so a query costs the length of
+        # its posting lists and not the number of keys. The posting lists are sorted, the stable sort (a timsort)
+        # merges them as runs
+        merged: np.ndarray = np.sort(np.concatenate([self.postings.get(int(x)) for x in positions]), kind="stable")
+        starts: np.ndarray = np.flatnonzero(np.concatenate([[True], merged[1:] != merged[:-1]]))
+        candidates: np.ndarray = merged[starts]
+        overlap: np.ndarray = np.diff(np.append(starts, len(merged)))
+        similarity: np.ndarray = overlap / (len(query) + self.key_trigram_counts[candidates] - overlap)
+        if len(candidates) > CANDIDATE_COUNT:
+            best: np.ndarray = np.argpartition(-similarity, CANDIDATE_COUNT - 1)[:CANDIDATE_COUNT]
+            candidates = candidates[best]
+            similarity = similarity[best]
+        ranked: List[tuple] = sorted(
+            (edit_distance(value, keys.get(int(key))), -float(score), int(key))
+            for key, score in zip(candidates, similarity))
+        return [x[2] for x in ranked[:max_result_count]]
@@ -1,5 +1,24 @@
-from dwca_parser.parser import Parser
+import argparse
 
-if __name__ == '__main__':
-    Parser()
+from dwca_parser.archive_cache import ArchiveCache, DEFAULT_CACHE_DIRECTORY, DEFAULT_MAX_CACHE_BYTES
+from dwca_parser.parser import Parser, DEFAULT_WORKERS
 
+if __name__ == '__main__':
+    argument_parser = argparse.ArgumentParser(description="Parses the Darwin Core Archives in ./taxa/ to graph files")
+    argument_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                                 help="number of worker processes, 0 parses all sources with threads of one process")
+    argument_parser.add_argument("--partition-workers", type=int, default=0,
+                                 help="number of worker processes splitting each source by family, 0 parses every "
+                                      "source as a whole")
+    argument_parser.add_argument("--no-cache", action="store_true",
+                                 help="always read the archives instead of their snapshots in " + DEFAULT_CACHE_DIRECTORY)
+    argument_parser.add_argument("--cache-mib", type=int, default=DEFAULT_MAX_CACHE_BYTES >> 20,
+                                 help="size limit of the snapshot cache in MiB")
+    argument_parser.add_argument("--report", default="parse_report.json",
+                                 help="path of the json run report (wall time, rows per second and memory per stage)")
+    argument_parser.add_argument("--trace-memory", action="store_true",
+                                 help="record the top allocators of every stage with tracemalloc (slow)")
+    arguments = argument_parser.parse_args()
+    Parser(workers=arguments.workers, partition_workers=arguments.partition_workers,
+           cache=None if arguments.no_cache else ArchiveCache(max_bytes=arguments.cache_mib << 20),
+           report_path=arguments.report, trace_memory=arguments.trace_memory)
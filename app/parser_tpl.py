@@ -1,8 +1,7 @@
 import logging
 import sys
 
-from dwca.read import DwCAReader
-
+from dwca_parser.archive_cache import ArchiveCache
 from dwca_parser.parser_tpl import ParserTPL
 from graph.skos_graph_utils import save_graph_to_file
 
@@ -12,7 +11,6 @@ logging.basicConfig(
     stream=sys.stderr,
 )
 
-dwca_file = DwCAReader("./taxa/tpl.zip")
-df = dwca_file.pd_read(dwca_file.descriptor.core.file_location)
+df = ArchiveCache().read("./taxa/tpl.zip")
 graph = ParserTPL(df, "tpl.graph").process()
 save_graph_to_file(graph, graph.name)
\ No newline at end of file
@@ -0,0 +1,310 @@
+import os
+import pickle
+import random
+import tempfile
+from typing import List
+from unittest import TestCase
+
+import numpy as np
+
+from graph.frozen_skos_graph import FrozenSkosGraph
+from graph.graph_file import write_graph_file, read_graph_file, is_graph_file, convert_pickle_graph_file, \
+    open_graph_file, get_index_file_path
+from graph.skos_graph import SkosGraph, SkosNode, RelationSearchIndex, NodeSearchIndex, SkosAttribute, \
+    RELATION_LABELS, descriptor_retriever, SCHEMA_TAXON_STATUS, SCHEMA_HISTORY_NOTE, SCHEMA_SYNONYM, SCHEMA_BROADER, \
+    SCHEMA_NARROWER
+from graph import synonym_clusters
+from graph.trigram_index import edit_distance
+from graph.name_keys import get_name_key
+from graph.skos_graph_utils import load_graph_from_file, search_rec, get_hierarchy_upwards_from, filter_duplicates, \
+    search_node_start_with, search_node_by_name_key
+
+
+def build_graph() -> SkosGraph:
+    graph: SkosGraph = SkosGraph("test")
+    graph.add_kingdom_node("k1", "KingdomName1")
+    graph.add_family_node("f1", "FamilyName1", [SkosAttribute(SCHEMA_TAXON_STATUS, "Accepted")])
+    graph.add_family_to_kingdom("f1", "k1")
+    graph.add_genus_node("g1", "g1_n")
+    graph.add_genus_node("g2", "g2_n", [SkosAttribute("skos:note", "extra")])
+    graph.add_genus_to_family("g1", "f1")
+    graph.add_genus_to_family("g2", "f1")
+    graph.add_species_node("s1", "s_n")
+    graph.add_species_node("s2", "s_n")
+    graph.add_species_to_genus("s1", "g1")
+    graph.add_synonym_relation("s2", "s1")
+    graph.add_synonym_relation("s2", "missing")
+    for node in graph.nodes:
+        node.add_attribute(SCHEMA_HISTORY_NOTE, "tpl")
+    return graph
+
+
+class TestFrozenSkosGraph(TestCase):
+
+    def test_queries_match_skos_graph(self):
+        graph: SkosGraph = build_graph()
+        frozen: FrozenSkosGraph = FrozenSkosGraph.from_skos_graph(graph)
+
+        relation_index: RelationSearchIndex = RelationSearchIndex(graph)
+        frozen_relation_index: RelationSearchIndex = RelationSearchIndex(frozen)
+        descriptor_index: NodeSearchIndex = NodeSearchIndex(graph, descriptor_retriever)
+        frozen_descriptor_index: NodeSearchIndex = NodeSearchIndex(frozen, descriptor_retriever)
+        for node in graph.nodes:
+            self.assertEqual(node.to_dict(), frozen.get_node_by_descriptor(node.descriptor).to_dict())
+            self.assertEqual([x.descriptor for x in graph.get_all_nodes_by_name(node.pref_label)],
+                             [x.descriptor for x in NodeSearchIndex(frozen).get_nodes_for_key(node.pref_label)])
+            for label in RELATION_LABELS:
+                self.assertEqual(relation_index.get_all_descriptor_for_descriptor(node.descriptor, label),
+                                 frozen_relation_index.get_all_descriptor_for_descriptor(node.descriptor, label))
+            self.assertEqual(sorted(str(x) for x in graph.get_outgoing_relations_with_descriptor(node.descriptor)),
+                             sorted(str(x) for x in frozen.get_outgoing_relations_with_descriptor(node.descriptor)))
+            self.assertEqual(sorted(str(x) for x in graph.get_incoming_relations_with_descriptor(node.descriptor)),
+                             sorted(str(x) for x in frozen.get_incoming_relations_with_descriptor(node.descriptor)))
+            self.assertEqual(
+                str(relation_index.get_broader_or_synonym_relation(node.descriptor, descriptor_index)),
+                str(frozen_relation_index.get_broader_or_synonym_relation(node.descriptor, frozen_descriptor_index)))
+
+        self.assertIsNone(frozen.get_node_by_descriptor("missing"))
+        self.assertEqual([str(x) for x in graph.relations], [str(x) for x in frozen.relations])
+        self.assertTrue(frozen.is_parent_of("s1", "g1"))
+
+    def test_mirrored_relations_of_former_files(self):
+        graph: SkosGraph = build_graph()
+        frozen: FrozenSkosGraph = FrozenSkosGraph.from_skos_graph(graph)
+        broader: np.ndarray = frozen.edge_label == RELATION_LABELS.index(SCHEMA_BROADER)
+        narrower: np.ndarray = np.full(np.count_nonzero(broader), RELATION_LABELS.index(SCHEMA_NARROWER), dtype=np.uint8)
+        mirrored: FrozenSkosGraph = FrozenSkosGraph(
+            frozen.name, frozen.node_count, frozen.descriptors, frozen.columns,
+            np.concatenate([frozen.edge_start, frozen.edge_end[broader]]),
+            np.concatenate([frozen.edge_end, frozen.edge_start[broader]]),
+            np.concatenate([frozen.edge_label, narrower]))
+        self.assertEqual([str(x) for x in graph.relations], [str(x) for x in mirrored.relations])
+        self.assertEqual(["g1", "g2"], mirrored.get_end_descriptors("f1", SCHEMA_NARROWER))
+        self.assertEqual(["f1", "k1"], [x.descriptor for x in mirrored.get_hierarchy("g1")])
+
+    def test_to_skos_graph(self):
+        graph: SkosGraph = build_graph()
+        thawed: SkosGraph = FrozenSkosGraph.from_skos_graph(graph).to_skos_graph()
+        self.assertEqual([x.to_dict() for x in graph.nodes], [x.to_dict() for x in thawed.nodes])
+        self.assertEqual([str(x) for x in graph.relations], [str(x) for x in thawed.relations])
+        # the hash indexes are grouped in bulk and maintained by the manipulators afterwards
+        self.assertEqual(["s1", "s2"], [x.descriptor for x in thawed.get_all_nodes_by_name("s_n")])
+        self.assertEqual("extra", thawed.get_node_by_descriptor("g2").get_literal_by_schema("skos:note"))
+        self.assertEqual(["g1", "g2"], thawed.get_end_descriptors("f1", SCHEMA_NARROWER))
+        self.assertEqual(["s2"], thawed.get_start_descriptors("s1", SCHEMA_SYNONYM))
+        relation_count: int = len(thawed.relations)
+        thawed.add_synonym_relation("s1", "s2")
+        thawed.add_genus_node("g3", "s_n")
+        self.assertEqual(relation_count, len(thawed.relations))
+        self.assertEqual(["s1", "s2", "g3"], [x.descriptor for x in thawed.get_all_nodes_by_name("s_n")])
+
+    def test_to_skos_graph_of_mirrored_synonyms(self):
+        frozen: FrozenSkosGraph = FrozenSkosGraph.from_skos_graph(build_graph())
+        synonym: np.ndarray = frozen.edge_label == RELATION_LABELS.index(SCHEMA_SYNONYM)
+        # graph files of former versions may hold a synonym relation in both directions
+        mirrored: FrozenSkosGraph = FrozenSkosGraph(
+            frozen.name, frozen.node_count, frozen.descriptors, frozen.columns,
+            np.concatenate([frozen.edge_start, frozen.edge_end[synonym]]),
+            np.concatenate([frozen.edge_end, frozen.edge_start[synonym]]),
+            np.concatenate([frozen.edge_label, frozen.edge_label[synonym]]))
+        self.assertEqual([str(x) for x in frozen.relations], [str(x) for x in mirrored.to_skos_graph().relations])
+
+    def test_concatenate(self):
+        graph: SkosGraph = build_graph()
+        parts: List[SkosGraph] = [SkosGraph("part"), SkosGraph("part"), SkosGraph("part")]
+        # the relations of the later parts reference nodes of the earlier ones and a descriptor without a node
+        for i, node in enumerate(graph.nodes):
+            parts[0 if i < 3 else 2].add_node(node)
+        for i, relation in enumerate(graph.relations):
+            parts[0 if i < 2 else 2].add_relation(relation)
+        concatenated: FrozenSkosGraph = FrozenSkosGraph.concatenate(
+            "test", [FrozenSkosGraph.from_skos_graph(x) for x in parts])
+        self.assertEqual([x.to_dict() for x in graph.nodes], [x.to_dict() for x in concatenated.nodes])
+        self.assertEqual([str(x) for x in graph.relations], [str(x) for x in concatenated.relations])
+        self.assertEqual(["s1", "missing"], concatenated.get_end_descriptors("s2", SCHEMA_SYNONYM))
+        self.assertTrue(concatenated.is_parent_of("g2", "f1"))
+
+    def test_graph_file_round_trip(self):
+        graph: SkosGraph = build_graph()
+        with tempfile.TemporaryDirectory() as directory:
+            path: str = os.path.join(directory, "test.graph")
+            write_graph_file(graph, path)
+            self.assertTrue(is_graph_file(path))
+            frozen: FrozenSkosGraph = read_graph_file(path)
+            self.assertEqual([x.to_dict() for x in graph.nodes], [x.to_dict() for x in frozen.nodes])
+            self.assertEqual([str(x) for x in graph.relations], [str(x) for x in frozen.relations])
+            self.assertEqual([x.to_dict() for x in graph.nodes],
+                             [x.to_dict() for x in load_graph_from_file(path).nodes])
+
+            legacy_path: str = os.path.join(directory, "legacy.graph")
+            with open(legacy_path, "wb") as f:
+                pickle.dump(graph, f)
+            self.assertFalse(is_graph_file(legacy_path))
+            convert_pickle_graph_file(legacy_path)
+            self.assertEqual([str(x) for x in graph.relations], [str(x) for x in read_graph_file(legacy_path).relations])
+
+    def test_open_graph_file_memory_mapped(self):
+        graph: SkosGraph = build_graph()
+        with tempfile.TemporaryDirectory() as directory:
+            path: str = os.path.join(directory, "test.graph")
+            write_graph_file(graph, path)
+            built: FrozenSkosGraph = open_graph_file(path)
+            self.assertTrue(os.path.exists(get_index_file_path(path)))
+            mapped: FrozenSkosGraph = open_graph_file(path)
+            # views into the mapped files, not private copies
+            self.assertFalse(mapped.edge_start.flags.writeable)
+            self.assertFalse(mapped.descriptor_order.flags.writeable)
+            for frozen in [built, mapped]:
+                self.assertEqual([x.to_dict() for x in graph.nodes], [x.to_dict() for x in frozen.nodes])
+                for node in graph.nodes:
+                    self.assertEqual(frozen.get_node_by_descriptor(node.descriptor).to_dict(), node.to_dict())
+                    for label in RELATION_LABELS:
+                        self.assertEqual(graph.get_adjacent_descriptors(node.descriptor, label),
+                                         frozen.get_adjacent_descriptors(node.descriptor, label))
+                self.assertEqual(["s1", "s2"], [x.descriptor for x in frozen.get_all_nodes_by_name("s_n")])
+
+            # a changed graph has another content hash, so its index file is rebuilt
+            graph.add_species_node("s3", "s3_n")
+            write_graph_file(graph, path)
+            self.assertEqual("s3", open_graph_file(path).get_node_by_descriptor("s3").descriptor)
+
+    def test_index_file_written_with_graph(self):
+        graph: SkosGraph = build_graph()
+        with tempfile.TemporaryDirectory() as directory:
+            path: str = os.path.join(directory, "test.graph")
+            content_hash: str = write_graph_file(graph, path, with_indexes=True)
+            self.assertEqual(content_hash, write_graph_file(graph, os.path.join(directory, "copy.graph")))
+            modified: int = os.stat(get_index_file_path(path)).st_mtime_ns
+            frozen: FrozenSkosGraph = open_graph_file(path)
+            self.assertEqual(modified, os.stat(get_index_file_path(path)).st_mtime_ns)
+            self.assertTrue(frozen.is_parent_of("s1", "g1"))
+
+    def test_related_descriptors_match_search_rec(self):
+        generator: random.Random = random.Random(7)
+        graph: SkosGraph = SkosGraph("synonyms")
+        for i in range(0, 60):
+            graph.add_species_node("s" + str(i), "n" + str(i))
+        for i in range(0, 70):
+            graph.add_synonym_relation("s" + str(generator.randrange(60)), "s" + str(generator.randrange(65)))
+        relation_index: RelationSearchIndex = RelationSearchIndex(graph)
+        try:
+            for max_size in [synonym_clusters.MAX_DISTANCE_CLUSTER_SIZE, 3]:
+                # small clusters use the stored distances, larger ones are walked on request
+                synonym_clusters.MAX_DISTANCE_CLUSTER_SIZE = max_size
+                frozen: FrozenSkosGraph = FrozenSkosGraph.from_skos_graph(graph)
+                for i in range(0, 65):
+                    for depth in range(0, 5):
+                        expected: List[str] = []
+                        search_rec(relation_index, "s" + str(i), depth, expected)
+                        self.assertEqual(sorted(set(expected)),
+                                         sorted(relation_index.get_related_descriptors("s" + str(i), depth)))
+                        self.assertEqual(sorted(set(expected)),
+                                         sorted(frozen.get_related_descriptors("s" + str(i), depth)))
+        finally:
+            synonym_clusters.MAX_DISTANCE_CLUSTER_SIZE = 255
+
+    def test_hierarchy_matches_relation_walk(self):
+        generator: random.Random = random.Random(11)
+        graph: SkosGraph = SkosGraph("hierarchy")
+        for i in range(0, 80):
+            graph.add_species_node("n" + str(i), "label" + str(generator.randrange(8)))
+        for i in range(1, 80):
+            # mostly a forest, some nodes without, with a missing or a cyclic parent
+            if generator.random() < 0.8:
+                graph.add_species_to_genus("n" + str(i), "n" + str(generator.randrange(i + 3)))
+            if generator.random() < 0.2:
+                graph.add_synonym_relation("n" + str(i), "n" + str(generator.randrange(85)))
+        chain: SkosGraph = SkosGraph("chain")
+        for i in range(0, 30):
+            chain.add_species_node("c" + str(i), "c" + str(i))
+            if i > 0:
+                chain.add_species_to_genus("c" + str(i), "c" + str(i - 1))
+
+        for skos_graph in [graph, chain]:
+            frozen: FrozenSkosGraph = FrozenSkosGraph.from_skos_graph(skos_graph)
+            relation_index: RelationSearchIndex = RelationSearchIndex(skos_graph)
+            descriptor_index: NodeSearchIndex = NodeSearchIndex(skos_graph, descriptor_retriever)
+            for node in skos_graph.nodes:
+                path: List[SkosNode] = get_hierarchy_upwards_from(node.descriptor, relation_index, descriptor_index)
+                self.assertEqual([x.descriptor for x in filter_duplicates(path)],
+                                 [x.descriptor for x in frozen.get_hierarchy(node.descriptor)])
+                ancestors: List[str] = [x.descriptor for x in path[1:]]
+                for other in skos_graph.nodes:
+                    self.assertEqual(other.descriptor in ancestors,
+                                     frozen.is_ancestor_of(other.descriptor, node.descriptor))
+        self.assertEqual([], FrozenSkosGraph.from_skos_graph(chain).get_hierarchy("c29"))
+        self.assertEqual(25, len(FrozenSkosGraph.from_skos_graph(chain).get_hierarchy("c25")))
+
+    def test_prefix_search_returns_shortest_matches(self):
+        generator: random.Random = random.Random(3)
+        graph: SkosGraph = SkosGraph("prefix")
+        for i in range(0, 300):
+            label: str = "".join(generator.choice("aAbBcé ") for _ in range(0, generator.randrange(1, 8)))
+            graph.add_species_node("n" + str(i), label)
+        graph.add_species_node("unlabeled", None)
+        frozen: FrozenSkosGraph = FrozenSkosGraph.from_skos_graph(graph)
+        for prefix in ["", "a", "ab", "B", "é", "c a", "abcabc", "x"]:
+            expected: List[int] = sorted(
+                (i for i, x in enumerate(graph.nodes) if x.pref_label is not None
+                 and x.pref_label.lower().startswith(prefix.lower())),
+                key=lambda i: (len(graph.nodes[i].pref_label), graph.nodes[i].pref_label.lower().encode("utf-8"), i))
+            self.assertEqual([graph.nodes[i].descriptor for i in expected[:10]],
+                             [x.descriptor for x in search_node_start_with(frozen, prefix.lower(), 10)])
+
+    def test_fuzzy_search(self):
+        graph: SkosGraph = SkosGraph("fuzzy")
+        for i, label in enumerate(["Rosa canina", "Rosa canina", "Rosa gallica", "Bellis perennis", "Rosales",
+                                   "Quercus robur", "Quercus rubra", None]):
+            graph.add_species_node("n" + str(i), label)
+        frozen: FrozenSkosGraph = FrozenSkosGraph.from_skos_graph(graph)
+        self.assertEqual(["n0", "n1"], [x.descriptor for x in frozen.get_nodes_similar_to("rosa cannina", 2)])
+        self.assertEqual(["n5", "n6"], [x.descriptor for x in frozen.get_nodes_similar_to("Qercus robr", 2)])
+        self.assertEqual("n3", frozen.get_nodes_similar_to("belis perenis", 1)[0].descriptor)
+        self.assertEqual([], frozen.get_nodes_similar_to("xyz", 5))
+        self.assertEqual(3, edit_distance("kitten", "sitting"))
+
+    def test_name_keys(self):
+        self.assertEqual("mentha piperita subsp. citrata", get_name_key("×Mentha  Piperita L. ssp. citrata (Ehrh.) Briq."))
+        self.assertEqual("mentha piperita", get_name_key("MENTHA X PIPERITA"))
+        self.assertEqual("mentha aquatica × mentha spicata", get_name_key("Mentha aquatica L. x Mentha spicata L."))
+        self.assertEqual("rosa canina var. alba", get_name_key("Rosa canina L. variety alba Rouy"))
+        self.assertEqual("rosa canina f. alba", get_name_key("Rosa canina fo. alba"))
+        self.assertEqual("rosa canina var. alba", get_name_key("Rosa canina var. Alba"))
+        self.assertEqual("rosa canina var. alba", get_name_key("Rosa canina L. VAR. Alba Rouy"))
+        self.assertEqual("rosa canina", get_name_key("Rosa canina Hook. f. ex Benth."))
+        self.assertEqual("rosa canina", get_name_key("Rosa canina Rouy", "Rouy"))
+        self.assertEqual("rosa canina", get_name_key("Rosa (Rosa) canina"))
+        self.assertEqual("cephaelis ipecacuanha", get_name_key("Cephaëlis ipecacuanha"))
+        self.assertEqual("gen1_0 sp1", get_name_key("Gen1_0 sp1"))
+        self.assertIsNone(get_name_key(None))
+
+    def test_name_key_of_changed_node(self):
+        node: SkosNode = SkosNode("n0", "Rosa canina hort", [])
+        self.assertEqual("rosa canina hort", node.get_name_key())
+        # the key is computed again with the author
+        node.add_attribute("skos:scopeNote", "hort")
+        self.assertEqual("rosa canina", node.get_name_key())
+        node = SkosNode.from_fields("n1", None, name_key="stale")
+        node.add_attribute("skos:prefLabel", "Rosa gallica")
+        self.assertEqual("rosa gallica", node.get_name_key())
+
+    def test_search_by_name_key(self):
+        graph: SkosGraph = SkosGraph("keys")
+        for i, (label, author) in enumerate([("Mentha ×piperita", None), ("Mentha x piperita L.", "L."),
+                                             ("Mentha piperita subsp. citrata", None), ("Mentha", None), (None, None)]):
+            graph.add_species_node("n" + str(i), label, None if author is None else
+                                   [SkosAttribute("skos:scopeNote", author)])
+        with tempfile.TemporaryDirectory() as directory:
+            path: str = os.path.join(directory, "keys.graph")
+            write_graph_file(graph, path)
+            frozen: FrozenSkosGraph = open_graph_file(path)
+            self.assertEqual(["mentha piperita", "mentha piperita", "mentha piperita subsp. citrata", "mentha", None],
+                             frozen.name_keys.to_list())
+            self.assertEqual(["n0", "n1"], [x.descriptor for x in search_node_by_name_key(frozen, "MENTHA PIPERITA")])
+            self.assertEqual(["n2"], [x.descriptor for x in frozen.get_all_nodes_by_name_key("Mentha piperita ssp. citrata")])
+            self.assertEqual([], frozen.get_all_nodes_by_name_key("Mentha spicata"))
+            self.assertEqual(["n0", "n1"], [x.descriptor for x in search_node_by_name_key(graph, "Mentha piperita Huds.")])
+            # nodes added after the first lookup are indexed as well
+            graph.add_species_node("n5", "MENTHA PIPERITA")
+            self.assertEqual(["n0", "n1", "n5"], [x.descriptor for x in graph.get_all_nodes_by_name_key("Mentha piperita")])
+            self.assertEqual("mentha piperita", load_graph_from_file(path).nodes[1].name_key)
@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+import threading
+import tracemalloc
+from typing import List
+from unittest import TestCase
+
+from graph.instrumentation import RunReport, start_report, get_report, stage
+from graph.skos_graph import SkosGraph
+from graph.skos_graph_utils import merge_graphs
+
+
+class TestRunReport(TestCase):
+    def test_stages(self):
+        report: RunReport = RunReport("test")
+        with report.stage("outer", unit="rows") as outer:
+            with report.stage("inner", 10, "nodes") as inner:
+                inner.add_count("relations", 4)
+                inner.add_count("relations", 1)
+            outer.count(20)
+        report.add_stages([{"name": "read", "wall": 0.5}], "worker/")
+
+        stages: List[dict] = report.to_dict()["stages"]
+        self.assertEqual(["outer", "outer/inner", "worker/read"], [x["name"] for x in stages])
+        self.assertEqual(20, stages[0]["items"])
+        self.assertEqual("rows", stages[0]["unit"])
+        self.assertEqual(10, stages[1]["items"])
+        self.assertEqual({"relations": 5}, stages[1]["counts"])
+        self.assertGreater(stages[0]["peak_rss_mib"], 0)
+        self.assertNotIn("top_allocations", stages[0])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path: str = os.path.join(directory, "report.json")
+            report.write(path)
+            with open(path, encoding="utf-8") as f:
+                written: dict = json.load(f)
+        self.assertEqual("test", written["name"])
+        self.assertEqual(stages, written["stages"])
+
+    def test_stage_of_failed_code(self):
+        report: RunReport = RunReport("test")
+        with self.assertRaises(ValueError):
+            with report.stage("failing"):
+                raise ValueError("failed")
+        with report.stage("next"):
+            pass
+        self.assertEqual(["failing", "next"], [x["name"] for x in report.to_dict()["stages"]])
+
+    def test_merge_stages(self):
+        graphs: List[SkosGraph] = []
+        name: str
+        for name in ["itis", "tpl", "wfo"]:
+            graph: SkosGraph = SkosGraph(name)
+            graph.add_kingdom_node(name + "_k", "Plantae")
+            graph.add_family_node(name + "_f", "Rosaceae")
+            graph.add_family_to_kingdom(name + "_f", name + "_k")
+            graphs.append(graph)
+
+        start_report("merge")
+        with stage("merging"):
+            merged: SkosGraph = merge_graphs(graphs)
+        stages: List[dict] = get_report().to_dict()["stages"]
+        self.assertEqual(6, len(merged.nodes))
+        self.assertEqual("merging", stages[0]["name"])
+        self.assertIn("merging/matching", [x["name"] for x in stages])
+        copying: dict = next(x for x in stages if x["name"] == "merging/copying relations")
+        self.assertEqual(sum(len(x.relations) for x in graphs), copying["items"])
+
+    def test_traced_peaks(self):
+        try:
+            start_report("trace", trace_memory=True)
+            with stage("outer"):
+                with stage("big"):
+                    big: bytearray = bytearray(20 << 20)
+                del big
+                with stage("small"):
+                    small: bytearray = bytearray(1 << 20)
+                del small
+        finally:
+            tracemalloc.stop()
+        stages: dict = {x["name"]: x for x in get_report().to_dict()["stages"]}
+        self.assertGreaterEqual(stages["outer"]["traced_peak_mib"], 20)
+        self.assertGreaterEqual(stages["outer/big"]["traced_peak_mib"], 20)
+        self.assertLess(stages["outer/small"]["traced_peak_mib"], 5)
+        self.assertIn("test_instrumentation.py", stages["outer/small"]["top_allocations"][0]["where"])
+        self.assertGreaterEqual(stages["outer/small"]["top_allocations"][0]["size_kib"], 1000)
+
+    def test_traced_peaks_of_threads(self):
+        started: threading.Barrier = threading.Barrier(2)
+
+        def run(name: str):
+            with stage(name):
+                started.wait()
+                started.wait()
+
+        try:
+            start_report("trace", trace_memory=True)
+            threads: List[threading.Thread] = [threading.Thread(target=run, args=(x,)) for x in ["a", "b"]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            with stage("alone"):
+                pass
+        finally:
+            tracemalloc.stop()
+        stages: dict = {x["name"]: x for x in get_report().to_dict()["stages"]}
+        self.assertNotIn("traced_peak_mib", stages["a"])
+        self.assertNotIn("top_allocations", stages["b"])
+        self.assertIn("traced_peak_mib", stages["alone"])
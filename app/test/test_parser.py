@@ -0,0 +1,259 @@
+import os
+import pickle
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from pandas import DataFrame, CategoricalDtype
+from pandas.testing import assert_frame_equal
+
+from dwca_parser.archive_cache import ArchiveCache
+from dwca_parser.dwca_reader import CoreReader, CATEGORICAL_COLUMNS
+from dwca_parser.parser_base import GeneratedIdAllocator
+from dwca_parser.parser_itis import ParserITIS
+from dwca_parser.parser_tpl import ParserTPL
+from dwca_parser.parser_wfo import ParserWFO
+from graph.frozen_skos_graph import FrozenSkosGraph
+from graph.skos_graph import SkosGraph, SCHEMA_SYNONYM, CONCEPT_SPECIES, CONCEPT_SUB_SPECIES
+
+NAN = float("nan")
+
+
+def build_itis_dataframe() -> DataFrame:
+    columns = ["id", "parentNameUsageID", "acceptedNameUsageID", "taxonRank", "scientificName",
+               "scientificNameAuthorship", "taxonomicStatus"]
+    rows = [
+        [7, 6, NAN, "Species", "Genus2 species2", "L.", "valid"],
+        [1, NAN, NAN, "Kingdom", "Plantae", NAN, "valid"],
+        [2, 1, NAN, "Order", "Order1", NAN, "valid"],
+        [3, 2, NAN, "Family", "Family1", "Auth", "valid"],
+        [4, 3, NAN, "Subfamily", "Subfamily1", NAN, "valid"],
+        [5, 4, NAN, "Genus", "Genus1", NAN, "valid"],
+        [6, 3, NAN, "Genus", "Genus2", NAN, "valid"],
+        [8, 5, NAN, "Species", "Genus1 species1", "Mill.", "valid"],
+        [9, 8, NAN, "Subspecies", "Genus1 species1 sub1", NAN, "valid"],
+        [10, NAN, "8", "Species", "Genus1 synonym1", "DC.", "invalid"],
+        [11, NAN, "6", "Genus", "GenusSynonym", NAN, "invalid"],
+        [12, NAN, NAN, "Kingdom", "Animalia", NAN, "valid"],
+        [13, 12, NAN, "Family", "Family2", NAN, "valid"],
+    ]
+    return DataFrame(rows, columns=columns)
+
+
+def build_tpl_dataframe() -> DataFrame:
+    columns = ["id", "kingdom", "family", "genus", "taxonRank", "acceptedNameUsageID", "scientificName",
+               "scientificNameAuthorship", "taxonomicStatus", "specificEpithet"]
+    rows = [
+        [1, "Plantae", "Family1", "Genus1", "species", NAN, "Genus1 species1", "L.", "accepted", "species1"],
+        [2, "Plantae", "Family1", "Genus1", "species", "1", "Genus1 synonym1", NAN, "synonym", "synonym1"],
+        [3, "Plantae", "Family1", "Genus1", "species", "1", "Genus1 synonym2", "DC.", "synonym", "synonym2"],
+        [4, "Plantae", "Family1", "Genus1", "var", NAN, "Genus1 species1 var1", NAN, "accepted", "species1"],
+        [5, "Plantae", "Family1", "Genus1", "f.", "4", "Genus1 species1 form1", NAN, "synonym", "species1"],
+        [6, "Plantae", "Family2", "Genus2", "species", NAN, "Genus2 species2", NAN, "accepted", "species2"],
+    ]
+    return DataFrame(rows, columns=columns)
+
+
+def build_wfo_dataframe() -> DataFrame:
+    columns = ["id", "kingdom", "family", "genus", "taxonRank", "acceptedNameUsageID", "scientificName",
+               "scientificNameAuthorship", "taxonomicStatus", "specificEpithet"]
+    rows = [
+        ["wfo-1", "Plantae", "Family1", NAN, "FAMILY", NAN, "Family1", "Juss.", "Accepted", NAN],
+        ["wfo-2", "Plantae", "Family1", "Genus1", "species", NAN, "Genus1 species1", "L.", "Accepted", "species1"],
+        ["wfo-3", "Plantae", "Family1", "Genus1", "SUBSPECIES", NAN, "Genus1 species1 sub1", NAN, "Accepted",
+         "species1"],
+        ["wfo-4", "Plantae", "Family1", "Genus1", "variety", NAN, "Genus1 species9 var1", NAN, "Accepted",
+         "species9"],
+        ["wfo-5", "Plantae", "Family1", "Genus1", "species", NAN, "Genus1 species1", NAN, "Synonym", "species1"],
+        ["wfo-6", "Plantae", "Family1", "Genus2", "GENUS", NAN, "Genus2", "Mill.", "Accepted", NAN],
+        ["wfo-7", "Plantae", "Family1", "Genus2", "species", NAN, "Genus2 species2", NAN, "Accepted", "species2"],
+    ]
+    return DataFrame(rows, columns=columns)
+
+
+def write_archive(path: str):
+    terms = "http://rs.tdwg.org/dwc/terms/"
+    meta = ('<archive xmlns="http://rs.tdwg.org/dwc/text/">'
+            '<core encoding="UTF-8" fieldsTerminatedBy="," fieldsEnclosedBy=\'"\' ignoreHeaderLines="1">'
+            '<files><location>taxa.txt</location></files><id index="0"/>'
+            '<field index="1" term="' + terms + 'taxonRank"/><field index="2" term="' + terms + 'remarks"/>'
+            '<field index="3" term="' + terms + 'scientificName"/><field index="4" term="' + terms + 'family"/>'
+            '<field term="' + terms + 'kingdom" default="Plantae"/></core></archive>')
+    rows = ['id,rank,remarks,name,family', '1,family,x,Family1,Family1', '2,species,x,"Genus1 species1, L.",Family1',
+            '3,species,x,Genus2 species2,Family2', '04,species,x,Genus2 species3,']
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("meta.xml", meta)
+        archive.writestr("taxa.txt", "\n".join(rows) + "\n")
+
+
+class TestCoreReader(TestCase):
+
+    def test_read_batches(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path: str = os.path.join(directory, "taxa.zip")
+            write_archive(path)
+            reader: CoreReader = CoreReader(path, batch_rows=2)
+            self.assertEqual([2, 2], [len(x) for x in reader.iter_batches()])
+            dataframe: DataFrame = reader.read()
+            # appended batch by batch, the same frame as of one batch
+            assert_frame_equal(CoreReader(path).read(), dataframe)
+        # only the parser columns, in the order of CORE_COLUMNS, ids are kept as written
+        self.assertEqual(["id", "scientificName", "taxonRank", "kingdom", "family"], list(dataframe.columns))
+        self.assertEqual(["1", "2", "3", "04"], dataframe["id"].tolist())
+        self.assertEqual("Genus1 species1, L.", dataframe["scientificName"][1])
+        self.assertEqual(["Plantae"] * 4, dataframe["kingdom"].tolist())
+        # the categories of the batches are unified
+        self.assertIsInstance(dataframe["family"].dtype, CategoricalDtype)
+        self.assertEqual(["Family1", "Family1", "Family2"], dataframe["family"].tolist()[:3])
+        self.assertEqual(["Family1", "Family2"], dataframe["family"].cat.categories.tolist())
+        self.assertTrue(dataframe["family"].isna()[3])
+        self.assertEqual(3, (dataframe["taxonRank"] == "species").sum())
+
+
+class TestArchiveCache(TestCase):
+
+    def test_snapshots(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path: str = os.path.join(directory, "taxa.zip")
+            write_archive(path)
+            cache: ArchiveCache = ArchiveCache(os.path.join(directory, "cache"))
+            expected: DataFrame = CoreReader(path).read()
+            assert_frame_equal(expected, cache.read(path))
+            snapshot_path: str = cache.get_snapshot_path(path)
+            self.assertTrue(os.path.exists(snapshot_path))
+            assert_frame_equal(expected, cache.read(path))
+
+            # a changed archive gets a snapshot of its own, the older one is evicted beyond the size limit
+            with zipfile.ZipFile(path, "a") as archive:
+                archive.writestr("readme.txt", "changed")
+            limited: ArchiveCache = ArchiveCache(cache.directory, max_bytes=os.path.getsize(snapshot_path))
+            assert_frame_equal(expected, limited.read(path))
+            self.assertNotEqual(snapshot_path, limited.get_snapshot_path(path))
+            self.assertEqual([os.path.basename(limited.get_snapshot_path(path))], os.listdir(cache.directory))
+
+            # broken snapshots are rebuilt
+            with open(limited.get_snapshot_path(path), "wb") as f:
+                f.write(b"broken")
+            assert_frame_equal(expected, cache.read(path))
+            cache.invalidate(path)
+            self.assertEqual([], os.listdir(cache.directory))
+
+
+class TestGeneratedIdAllocator(TestCase):
+
+    def test_allocate(self):
+        allocator: GeneratedIdAllocator = GeneratedIdAllocator()
+        self.assertEqual(0, allocator.allocate()[0])
+        self.assertEqual([1, 2, 3], list(allocator.allocate(3)))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            numbers = list(executor.map(lambda x: allocator.allocate()[0], range(0, 1000)))
+        self.assertEqual(list(range(4, 1004)), sorted(numbers))
+
+    def test_reserve(self):
+        allocator: GeneratedIdAllocator = GeneratedIdAllocator()
+        first: GeneratedIdAllocator = allocator.reserve(2)
+        # as sent to another process
+        second: GeneratedIdAllocator = pickle.loads(pickle.dumps(allocator.reserve(2)))
+        self.assertEqual([2, 3], list(second.allocate(2)))
+        self.assertEqual([0, 1], list(first.allocate(2)))
+        self.assertEqual(4, allocator.allocate()[0])
+        self.assertRaises(ValueError, first.allocate)
+
+
+class TestParserITIS(TestCase):
+
+    def test_hierarchy(self):
+        graph: SkosGraph = ParserITIS(build_itis_dataframe(), "itis").process()
+        # genus 5 is reached below the subfamily and again by the genus search of the family, as before,
+        # the synonyms follow the hierarchy
+        self.assertEqual(["1", "3", "4", "5", "8", "9", "5", "8", "9", "6", "7", "10", "10", "11"],
+                         [x.descriptor for x in graph.nodes])
+        self.assertTrue(graph.is_parent_of("3", "1"))
+        self.assertTrue(graph.is_parent_of("4", "3"))
+        self.assertTrue(graph.is_parent_of("5", "4"))
+        self.assertTrue(graph.is_parent_of("5", "3"))
+        self.assertTrue(graph.is_parent_of("6", "3"))
+        self.assertTrue(graph.is_parent_of("7", "6"))
+        self.assertTrue(graph.is_parent_of("8", "5"))
+        self.assertTrue(graph.is_parent_of("9", "8"))
+        self.assertIsNone(graph.get_node_by_descriptor("13"))
+        self.assertEqual("Mill.", graph.get_node_by_descriptor("8").author)
+        self.assertEqual("", graph.get_node_by_descriptor("5").author)
+
+    def test_synonyms(self):
+        graph: SkosGraph = ParserITIS(build_itis_dataframe(), "itis").process()
+        self.assertEqual({"8"}, set(graph.get_end_descriptors("10", SCHEMA_SYNONYM)))
+        self.assertEqual(["6"], graph.get_end_descriptors("11", SCHEMA_SYNONYM))
+        self.assertEqual("DC.", graph.get_node_by_descriptor("10").author)
+        self.assertEqual("invalid", graph.get_node_by_descriptor("10").taxon_status)
+
+    def test_deep_hierarchy(self):
+        # deeper than the default recursion limit
+        rows = [[1, NAN, NAN, "Kingdom", "Plantae", NAN, "valid"], [2, 1, NAN, "Family", "Family1", NAN, "valid"]]
+        rows += [[i, i - 1, NAN, "Tribe", "Tribe" + str(i), NAN, "valid"] for i in range(3, 3000)]
+        rows.append([3000, 2999, NAN, "Genus", "Genus1", NAN, "valid"])
+        graph: SkosGraph = ParserITIS(DataFrame(rows, columns=build_itis_dataframe().columns), "itis").process()
+        self.assertTrue(graph.is_parent_of("3000", "2"))
+
+
+class TestParserTPL(TestCase):
+
+    def test_synonyms(self):
+        graph: SkosGraph = ParserTPL(build_tpl_dataframe(), "tpl").process()
+        self.assertEqual(["2", "3"], graph.get_start_descriptors("1", SCHEMA_SYNONYM))
+        self.assertEqual(["4"], graph.get_end_descriptors("5", SCHEMA_SYNONYM))
+        self.assertEqual(CONCEPT_SPECIES, graph.get_node_by_descriptor("2").in_scheme)
+        self.assertEqual(CONCEPT_SUB_SPECIES, graph.get_node_by_descriptor("5").in_scheme)
+        self.assertEqual("", graph.get_node_by_descriptor("2").author)
+        self.assertEqual("DC.", graph.get_node_by_descriptor("3").author)
+        self.assertEqual("synonym", graph.get_node_by_descriptor("3").taxon_status)
+        self.assertTrue(graph.is_parent_of("4", "1"))
+
+
+    def test_categorical_columns(self):
+        # as read by CoreReader
+        dataframe: DataFrame = build_tpl_dataframe().astype({x: "category" for x in CATEGORICAL_COLUMNS})
+        expected: SkosGraph = ParserTPL(build_tpl_dataframe(), "tpl").process()
+        graph: SkosGraph = ParserTPL(dataframe, "tpl").process()
+        self.assertEqual([x.to_dict() for x in expected.nodes], [x.to_dict() for x in graph.nodes])
+        self.assertEqual([str(x) for x in expected.relations], [str(x) for x in graph.relations])
+
+
+class TestParserWFO(TestCase):
+
+    def test_hierarchy(self):
+        graph: SkosGraph = ParserWFO(build_wfo_dataframe(), "wfo").process()
+        # families and genera with an own row keep its id, the others get a generated one
+        self.assertTrue(graph.is_parent_of("wfo-1", "wfo-g-0"))
+        self.assertEqual("Juss.", graph.get_node_by_descriptor("wfo-1").author)
+        genus: str = graph.get_node_by_name("Genus1").descriptor
+        self.assertTrue(genus.startswith("wfo-g-"))
+        self.assertTrue(graph.is_parent_of(genus, "wfo-1"))
+        self.assertTrue(graph.is_parent_of("wfo-6", "wfo-1"))
+        self.assertEqual("Mill.", graph.get_node_by_descriptor("wfo-6").author)
+        self.assertTrue(graph.is_parent_of("wfo-2", genus))
+        self.assertTrue(graph.is_parent_of("wfo-7", "wfo-6"))
+
+    def test_sub_species_parents(self):
+        graph: SkosGraph = ParserWFO(build_wfo_dataframe(), "wfo").process()
+        # the parent is the accepted species named genus + specificEpithet, not the synonym sharing its name
+        self.assertEqual(["wfo-2"], graph.get_end_descriptors("wfo-3", "skos:broader"))
+        self.assertEqual([""], graph.get_end_descriptors("wfo-4", "skos:broader"))
+
+
+class TestPartitionedParsing(TestCase):
+
+    def test_partitions_match_whole_parse(self):
+        for parser_class, build_dataframe in [(ParserITIS, build_itis_dataframe), (ParserTPL, build_tpl_dataframe),
+                                              (ParserWFO, build_wfo_dataframe)]:
+            whole: SkosGraph = parser_class(build_dataframe(), "test").process()
+            partitioned: FrozenSkosGraph = parser_class(build_dataframe(), "test").process(1)
+            # the same nodes and relations, the partitions only change their order
+            self.assertEqual(sorted(str(x.to_dict()) for x in whole.nodes),
+                             sorted(str(x.to_dict()) for x in partitioned.nodes))
+            self.assertEqual(sorted(str(x) for x in whole.relations), sorted(str(x) for x in partitioned.relations))
+            # and the same graph for any number of workers
+            more_workers: FrozenSkosGraph = parser_class(build_dataframe(), "test").process(2)
+            self.assertEqual([x.to_dict() for x in partitioned.nodes], [x.to_dict() for x in more_workers.nodes])
+            self.assertEqual([str(x) for x in partitioned.relations], [str(x) for x in more_workers.relations])
@@ -1,9 +1,19 @@
+import os
+import pickle
 import random
+import tempfile
 from unittest import TestCase
+from unittest.mock import patch
 
-from graph.skos_graph import SkosGraph, NodeSearchIndex, RelationSearchIndex, SkosNode
+from graph import MultiThreadExport
+from graph.frozen_skos_graph import FrozenSkosGraph
+from graph.graph_file import read_graph_file
+from graph.incremental_merge import merge_graph_files_incremental
+from graph.merge_store import MergeStore, merge_graph_files
+from graph.skos_graph import SkosGraph, NodeSearchIndex, RelationSearchIndex, SkosNode, SkosAttribute, SkosRelation, \
+    SCHEMA_HISTORY_NOTE
 from graph.skos_graph_utils import get_node_hierarchy_upwards_from, save_graph_to_file, load_graph_from_file, \
-    load_test_graph, get_hierarchy_upwards_from
+    load_test_graph, get_hierarchy_upwards_from, merge_graphs
 
 
 class TestSkosGraph(TestCase):
@@ -63,6 +73,231 @@ class TestSkosGraph(TestCase):
         save_graph_to_file(self.graph, "out.graph")
         # print(load_graph_to_file("out.graph").to_rdf_skos_str())
 
+    def test_indexes_follow_manipulators(self):
+        graph: SkosGraph = SkosGraph()
+        graph.add_kingdom_node("k1", "KingdomName1")
+        graph.add_family_node("f1", "FamilyName1")
+        graph.add_family_node("f2", "FamilyName1")
+        graph.add_genus_node("g1", "g1_n")
+        graph.add_family_to_kingdom("f1", "k1")
+        graph.add_genus_to_family("g1", "f1")
+
+        self.assertEqual("f2", graph.get_node_by_descriptor("f2").descriptor)
+        self.assertIsNone(graph.get_node_by_descriptor("unknown"))
+        self.assertEqual(["f1", "f2"], [x.descriptor for x in graph.get_all_nodes_by_name("FamilyName1")])
+        self.assertEqual(["k1"], [x.end_descriptor for x in graph.get_outgoing_relations_with_descriptor("f1")
+                                  if x.label == "skos:broader"])
+
+        graph.change_parent("f1", "g1", "f2")
+        self.assertTrue(graph.is_parent_of("g1", "f2"))
+        self.assertFalse(graph.is_parent_of("g1", "f1"))
+        self.assertEqual(["g1"], [x.start_descriptor for x in graph.get_incoming_relations_with_descriptor("f2")])
+
+        index: RelationSearchIndex = RelationSearchIndex(graph)
+        # the derived narrower relations follow the moved broader relation
+        self.assertEqual(["k1"], index.get_all_descriptor_for_descriptor("f1", "skos:narrower"))
+        self.assertEqual(["g1"], graph.get_end_descriptors("f2", "skos:narrower"))
+
+    def test_relations_stored_once(self):
+        graph: SkosGraph = SkosGraph()
+        graph.add_genus_node("g1", "g1_n")
+        graph.add_species_node("s1", "s1_n")
+        graph.add_species_node("s2", "s2_n")
+        graph.add_species_to_genus("s1", "g1")
+        first: SkosRelation = graph.add_synonym_relation("s2", "s1")
+        self.assertIs(first, graph.add_synonym_relation("s2", "s1"))
+        self.assertIs(first, graph.add_synonym_relation("s1", "s2"))
+        graph.add_relation(SkosRelation("g1", "skos:narrower", "s2"))
+
+        self.assertEqual([("s1", "skos:broader", "g1"), ("s2", "skos:related", "s1"), ("s2", "skos:broader", "g1")],
+                         [(x.start_descriptor, x.label, x.end_descriptor) for x in graph.relations])
+        self.assertEqual(["s1", "s2"], graph.get_end_descriptors("g1", "skos:narrower"))
+        self.assertEqual(["g1"], graph.get_start_descriptors("s2", "skos:narrower"))
+        self.assertEqual([("g1", "skos:narrower", "s1"), ("g1", "skos:narrower", "s2")],
+                         [(x.start_descriptor, x.label, x.end_descriptor)
+                          for x in graph.get_outgoing_relations_with_descriptor("g1")])
+        self.assertIn("skos:narrower example:s2", graph.to_rdf_skos_str())
+
+        # graphs pickled with the mirrored narrower relations
+        legacy: SkosGraph = pickle.loads(pickle.dumps(graph))
+        legacy.relations.append(SkosRelation("g1", "skos:narrower", "s1"))
+        self.assertEqual(3, len(pickle.loads(pickle.dumps(legacy)).relations))
+
+    def test_compact_node_attributes(self):
+        node: SkosNode = SkosNode("s1", "s1_n", [SkosAttribute("skos:definition", "Accepted"),
+                                                 SkosAttribute("skos:note", "extra")])
+        self.assertFalse(node.add_attribute("skos:prefLabel", "other"))
+        self.assertTrue(node.add_attribute("skos:historyNote", "wfo"))
+        self.assertEqual("wfo", node.get_literal_by_schema("skos:historyNote"))
+        self.assertEqual("extra", node.get_attribute_by_schema("skos:note").literal)
+        self.assertEqual(["skos:prefLabel", "skos:definition", "skos:historyNote", "skos:note"],
+                         [x["schema"] for x in node.to_dict()["attributes"]])
+        restored: SkosNode = pickle.loads(pickle.dumps(node))
+        self.assertEqual(node.to_dict(), restored.to_dict())
+
+    def test_bulk_manipulators(self):
+        expected: SkosGraph = SkosGraph()
+        expected.add_genus_node("g1", "g1_n")
+        expected.add_species_node("s1", "s1_n", [SkosAttribute("skos:definition", "Accepted"),
+                                                 SkosAttribute("skos:scopeNote", "L.")])
+        expected.add_species_node("s2", "s2_n", [SkosAttribute("skos:definition", "Synonym"),
+                                                 SkosAttribute("skos:scopeNote", "")])
+        expected.add_species_to_genus("s1", "g1")
+        expected.add_synonym_relation("s2", "s1")
+
+        graph: SkosGraph = SkosGraph()
+        self.assertEqual(1, graph.add_nodes_bulk(["g1"], ["g1_n"], "genus"))
+        self.assertEqual(2, graph.add_nodes_bulk(["s1", "s2"], ["s1_n", "s2_n"], "species",
+                                                 ["Accepted", "Synonym"], ["L.", ""]))
+        self.assertEqual(1, graph.add_edges_bulk(["s1"], ["g1"]))
+        self.assertEqual(1, graph.add_edges_bulk(["s2"], ["s1"], "skos:related"))
+
+        self.assertEqual([x.to_dict() for x in expected.nodes], [x.to_dict() for x in graph.nodes])
+        self.assertEqual([str(x) for x in expected.relations], [str(x) for x in graph.relations])
+        self.assertTrue(graph.is_parent_of("s1", "g1"))
+        self.assertEqual(["s2"], graph.get_start_descriptors("s1", "skos:related"))
+
+    def test_export_partial_slice(self):
+        graph: SkosGraph = SkosGraph()
+        i: int
+        for i in range(0, 5):
+            graph.add_species_node("s" + str(i), "Species" + str(i))
+        cwd: str = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory, patch.object(MultiThreadExport, "SLICE_SIZE", 2):
+            os.chdir(directory)
+            try:
+                MultiThreadExport.to_skos_export(graph, "example")
+                with open("out.ttl", encoding="utf-8") as f:
+                    out: str = f.read()
+            finally:
+                os.chdir(cwd)
+        # 5 nodes in slices of 2, the last slice holds a single node
+        self.assertEqual(["s" + str(x) for x in range(0, 5)],
+                         [x.split(" ")[0][len("example:"):] for x in out.split("\n") if "rdf:type skos:Concept;" in x])
+
+    def test_merge_graphs(self):
+        sources = []
+        name: str
+        for name in ["itis.graph", "tpl.graph", "wfo.graph", "col"]:
+            source: SkosGraph = SkosGraph(name)
+            source.add_genus_node(name + "_g", "Rosa")
+            source.add_species_node(name + "_s", "Rosa canina")
+            source.add_species_to_genus(name + "_s", name + "_g")
+            sources.append(source)
+        sources[0].add_species_node("itis_s2", "Rosa canina")
+        sources[2].add_species_node("wfo_only", "Rosa gallica")
+        sources[3].add_species_node("col_s2", "ROSA  GALLICA L.")
+
+        graph: SkosGraph = merge_graphs(sources)
+
+        self.assertEqual(sum(len(x.nodes) for x in sources), len(graph.nodes))
+        self.assertEqual(["itis", "tpl", "wfo", "col"], [x.get_literal_by_schema("skos:historyNote")
+                                                        for x in graph.nodes if x.descriptor.endswith("_g")])
+        synonyms = {(x.start_descriptor, x.end_descriptor) for x in graph.relations if x.label == "skos:related"}
+        # 6 pairs of the 4 genera, 6 pairs of the species of one node per source and 3 more of the second itis species
+        self.assertIn(("col_g", "itis.graph_g"), synonyms)
+        self.assertIn(("wfo.graph_s", "itis_s2"), synonyms)
+        self.assertNotIn(("itis_s2", "itis.graph_s"), synonyms)
+        self.assertEqual(16, len(synonyms))
+        # matched by the normalized name
+        self.assertIn(("col_s2", "wfo_only"), synonyms)
+        self.assertEqual(16 + sum(len(x.relations) for x in sources), len(graph.relations))
+
+    def test_merge_graphs_order(self):
+        sources = []
+        name: str
+        for name in ["itis", "tpl", "wfo"]:
+            source: SkosGraph = SkosGraph(name)
+            source.add_genus_node(name + "_g", "Rosa")
+            source.add_species_node(name + "_s", "Rosa canina")
+            source.add_species_to_genus(name + "_s", name + "_g")
+            sources.append(source)
+
+        graph: SkosGraph = merge_graphs(sources)
+
+        # nodes and relations in the order of the sources, the synonym relations of a source ahead of its own
+        self.assertEqual(["itis_g", "itis_s", "tpl_g", "tpl_s", "wfo_g", "wfo_s"], [x.descriptor for x in graph.nodes])
+        self.assertEqual([("itis_s", "skos:broader", "itis_g"),
+                          ("tpl_g", "skos:related", "itis_g"), ("tpl_s", "skos:related", "itis_s"),
+                          ("tpl_s", "skos:broader", "tpl_g"),
+                          ("wfo_g", "skos:related", "itis_g"), ("wfo_g", "skos:related", "tpl_g"),
+                          ("wfo_s", "skos:related", "itis_s"), ("wfo_s", "skos:related", "tpl_s"),
+                          ("wfo_s", "skos:broader", "wfo_g")],
+                         [(x.start_descriptor, x.label, x.end_descriptor) for x in graph.relations])
+
+    def test_merge_graph_files(self):
+        sources = []
+        name: str
+        for name in ["itis", "tpl", "wfo"]:
+            source: SkosGraph = SkosGraph(name)
+            source.add_genus_node(name + "_g", "Rosa")
+            source.add_species_node(name + "_s", "Rosa canina L.")
+            source.add_species_to_genus(name + "_s", name + "_g")
+            sources.append(source)
+        sources[1].nodes[0].add_attribute("dc:source", "tpl 1.1")
+        sources[2].add_synonym_relation("wfo_s", "unknown")
+        # the same pair as the synonym relation of the merge, which is kept instead
+        sources[1].add_synonym_relation("itis_s", "tpl_s")
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, x.name + ".graph") for x in sources]
+            for source, path in zip(sources, paths):
+                save_graph_to_file(source, path)
+            store: MergeStore = merge_graph_files(paths, os.path.join(directory, "generated.graph"),
+                                                  memory_budget_mib=1)
+            merged: FrozenSkosGraph = read_graph_file(os.path.join(directory, "generated.graph"))
+            self.assertEqual(["generated.graph"] + [os.path.basename(x) for x in paths],
+                             sorted(os.listdir(directory)))
+        expected: FrozenSkosGraph = FrozenSkosGraph.from_skos_graph(merge_graphs(sources))
+
+        self.assertEqual(6, store.synonym_count)
+        self.assertEqual(expected.descriptors.to_list(), merged.descriptors.to_list())
+        self.assertEqual([x.__getstate__()[:6] + (x.get_name_key(),) for x in expected.nodes],
+                         [x.__getstate__()[:6] + (x.get_name_key(),) for x in merged.nodes])
+        self.assertEqual([(x.start_descriptor, x.label, x.end_descriptor) for x in expected.relations],
+                         [(x.start_descriptor, x.label, x.end_descriptor) for x in merged.relations])
+        self.assertEqual("tpl 1.1", merged.get_node_by_descriptor("tpl_g").get_literal_by_schema("dc:source"))
+
+    def test_merge_graph_files_incremental(self):
+        def get_relations(graph) -> list:
+            return [(x.start_descriptor, x.label, x.end_descriptor) for x in graph.relations]
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            name: str
+            for name in ["itis", "tpl", "wfo"]:
+                source: SkosGraph = SkosGraph(name)
+                source.add_genus_node(name + "_g", "Rosa")
+                source.add_species_node(name + "_s", "Rosa canina L.")
+                source.add_species_to_genus(name + "_s", name + "_g")
+                paths.append(os.path.join(directory, name + ".graph"))
+                save_graph_to_file(source, paths[-1])
+            target: str = os.path.join(directory, "generated.graph")
+
+            self.assertEqual(["itis", "tpl", "wfo"], merge_graph_files_incremental(paths, target))
+            expected: SkosGraph = merge_graphs([load_graph_from_file(x) for x in paths], ["itis", "tpl", "wfo"])
+            self.assertEqual(get_relations(expected), get_relations(read_graph_file(target)))
+
+            wfo: SkosGraph = load_graph_from_file(paths[2])
+            wfo.add_species_node("wfo_s2", "Rosa gallica")
+            wfo.add_species_to_genus("wfo_s2", "wfo_g")
+            wfo.add_synonym_relation("wfo_s2", "itis_s")
+            save_graph_to_file(wfo, paths[2])
+            self.assertEqual(["wfo"], merge_graph_files_incremental(paths, target))
+            merged: FrozenSkosGraph = read_graph_file(target)
+            expected = merge_graphs([load_graph_from_file(x) for x in paths], ["itis", "tpl", "wfo"])
+            self.assertEqual(get_relations(expected), get_relations(merged))
+            self.assertEqual([x.descriptor for x in expected.nodes], [x.descriptor for x in merged.nodes])
+            self.assertEqual("wfo", merged.get_node_by_descriptor("wfo_s2").get_literal_by_schema(SCHEMA_HISTORY_NOTE))
+
+            self.assertEqual([], merge_graph_files_incremental(paths, target))
+            tpl: SkosGraph = load_graph_from_file(paths[1])
+            tpl.add_species_node("tpl_s2", "Rosa gallica")
+            save_graph_to_file(tpl, paths[1])
+            # the synonym relations of the later partitions point to the nodes of the changed source
+            self.assertEqual(["tpl", "wfo"], merge_graph_files_incremental(paths, target))
+            self.assertIn(("wfo_s2", "skos:related", "tpl_s2"), get_relations(read_graph_file(target)))
+
     def test_hierarchy_graph(self):
 
         self.graph = load_graph_from_file("../application/generated.graph")